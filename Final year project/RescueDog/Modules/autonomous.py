@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import time
 from pidog import Pidog
-from modules.slam import update_obstacle, print_map
+from modules.slam import update_sweep, set_robot_pose, print_map
 
 dog = Pidog()
 dog.do_action('stand', speed=80)
@@ -10,20 +10,26 @@ time.sleep(0.5)
 
 DANGER_DISTANCE = 15
 
+WAIT_DONE_TIMEOUT = 5  # seconds
+
 stand = dog.legs_angle_calculation([[0, 80], [0, 80], [30, 75], [30, 75]])
 
+# completion handle of the last queued walking steps
+walk_handle = None
+
 def scan_with_ultrasonic():
     """Performs a head sweep and updates the SLAM map."""
-    for angle in range(-90, 91, 15):
-        dog.head_move([[angle, 0, 0]], immediately=True, speed=50)
-        time.sleep(0.2)
-        distance = round(dog.ultrasonic_read_distance(), 2)
-        if 5 < distance < 300:
-            update_obstacle(angle, distance)
+    # the head turns without stopping, every reading at the head yaw of its timestamp
+    angles, distances = dog.head_sweep()
     dog.head_move([[0, 0, 0]], immediately=True)
+    # where the legs and the gyro say the dog is, not the start cell
+    set_robot_pose(*dog.odometry.pose())
+    # readings beyond 300 cm still clear the cells up to there
+    update_sweep(angles, distances, max_range=300)
 
 def patrol():
-    distance = round(dog.ultrasonic_read_distance(), 2)
+    global walk_handle
+    distance = round(dog.read_distance(), 2)
     print(f"distance: {distance} cm", end="", flush=True)
 
     if distance < DANGER_DISTANCE:
@@ -32,22 +38,26 @@ def patrol():
         dog.rgb_strip.set_mode('bark', 'red', bps=2)
         dog.tail_move([[0]], speed=80)
         dog.legs_move([stand], speed=70)
-        dog.wait_all_done()
+        dog.wait_all_done(timeout=WAIT_DONE_TIMEOUT)
+        walk_handle = None
         time.sleep(0.5)
 
         scan_with_ultrasonic()
         print_map()
 
-        while distance < DANGER_DISTANCE:
-            distance = round(dog.ultrasonic_read_distance(), 2)
-            print(f"distance: {distance} cm \033[0;31m DANGER !\033[m" if distance < DANGER_DISTANCE else f"distance: {distance} cm", end="", flush=True)
-            time.sleep(0.01)
+        # block until the way is clear instead of polling the distance
+        clear = dog.watch_distance(DANGER_DISTANCE, below=False)
+        clear.wait()
+        dog.unwatch_distance(clear)
+        print(f"distance: {dog.read_distance()} cm", end="", flush=True)
 
     else:
         print("")
         dog.rgb_strip.set_mode('breath', 'white', bps=0.5)
-        dog.do_action('forward', step_count=2, speed=95)
-        dog.do_action('shake_head', step_count=1, speed=80)
+        # only queue new steps once the previous ones are done, instead of piling up frames
+        if walk_handle is None or walk_handle.done():
+            walk_handle = dog.do_action('forward', step_count=2, speed=95)
+            dog.do_action('shake_head', step_count=1, speed=80)
 
 def start_autonomous_mode():
     try:
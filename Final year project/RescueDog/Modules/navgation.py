@@ -1,28 +1,45 @@
 import time
 import math
 from queue import PriorityQueue
-from pidog import Pidog
-from modules.pidog_control import do_function
+from pidog.occupancy_grid import TiledOccupancyGrid
+from modules.pidog_control import do_function, dog
 
 # SLAM and Grid Setup
 GRID_SIZE = 41
 GRID_CENTER = GRID_SIZE // 2
-grid_map = [['.' for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-robot_pos = [GRID_CENTER, GRID_CENTER]
-robot_facing = 0  # Degrees, 0 = facing forward (Y−)
+CELLS_PER_METRE = 5
+# unbounded, readings outside the GRID_SIZE window are kept
+grid = TiledOccupancyGrid(resolution=CELLS_PER_METRE)
+MAP_WINDOW = (0, 0, GRID_SIZE, GRID_SIZE)  # the cells /slam_map shows
+# from dog.odometry, see update_pose()
+robot_pos = [GRID_CENTER, GRID_CENTER]  # cells, floats
+robot_facing = 0  # Degrees counterclockwise, 0 = the start heading, along +x
+
+# Path following
+ARRIVED = 0.5  # cells, a target closer than this is reached
+HEADING_TOLERANCE = 20  # degrees, turn first when the target is further off
+MAX_MOVES = 20  # gait cycles to reach one cell
+
+# Pose
+def update_pose():
+    """Takes the odometry pose, cm from the start with x forward and y left, into the map: cells, y down."""
+    global robot_pos, robot_facing
+    x, y, theta = dog.odometry.pose()
+    robot_pos = [GRID_CENTER + x * CELLS_PER_METRE / 100, GRID_CENTER - y * CELLS_PER_METRE / 100]
+    robot_facing = theta
+
+def robot_cell():
+    return (int(round(robot_pos[0])), int(round(robot_pos[1])))
 
 # Obstacle Mapping
 def update_obstacle(angle_deg, distance_cm):
-    angle_rad = math.radians(angle_deg + robot_facing)
-    distance_m = distance_cm / 100.0
-    x_offset = distance_m * math.cos(angle_rad)
-    y_offset = -distance_m * math.sin(angle_rad)
+    update_sweep([angle_deg], [distance_cm])
 
-    gx = int(robot_pos[0] + x_offset * 5)
-    gy = int(robot_pos[1] + y_offset * 5)
-
-    if 0 <= gx < GRID_SIZE and 0 <= gy < GRID_SIZE:
-        grid_map[gy][gx] = '#'
+def update_sweep(angles_deg, distances_cm, max_range=250):
+    # one log-odds batch for the whole sweep, beams ray cast from the robot pose
+    update_pose()
+    angles = [angle + robot_facing for angle in angles_deg]
+    grid.update(robot_pos, angles, distances_cm, max_range=max_range)
 
 # A* Pathfinding
 def neighbors(pos):
@@ -31,7 +48,7 @@ def neighbors(pos):
     result = []
     for dx, dy in directions:
         nx, ny = x+dx, y+dy
-        if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE and grid_map[ny][nx] != '#':
+        if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE and not grid.is_occupied(nx, ny):
             result.append((nx, ny))
     return result
 
@@ -66,44 +83,51 @@ def a_star(start, goal):
 
 # Movement + SLAM scan
 def scan_with_ultrasonic(dog):
-    for angle in range(-90, 91, 15):
-        dog.head_move([[angle, 0, 0]], immediately=True, speed=50)
-        time.sleep(0.2)
-        dist = round(dog.ultrasonic.read_distance(), 2)
-        if 3 < dist < 250:
-            update_obstacle(angle, dist)
+    # continuous head sweep, every reading at the head yaw of its timestamp
+    angles, distances = dog.head_sweep()
     dog.head_move([[0, 0, 0]], immediately=True)
+    update_sweep(angles, distances)
 
 def move_to(target):
-    global robot_pos
-    dx = target[0] - robot_pos[0]
-    dy = target[1] - robot_pos[1]
-    if dx == 1:
-        do_function("right")
-    elif dx == -1:
-        do_function("left")
-    elif dy == 1:
-        do_function("backward")
-    elif dy == -1:
-        do_function("forward")
-    robot_pos = list(target)
+    """Walks to a target cell, turning towards it first, one gait cycle at a
+    time with the odometry pose as feedback. False if not reached."""
+    for _ in range(MAX_MOVES):
+        update_pose()
+        dx = target[0] - robot_pos[0]
+        dy = target[1] - robot_pos[1]
+        if math.hypot(dx, dy) < ARRIVED:
+            return True
+        bearing = math.degrees(math.atan2(-dy, dx))  # the map y points down
+        error = (bearing - robot_facing + 180) % 360 - 180
+        if error > HEADING_TOLERANCE:
+            do_function("left")
+        elif error < -HEADING_TOLERANCE:
+            do_function("right")
+        else:
+            do_function("forward")
+        dog.wait_legs_done()
+    update_pose()
+    return False
 
 # Autonomous Logic
 latest_path = []
 def start_autonomous_mode():
     global latest_path
-    dog = Pidog()
+    # the dog pidog_control walks, its odometry is the robot pose
+    update_pose()
     scan_with_ultrasonic(dog)
 
-    goal = [robot_pos[0] + 5, robot_pos[1]]  # Move 5 cells forward
-    path = a_star(tuple(robot_pos), tuple(goal))
+    start = robot_cell()
+    goal = (start[0] + 5, start[1])  # Move 5 cells forward
+    path = a_star(start, goal)
 
     if not path:
         return {"status": "error", "message": "Path not found"}
 
     latest_path = path
     for step in path[1:]:
-        move_to(step)
+        if not move_to(step):
+            return {"status": "error", "message": f"Could not reach {step}"}
         scan_with_ultrasonic(dog)
         time.sleep(0.5)
 
@@ -112,6 +136,6 @@ def start_autonomous_mode():
 def latest_path_data():
     return {
         "path": latest_path,
-        "robot": tuple(robot_pos),
-        "map": ["".join(row) for row in grid_map]
+        "robot": robot_cell(),
+        "map": grid.render(MAP_WINDOW)
     }
@@ -1,30 +1,39 @@
 # modules/slam.py
+from pidog.occupancy_grid import TiledOccupancyGrid
 
 GRID_SIZE = 41
 GRID_CENTER = GRID_SIZE // 2
-grid_map = [['.' for _ in range(GRID_SIZE)] for _ in range(GRID_SIZE)]
-robot_pos = [GRID_CENTER, GRID_CENTER]
+CELLS_PER_METRE = 5
+# unbounded, readings outside the GRID_SIZE window are kept
+grid = TiledOccupancyGrid(resolution=CELLS_PER_METRE)
+MAP_WINDOW = (0, 0, GRID_SIZE, GRID_SIZE)  # the cells /slam_map shows
+robot_pos = [GRID_CENTER, GRID_CENTER]  # cells, floats
+robot_facing = 0  # degrees counterclockwise, 0 = the start heading, along +x
 
-def update_obstacle(angle_deg, distance_cm):
-    import math
-    angle_rad = math.radians(angle_deg)
-    distance_m = distance_cm / 100.0
-    x_offset = distance_m * math.cos(angle_rad)
-    y_offset = -distance_m * math.sin(angle_rad)
+def set_robot_pose(x_cm, y_cm, theta):
+    """Places the robot from an odometry pose (Pidog.odometry.pose()): cm
+    from the start with x forward and y left, into the map: cells, y down."""
+    global robot_facing
+    robot_pos[0] = GRID_CENTER + x_cm * CELLS_PER_METRE / 100
+    robot_pos[1] = GRID_CENTER - y_cm * CELLS_PER_METRE / 100
+    robot_facing = theta
 
-    gx = int(robot_pos[0] + x_offset * 5)
-    gy = int(robot_pos[1] + y_offset * 5)
+def update_obstacle(angle_deg, distance_cm, max_range=TiledOccupancyGrid.MAX_RANGE):
+    update_sweep([angle_deg], [distance_cm], max_range)
 
-    if 0 <= gx < GRID_SIZE and 0 <= gy < GRID_SIZE:
-        grid_map[gy][gx] = '#'
+def update_sweep(angles_deg, distances_cm, max_range=TiledOccupancyGrid.MAX_RANGE):
+    """Adds a whole head sweep to the map in one batch: hits mark their cell,
+    the cells each beam crossed are cleared."""
+    angles = [angle + robot_facing for angle in angles_deg]
+    grid.update(robot_pos, angles, distances_cm, max_range=max_range)
 
 def get_latest_map():
     return {
-        "map": ["".join(row) for row in grid_map],
-        "robot": tuple(robot_pos)
+        "map": grid.render(MAP_WINDOW),
+        "robot": tuple(int(round(v)) for v in robot_pos)
     }
 
 # ✅ ADD THIS FUNCTION TO FIX THE ERROR
 def print_map():
-    print("\n".join("".join(row) for row in grid_map))
+    print("\n".join(grid.render(MAP_WINDOW)))
     print("\n" + "=" * GRID_SIZE)
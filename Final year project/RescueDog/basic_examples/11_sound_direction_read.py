@@ -8,6 +8,13 @@ API:
     Pidog.ears.read()
         return    int, the azimuth of the identified sound, 0 ~ 359
 
+    Pidog reads every detection in the background, isdetected() and read()
+    take them from a queue, none is missed while the program is busy
+
+    Pidog.ears.get(timeout=None)
+        return    (timestamp, azimuth, bearing), the next detection, None on timeout,
+                  bearing: map frame direction of the sound, degrees counterclockwise
+
 more to see: ../pidog/sound_direction.py
 
 '''
@@ -9,6 +9,15 @@ API:
             - 'LS' left slide
             - 'R'  right touched
             - 'RS' right slide
+
+    Pidog.dual_touch.get(timeout=None)
+        - wait for the next gesture, return (gesture, timestamp), None on timeout
+        - gestures are queued on the pin interrupts, none is missed between gets:
+            'L', 'R', 'LS', 'RS',
+            'L_DOUBLE', 'R_DOUBLE'  double touch
+            'L_LONG', 'R_LONG'  long press, at release
+    Pidog.dual_touch.subscribe(callback)
+        - call callback(gesture, timestamp) on every gesture
 '''
 
 from pidog import Pidog
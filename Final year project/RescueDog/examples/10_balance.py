@@ -55,6 +55,8 @@ def main():
     my_dog.do_action('stand', speed=80)
     my_dog.wait_legs_done()
     # sleep(1)
+    # the balance controller runs at imu rate, set_rpy(pid=True) applies its corrections
+    my_dog.balance_start()
     t.start()
 
     while True:
@@ -30,11 +30,13 @@ def head_nod(step):
 def alert():
     my_dog.do_action('stand', step_count=1, speed=70)
     my_dog.rgb_strip.set_mode('breath', color='pink', bps=1, brightness=0.8)
+    # set while something is closer than 15 cm
+    too_close = my_dog.watch_distance(15)
     while True:
         print(
             f'distance.value: {round(my_dog.read_distance(), 2)} cm, touch {my_dog.dual_touch.read()}')
         # alert
-        if my_dog.read_distance() < 15 and my_dog.read_distance() > 1:
+        if too_close.wait(0):
             my_dog.head_move([[0, 0, 0]], immediately=True, speed=90)
             my_dog.tail_move([[0]], immediately=True, speed=80)
             my_dog.rgb_strip.set_mode('bark', color='red', bps=2, brightness=0.8)
@@ -55,7 +57,8 @@ def alert():
         else:
             my_dog.rgb_strip.set_mode('breath', color='pink', bps=1, brightness=0.8)
             my_dog.tail_stop()
-        sleep(0.2)
+        # wake up at once if something comes close
+        too_close.wait(0.2)
 
 if __name__ == "__main__":
     try:
@@ -28,11 +28,16 @@ def be_picked_up():
     stand()
 
     while True:
-        ax = my_dog.accData[0]
-        print('ax: %s, is up: %s' % (ax, isUp))
+        # every imu sample of the last 50 ms, short peaks are not missed between polls
+        samples = my_dog.imu_history.window(0.05)
+        if len(samples) == 0:
+            sleep(0.02)
+            continue
+        ax = my_dog.imu_history.column(samples, 'ax')
+        print('ax: %s, is up: %s' % (ax[-1], isUp))
 
         # gravity : 1G = -16384
-        if ax < -18000: # if down, acceleration is in the same direction as gravity, ax < -1G
+        if ax.min() < -18000: # if down, acceleration is in the same direction as gravity, ax < -1G
             my_dog.body_stop()
             if upflag == False:
                 upflag = True
@@ -41,7 +46,7 @@ def be_picked_up():
                 downflag = False
                 stand()
 
-        if ax > -13000: # if up, acceleration is the opposite of gravity, ax will > -1G
+        if ax.max() > -13000: # if up, acceleration is the opposite of gravity, ax will > -1G
             my_dog.body_stop()
             if upflag == True:
                 isUp = True
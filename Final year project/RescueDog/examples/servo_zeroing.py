@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
-from robot_hat import Servo
-from robot_hat.utils import reset_mcu
+from pidog.backend import Servo, utils
 from time import sleep
 
-reset_mcu()
+utils.reset_mcu()
 sleep(1)
 
 if __name__ == '__main__':
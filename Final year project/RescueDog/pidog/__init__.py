@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from .pidog import Pidog
-from robot_hat import utils
+from .backend import utils
 from time import sleep
 from .version import __version__
 
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+import threading
+from collections import deque
+from math import cos, pi
+
+
+def crossfade(old_frames, new_frames, count):
+    """
+    Blend the start of new_frames with old_frames over count frames, with a
+    raised cosine weight going from old to new. The shorter list is padded
+    with its last frame.
+
+    :param old_frames: frames of the trajectory being replaced, at least one
+    :param new_frames: frames of the new trajectory, at least one
+    :param count: number of blended frames
+    :return: blended frames followed by the rest of new_frames
+    :rtype: list
+    """
+    frames = []
+    for i in range(count):
+        old = old_frames[min(i, len(old_frames) - 1)]
+        new = new_frames[min(i, len(new_frames) - 1)]
+        if i == count - 1:
+            # the last blended frame is exactly on the new trajectory
+            frames.append(list(new))
+            break
+        w = (1 - cos(pi * (i + 1) / count)) / 2
+        frames.append([o + (n - o) * w for o, n in zip(old, new)])
+    return frames + list(new_frames[count:])
+
+
+class ActionHandle():
+    """
+    Completion handle of one batch of frames pushed into an ActionBuffer
+    """
+
+    def __init__(self, end_seq):
+        self.end_seq = end_seq
+        self.cancelled = False
+        self._event = threading.Event()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Block until every frame of this batch has been consumed (or cleared)
+
+        :param timeout: seconds to wait, None to wait forever
+        :type timeout: float or None
+        :return: True if done, False on timeout
+        :rtype: bool
+        """
+        return self._event.wait(timeout)
+
+    def _finish(self, cancelled=False):
+        self.cancelled = cancelled
+        self._event.set()
+
+
+class ActionBuffer():
+    """
+    Ring buffer of servo frames shared by one producer side (legs_move,
+    head_move, ...) and one consumer thread.
+
+    The consumer blocks on a condition variable instead of polling, and
+    waiters are woken as soon as the buffer drains. Like the list it
+    replaces, it has no size limit: a push beyond capacity doubles it,
+    the producer never blocks.
+    """
+
+    DEFAULT_CAPACITY = 1024  # initial frames, grows as needed
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = max(1, int(capacity))
+        self._data = [None] * self.capacity
+        self._head = 0
+        self._count = 0
+        self._pushed = 0  # sequence number of frames ever pushed
+        self._consumed = 0  # sequence number of frames ever consumed
+        self._generation = 0  # increased by clear()
+        self.dropped = 0  # frames discarded unplayed by clear() and replace()
+        self._peek_generation = -1
+        self._handles = deque()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    def __len__(self):
+        return self._count
+
+    def __iadd__(self, frames):
+        self.push(frames)
+        return self
+
+    # producer side
+    # =================================================================
+    def push(self, frames):
+        """
+        Append frames, without blocking, the buffer grows if needed
+
+        :param frames: list of frames, eg: [[angle, angle, ...], ...]
+        :type frames: list
+        :return: completion handle of the pushed frames
+        :rtype: ActionHandle
+        """
+        with self._cond:
+            self._reserve_locked(len(frames))
+            for frame in frames:
+                self._append_locked(frame)
+            return self._handle_locked()
+
+    def replace(self, make_frames):
+        """
+        Atomically swap the pending frames for new ones, without waiting for
+        the consumer. Pending handles are finished as cancelled.
+
+        :param make_frames: callable(pending_frames) returning the new frames
+        :type make_frames: callable
+        :return: completion handle of the new frames
+        :rtype: ActionHandle
+        """
+        with self._cond:
+            frames = make_frames(self._frames_locked())
+            self._clear_locked()
+            self._reserve_locked(len(frames))
+            for frame in frames:
+                self._append_locked(frame)
+            return self._handle_locked()
+
+    def frames(self):
+        """
+        Copy of the pending frames, oldest first
+        """
+        with self._cond:
+            return self._frames_locked()
+
+    def _frames_locked(self):
+        return [self._data[(self._head + i) % self.capacity] for i in range(self._count)]
+
+    def _reserve_locked(self, count):
+        # double the ring until count more frames fit, oldest frame first again
+        capacity = self.capacity
+        while self._count + count > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self._data = self._frames_locked() + [None] * (capacity - self._count)
+            self._head = 0
+            self.capacity = capacity
+
+    def _append_locked(self, frame):
+        tail = (self._head + self._count) % self.capacity
+        self._data[tail] = frame
+        self._count += 1
+        self._pushed += 1
+        self._cond.notify_all()
+        for event in self._listeners:
+            event.set()
+
+    def _handle_locked(self):
+        handle = ActionHandle(self._pushed)
+        if self._consumed >= handle.end_seq:
+            handle._finish()
+        else:
+            self._handles.append(handle)
+        return handle
+
+    def add_listener(self, event):
+        """
+        Set a threading.Event whenever frames are pushed, so that one
+        consumer can block on several buffers at once
+        """
+        self._listeners.append(event)
+
+    def clear(self):
+        """
+        Drop every pending frame, pending handles are finished as cancelled
+        """
+        with self._cond:
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self.dropped += self._count
+        for i in range(self._count):
+            self._data[(self._head + i) % self.capacity] = None
+        self._head = 0
+        self._count = 0
+        self._consumed = self._pushed
+        self._generation += 1
+        while self._handles:
+            self._handles.popleft()._finish(cancelled=True)
+        self._cond.notify_all()
+
+    # consumer side
+    # =================================================================
+    def peek(self, timeout=None):
+        """
+        Return the oldest frame without removing it, blocking while empty
+
+        :return: frame, or None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._count > 0, timeout):
+                return None
+            self._peek_generation = self._generation
+            return self._data[self._head]
+
+    def pop(self):
+        """
+        Remove the frame returned by the last peek(). Does nothing if the
+        buffer was cleared in between.
+        """
+        with self._cond:
+            if self._peek_generation != self._generation or self._count == 0:
+                return
+            self._pop_locked()
+
+    def get(self, timeout=None):
+        """
+        Remove and return the oldest frame, blocking while empty
+
+        :return: frame, or None on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._count > 0, timeout):
+                return None
+            return self._pop_locked()
+
+    def _pop_locked(self):
+        frame = self._data[self._head]
+        self._data[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._count -= 1
+        self._consumed += 1
+        while self._handles and self._handles[0].end_seq <= self._consumed:
+            self._handles.popleft()._finish()
+        self._cond.notify_all()
+        return frame
+
+    # waiters
+    # =================================================================
+    def wait_empty(self, timeout=None):
+        """
+        Block until the buffer is drained
+
+        :return: True if empty, False on timeout
+        :rtype: bool
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._count == 0, timeout)
+
+    def is_empty(self):
+        return self._count == 0
+
+    @property
+    def generation(self):
+        # changes on every clear(), consumers use it to drop an in-flight frame
+        return self._generation
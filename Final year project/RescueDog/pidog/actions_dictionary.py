@@ -1,28 +1,101 @@
 #!/usr/bin/env python3
+import os
+import numpy as np
 from .pidog import Pidog
 from .walk import Walk
 from .trot import Trot
+from .version import __version__
 from math import sin
 
 # ActionDict: - > angles_dict
 class ActionDict(dict):
+    """
+    Preset actions, action_dict[name] -> (frames, part)
+
+    Results are cached by (name, height, barycenter), so that an action is
+    only calculated once. The cached frames are shared, do not modify them.
+    """
 
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
         super().__init__()
         self.barycenter = -15
         self.height = 95
+        self._cache = {}
 
     def __getitem__(self, item):
-        return eval("self.%s" % item.replace(" ", "_"))
+        name = item.replace(" ", "_")
+        key = (name, self.height, self.barycenter)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        if name not in self.names():
+            raise KeyError(item)
+        value = getattr(self, name)
+        self._cache[key] = value
+        return value
+
+    @classmethod
+    def names(cls):
+        """
+        Names of all preset actions
+        """
+        if not hasattr(cls, '_names'):
+            cls._names = tuple(name for name, value in vars(cls).items() if isinstance(value, property))
+        return cls._names
 
     def set_height(self, height):
-        if height in range(20, 95):
+        if height in range(20, 95) and height != self.height:
             self.height = height
+            self._cache.clear()
 
     def set_barycenter(self, offset):
-        if offset in range(-60, 60):
+        if offset in range(-60, 60) and offset != self.barycenter:
             self.barycenter = offset
+            self._cache.clear()
+
+    # precompiled table
+    # =================================================================
+    def save(self, path):
+        """
+        Calculate every action and save them to a .npz table, for load()
+
+        :param path: file path, eg: ~/.config/pidog/actions_table.npz
+        :type path: str
+        """
+        table = {}
+        parts = []
+        for name in self.names():
+            frames, part = self[name]
+            table[name] = np.array(frames, dtype=float)
+            parts.append(part)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez(f,
+                     __names__=np.array(self.names()),
+                     __parts__=np.array(parts),
+                     __key__=np.array([__version__, str(self.height), str(self.barycenter)]),
+                     **table)
+
+    def load(self, path):
+        """
+        Load a table saved by save() into the cache. The table is ignored if it
+        was made by another pidog version or for another height / barycenter.
+
+        :return: True if loaded
+        :rtype: bool
+        """
+        if not os.path.isfile(path):
+            return False
+        with np.load(path) as data:
+            key = data['__key__'].tolist()
+            if key != [__version__, str(self.height), str(self.barycenter)]:
+                return False
+            for name, part in zip(data['__names__'].tolist(), data['__parts__'].tolist()):
+                if name in self.names():
+                    self._cache[(name, self.height, self.barycenter)] = (data[name].tolist(), part)
+        return True
 
     # 站 stand
     @property
@@ -58,51 +131,41 @@ class ActionDict(dict):
     # forward
     @property
     def forward(self):
-        data = []
         forward = Walk(fb=Walk.FORWARD, lr=Walk.STRAIGHT)
         coords = forward.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
+        data = Pidog.legs_angle_calculation_batch(coords).tolist()
         return data, 'legs'
 
     # backward
     @property
     def backward(self):
-        data = []
         backward = Walk(fb=Walk.BACKWARD, lr=Walk.STRAIGHT)
         coords = backward.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
+        data = Pidog.legs_angle_calculation_batch(coords).tolist()
         return data, 'legs'
 
     # turn_left
     @property
     def turn_left(self):
-        data = []
         turn_left = Walk(fb=Walk.FORWARD, lr=Walk.LEFT)
         coords = turn_left.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
+        data = Pidog.legs_angle_calculation_batch(coords).tolist()
         return data, 'legs'
 
     # turn_right
     @property
     def turn_right(self):
-        data = []
         turn_right = Walk(fb=Walk.FORWARD, lr=Walk.RIGHT)
         coords = turn_right.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
+        data = Pidog.legs_angle_calculation_batch(coords).tolist()
         return data, 'legs'
 
     # 小跑 trot
     @property
     def trot(self):
-        data = []
         trot = Trot(Trot.FORWARD, Trot.STRAIGHT)
         coords = trot.get_coords()
-        for coord in coords:
-            data.append(Pidog.legs_angle_calculation(coord))
+        data = Pidog.legs_angle_calculation_batch(coords).tolist()
         return data, 'legs'
 
     # 伸懒腰 stretch
@@ -254,3 +317,11 @@ class ActionDict(dict):
         return [
             [25, 25, -25, -25, 64, -45, -64, 45],
         ], 'legs'
+
+if __name__ == '__main__':
+    # precompile the actions table: python3 -m pidog.actions_dictionary [path]
+    import sys
+    from .pidog import actions_table_file
+    path = sys.argv[1] if len(sys.argv) > 1 else actions_table_file
+    ActionDict().save(path)
+    print(f"actions table saved to {path}")
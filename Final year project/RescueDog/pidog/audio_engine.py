@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+'''
+Low latency sound effects: every file of the sounds folder is decoded
+once into a PCM buffer, and one mixer output stream stays open with a
+small buffer. Overlapping sounds are mixed on separate channels.
+
+    audio = AudioEngine(Pidog.SOUND_DIR)
+    audio.play('single_bark_1', volume=80)  # returns at once
+    audio.play_block('howling')
+'''
+import os
+import threading
+from time import sleep
+from .console import warn
+
+SOUND_EXTENSIONS = ('.wav', '.mp3', '.ogg')
+
+
+class AudioEngine():
+    """
+    :param sound_dir: folder preloaded at start, None for none
+    :type sound_dir: str
+    :param frequency: output sample rate, Hz
+    :param buffer: output buffer in frames, output latency is buffer / frequency
+    :param channels: number of sounds that can play at once
+    :param preload: decode sound_dir in a background thread
+    :type preload: bool
+    """
+
+    FREQUENCY = 44100  # Hz
+    BUFFER = 256  # frames, 5.8 ms at 44.1 kHz
+    CHANNELS = 16
+
+    def __init__(self, sound_dir=None, frequency=FREQUENCY, buffer=BUFFER, channels=CHANNELS, preload=True):
+        try:
+            os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+            import pygame
+        except ImportError:
+            raise ImportError('AudioEngine needs pygame, install with: pip3 install pygame')
+        self.pygame = pygame
+        self.sound_dir = sound_dir
+        self.frequency = frequency
+        self.buffer = buffer
+        self.sounds = {}  # name or path: pygame.mixer.Sound
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+
+        mixer = pygame.mixer
+        if mixer.get_init() is not None and mixer.get_init()[0] != frequency:
+            # opened elsewhere (eg: robot_hat Music) with other settings
+            mixer.quit()
+        if mixer.get_init() is None:
+            mixer.pre_init(frequency=frequency, size=-16, channels=2, buffer=buffer)
+            mixer.init()
+        mixer.set_num_channels(channels)
+
+        if sound_dir is not None and preload:
+            thread = threading.Thread(name='audio_preload_thread', target=self.preload, args=(sound_dir,))
+            thread.daemon = True
+            thread.start()
+        else:
+            self._loaded.set()
+
+    def output_latency(self):
+        """
+        Latency added by the output buffer, seconds
+        """
+        return self.buffer / self.frequency
+
+    def preload(self, sound_dir):
+        """
+        Decode every sound of sound_dir, keyed by file name without extension.
+        A missing folder or a file that does not decode is reported and skipped.
+        """
+        try:
+            try:
+                files = sorted(os.listdir(sound_dir))
+            except OSError as e:
+                warn(f"audio_engine: no sounds preloaded: {e}")
+                return
+            for file in files:
+                name, ext = os.path.splitext(file)
+                if ext.lower() in SOUND_EXTENSIONS and name not in self.sounds:
+                    try:
+                        self._decode(name, os.path.join(sound_dir, file))
+                    except (self.pygame.error, OSError) as e:
+                        warn(f"audio_engine: {file} skipped: {e}")
+        finally:
+            self._loaded.set()
+
+    def wait_loaded(self, timeout=None):
+        return self._loaded.wait(timeout)
+
+    def _decode(self, key, path):
+        sound = self.pygame.mixer.Sound(path)
+        with self._lock:
+            self.sounds[key] = sound
+        return sound
+
+    def _find(self, name):
+        # name in sound_dir, or a file path, decoded on first use if not preloaded
+        sound = self.sounds.get(name)
+        if sound is not None:
+            return sound
+        if os.path.isfile(name):
+            return self._decode(name, name)
+        if self.sound_dir is not None:
+            for ext in SOUND_EXTENSIONS:
+                path = os.path.join(self.sound_dir, name + ext)
+                if os.path.isfile(path):
+                    return self._decode(name, path)
+        return None
+
+    def play(self, name, volume=100):
+        """
+        Start a sound and return at once, overlapping sounds are mixed
+
+        :param name: file name without extension in sound_dir, or a file path
+        :type name: str
+        :param volume: 0-100
+        :type volume: int
+        :return: the mixer channel playing it, None if not found
+        """
+        sound = self._find(name)
+        if sound is None:
+            return None
+        return self._play(sound, volume)
+
+    def _play(self, sound, volume):
+        # a free channel, or the one playing the longest when all are busy
+        channel = self.pygame.mixer.find_channel(True)
+        # per channel volume, the same sound can overlap at different volumes
+        channel.set_volume(min(100, max(0, volume)) / 100)
+        channel.play(sound)
+        return channel
+
+    def play_block(self, name, volume=100):
+        """
+        Play a sound and block until it ends, or until a later play()
+        takes its channel
+
+        :return: False if not found
+        """
+        sound = self._find(name)
+        if sound is None:
+            return False
+        channel = self._play(sound, volume)
+        while channel.get_busy() and channel.get_sound() is sound:
+            sleep(0.01)
+        return True
+
+    def stop(self):
+        self.pygame.mixer.stop()
+
+    def close(self):
+        self.stop()
+        self.pygame.mixer.quit()
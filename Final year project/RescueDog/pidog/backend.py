@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+'''
+Hardware backend of the pidog package.
+
+Every module of the package takes its hardware classes (robot_hat Robot,
+Pin, Ultrasonic, ..., smbus, spidev, gpiozero) from here, so the whole
+stack can run on another backend. The backend is chosen once, at import,
+by the PIDOG_BACKEND environment variable:
+
+    hat   the Robot HAT, default
+    sim   pidog.sim, simulated servos, IMU, ultrasonic, ... on any Linux box
+    any other value is imported as a module providing the NAMES below
+
+    PIDOG_BACKEND=sim python3 examples/3_patrol.py
+'''
+import os
+import importlib
+
+# names a backend module provides
+NAMES = ['Robot', 'Servo', 'Pin', 'Ultrasonic', 'Music', 'I2C', 'fileDB', 'utils',
+         'SMBus', 'SpiDev', 'InputDevice', 'DigitalInputDevice', 'OutputDevice']
+
+BACKEND = os.environ.get('PIDOG_BACKEND', 'hat')
+
+
+def _load_hat():
+    from robot_hat import Robot, Servo, Pin, Ultrasonic, Music, I2C, fileDB, utils
+    from smbus import SMBus
+    from spidev import SpiDev
+    from gpiozero import InputDevice, DigitalInputDevice, OutputDevice
+    return {'Robot': Robot, 'Servo': Servo, 'Pin': Pin, 'Ultrasonic': Ultrasonic, 'Music': Music,
+            'I2C': I2C, 'fileDB': fileDB, 'utils': utils, 'SMBus': SMBus, 'SpiDev': SpiDev,
+            'InputDevice': InputDevice, 'DigitalInputDevice': DigitalInputDevice,
+            'OutputDevice': OutputDevice}
+
+
+def load(name):
+    """
+    :param name: 'hat', 'sim' or a module name
+    :return: {name: class or module} for every name of NAMES
+    :rtype: dict
+    """
+    if name == 'hat':
+        return _load_hat()
+    if name == 'sim':
+        name = 'pidog.sim'
+    module = importlib.import_module(name)
+    missing = [item for item in NAMES if not hasattr(module, item)]
+    if missing:
+        raise ImportError(f"pidog backend '{name}' does not provide: {', '.join(missing)}")
+    return {item: getattr(module, item) for item in NAMES}
+
+
+globals().update(load(BACKEND))
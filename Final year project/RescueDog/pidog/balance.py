@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+'''
+Body balance controller, keeps the measured roll and pitch at a target by
+tilting the body the other way.
+
+BalanceController runs in its own thread at a fixed rate (Pidog.IMU_RATE),
+independent of gait frames and servo_move timing. It only publishes
+corrections; whoever computes leg angles (Pidog.set_rpy(pid=True), the
+streaming gait) adds them to the body rpy before the pose engine runs:
+
+    balance = BalanceController(lambda: (my_dog.roll, my_dog.pitch))
+    balance.start()
+    roll, pitch = balance.correction()  # degrees
+'''
+import threading
+from time import time, sleep
+from .console import error
+
+
+class PID():
+    """
+    PID with anti-windup and a filtered derivative
+
+    The derivative is taken on the measurement, not the error, so target
+    steps do not kick, and low pass filtered with time constant
+    derivative_tau. The integral is clamped to integral_limit and stops
+    growing while the output is saturated in the same direction.
+
+    :param output_limit: symmetric output limit, None for no limit
+    :param integral_limit: symmetric limit of ki * integral, None for output_limit
+    :param derivative_tau: seconds, derivative low pass time constant
+    """
+
+    def __init__(self, kp, ki=0.0, kd=0.0, output_limit=None, integral_limit=None, derivative_tau=0.02):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_limit = output_limit
+        self.integral_limit = integral_limit if integral_limit is not None else output_limit
+        self.derivative_tau = derivative_tau
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0  # ki * sum(error * dt)
+        self.derivative = 0.0
+        self.last_measurement = None
+        self.output = 0.0
+
+    @staticmethod
+    def _clamp(value, limit):
+        if limit is None:
+            return value
+        return min(limit, max(-limit, value))
+
+    def update(self, target, measurement, dt):
+        """
+        :param dt: seconds since the previous update
+        :return: controller output
+        :rtype: float
+        """
+        error = target - measurement
+
+        if self.last_measurement is not None and dt > 0:
+            # d(error)/dt = -d(measurement)/dt for a constant target
+            raw = -(measurement - self.last_measurement) / dt
+            alpha = dt / (self.derivative_tau + dt)
+            self.derivative += (raw - self.derivative) * alpha
+        self.last_measurement = measurement
+
+        unsaturated = self.kp * error + self.integral + self.kd * self.derivative
+        output = self._clamp(unsaturated, self.output_limit)
+
+        # anti-windup: do not integrate further into saturation
+        if output == unsaturated or (error > 0) != (unsaturated > 0):
+            self.integral = self._clamp(self.integral + self.ki * error * dt, self.integral_limit)
+
+        self.output = output
+        return output
+
+
+class BalanceController():
+    """
+    Roll and pitch PID loops on a fixed-rate thread
+
+    :param measure: callable returning the measured (roll, pitch) in degrees
+    :type measure: callable
+    :param rate: Hz
+    :type rate: int
+    :param target: target (roll, pitch) in degrees
+    :type target: list
+    """
+
+    RATE = 200  # Hz, same as Pidog.IMU_RATE
+    KP = 0.3
+    KI = 6.0  # 1/s
+    KD = 0.01  # s
+    MAX_CORRECTION = 20  # degrees
+    DERIVATIVE_TAU = 0.03  # second
+
+    def __init__(self, measure, rate=RATE, target=None, kp=KP, ki=KI, kd=KD,
+                 max_correction=MAX_CORRECTION, derivative_tau=DERIVATIVE_TAU):
+        self.measure = measure
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.target = list(target) if target is not None else [0.0, 0.0]
+        self.roll_pid = PID(kp, ki, kd, output_limit=max_correction, derivative_tau=derivative_tau)
+        self.pitch_pid = PID(kp, ki, kd, output_limit=max_correction, derivative_tau=derivative_tau)
+        self._correction = (0.0, 0.0)
+        self.running = False
+        self.thread = None
+        self.ticks = 0
+        self.overruns = 0
+
+    def correction(self):
+        """
+        Latest body (roll, pitch) correction in degrees
+        """
+        return self._correction
+
+    def set_target(self, roll=0, pitch=0):
+        self.target = [roll, pitch]
+
+    def reset(self):
+        self.roll_pid.reset()
+        self.pitch_pid.reset()
+        self._correction = (0.0, 0.0)
+
+    def step(self, dt):
+        """
+        One control update, run by the thread or directly (eg: simulations)
+
+        :return: (roll, pitch) correction in degrees
+        """
+        roll, pitch = self.measure()
+        # a positive body rpy tilts the measured angle the same way
+        roll_correction = self.roll_pid.update(self.target[0], roll, dt)
+        pitch_correction = self.pitch_pid.update(self.target[1], pitch, dt)
+        # one tuple, readers never see roll and pitch from different steps
+        self._correction = (roll_correction, pitch_correction)
+        return self._correction
+
+    def start(self):
+        if self.running:
+            return
+        self.reset()
+        self.running = True
+        self.thread = threading.Thread(name='balance_thread', target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _loop(self):
+        next_tick = time()
+        last = next_tick - self.period
+        while self.running:
+            try:
+                now = time()
+                self.step(now - last)
+                last = now
+                self.ticks += 1
+                # absolute schedule, missed ticks are dropped
+                next_tick += self.period
+                delay = next_tick - time()
+                if delay > 0:
+                    sleep(delay)
+                else:
+                    self.overruns += 1
+                    next_tick = time()
+            except Exception as e:
+                error(f'\r_balance_thread Exception:{e}')
+                self.running = False
+                break
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+'''
+Colored console messages shared by the pidog modules
+'''
+import sys
+
+# color:
+# https://gist.github.com/rene-d/9e584a7dd2935d0f461904b9f2950007
+# 1;30:gray 31:red, 32:green, 33:yellow, 34:blue, 35:purple, 36:dark green, 37:white
+GRAY = '1;30'
+RED = '0;31'
+GREEN = '0;32'
+YELLOW = '0;33'
+BLUE = '0;34'
+PURPLE = '0;35'
+DARK_GREEN = '0;36'
+WHITE = '0;37'
+
+def print_color(msg, end='\n', file=sys.stdout, flush=False, color=''):
+    print('\033[%sm%s\033[0m'%(color, msg), end=end, file=file, flush=flush)
+
+def info(msg, end='\n', file=sys.stdout, flush=False):
+    print_color(msg, end=end, file=file, flush=flush, color=WHITE)
+
+def debug(msg, end='\n', file=sys.stdout, flush=False):
+    print_color(msg, end=end, file=file, flush=flush, color=GRAY)
+
+def warn(msg, end='\n', file=sys.stdout, flush=False):
+    print_color(msg, end=end, file=file, flush=flush, color=YELLOW)
+
+def error(msg, end='\n', file=sys.stdout, flush=False):
+    print_color(msg, end=end, file=file, flush=flush, color=RED)
+
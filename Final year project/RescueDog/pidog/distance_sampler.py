@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+'''
+Ultrasonic distance filtering and threshold triggers.
+
+DistanceFilter runs next to the sensor (in the Pidog sensory process):
+it drops timeouts and out of range echoes and outputs the median of the
+last valid readings, so a single wrong echo never reaches the caller.
+
+DistanceTrigger runs in the Pidog process: it is fed every filtered
+sample and fires once each time the distance crosses its threshold,
+with hysteresis. Reactive code waits on it instead of polling
+read_distance():
+
+    trigger = my_dog.watch_distance(15)  # below 15 cm
+    trigger.wait()  # blocks until something comes closer
+
+DistanceRecorder keeps every raw reading with its timestamp, unfiltered:
+the median filter delays a moving sensor by a few readings, a head sweep
+needs each reading where it was taken:
+
+    recorder = my_dog.record_distance()
+    times, distances = recorder.samples()
+'''
+import threading
+import queue
+import numpy as np
+from collections import deque
+
+
+class DistanceFilter():
+    """
+    Median filter with outlier rejection
+
+    :param window: number of valid readings the median is taken over
+    :type window: int
+    :param min_range: cm, readings below are treated as invalid
+    :param max_range: cm, readings above are treated as invalid
+    :param max_invalid: consecutive invalid readings before reporting -1 (no echo)
+    """
+
+    WINDOW = 5
+    MIN_RANGE = 2  # cm
+    MAX_RANGE = 300  # cm, about the timeout of Ultrasonic(timeout=0.017)
+    MAX_INVALID = 5
+
+    def __init__(self, window=WINDOW, min_range=MIN_RANGE, max_range=MAX_RANGE, max_invalid=MAX_INVALID):
+        self.min_range = min_range
+        self.max_range = max_range
+        self.max_invalid = max_invalid
+        self.values = deque(maxlen=window)
+        self.invalid_count = 0
+
+    def reset(self):
+        self.values.clear()
+        self.invalid_count = 0
+
+    def valid(self, raw):
+        """
+        :param raw: cm, Ultrasonic.read() value, -1 or None on timeout
+        :return: raw in cm, -1 when invalid
+        :rtype: float
+        """
+        if raw is None or raw < self.min_range or raw > self.max_range:
+            return -1.0
+        return float(raw)
+
+    def update(self, raw):
+        """
+        :param raw: cm, Ultrasonic.read() value, -1 or None on timeout
+        :return: filtered distance in cm, -1 when there is no echo
+        :rtype: float
+        """
+        if self.valid(raw) < 0:
+            self.invalid_count += 1
+            if self.invalid_count >= self.max_invalid:
+                self.values.clear()
+                return -1.0
+        else:
+            self.invalid_count = 0
+            self.values.append(float(raw))
+        if len(self.values) == 0:
+            return -1.0
+        ordered = sorted(self.values)
+        return ordered[len(ordered) // 2]
+
+
+class DistanceTrigger():
+    """
+    Threshold crossing detector fed by the Pidog distance dispatcher
+
+    :param threshold: cm
+    :type threshold: float
+    :param below: fire when the distance goes below the threshold, otherwise above
+    :type below: bool
+    :param callback: callable(time, distance) run on every crossing, optional
+    :type callback: callable
+    :param hysteresis: cm, the distance must come back past threshold +- hysteresis to re-arm
+    :type hysteresis: float
+    """
+
+    HYSTERESIS = 2  # cm
+    QUEUE_SIZE = 32
+
+    def __init__(self, threshold, below=True, callback=None, hysteresis=HYSTERESIS):
+        self.threshold = threshold
+        self.below = below
+        self.callback = callback
+        self.hysteresis = hysteresis
+        self.events = queue.Queue(maxsize=self.QUEUE_SIZE)  # (time, distance) of every crossing
+        self.active = False  # True while past the threshold
+        self._event = threading.Event()
+
+    def _past(self, distance):
+        if distance < 0:
+            # no echo: nothing close
+            return not self.below
+        if self.below:
+            return distance < self.threshold
+        return distance > self.threshold
+
+    def _rearmed(self, distance):
+        if distance < 0:
+            return self.below
+        if self.below:
+            return distance >= self.threshold + self.hysteresis
+        return distance <= self.threshold - self.hysteresis
+
+    def update(self, t, distance):
+        """
+        Feed one filtered sample
+
+        :return: True if the threshold was just crossed
+        :rtype: bool
+        """
+        if not self.active:
+            if not self._past(distance):
+                return False
+            self.active = True
+            self._event.set()
+            try:
+                self.events.put_nowait((t, distance))
+            except queue.Full:
+                # nobody reads the queue, keep the newest crossings
+                self.events.get_nowait()
+                self.events.put_nowait((t, distance))
+            if self.callback is not None:
+                self.callback(t, distance)
+            return True
+        if self._rearmed(distance):
+            self.active = False
+            self._event.clear()
+        return False
+
+    def wait(self, timeout=None):
+        """
+        Block while the distance is not past the threshold
+
+        :return: True if past the threshold, False on timeout
+        :rtype: bool
+        """
+        return self._event.wait(timeout)
+
+    def get(self, timeout=None):
+        """
+        Next crossing from the queue
+
+        :return: (time, distance), None on timeout
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class DistanceRecorder():
+    """
+    Raw readings fed by the Pidog distance dispatcher, each timestamped
+    when the echo left the sensor
+
+    :param capacity: readings kept, the oldest dropped first
+    :type capacity: int
+    """
+
+    CAPACITY = 1024  # 20 s at the fast rate
+    SOUND_SPEED = 34300  # cm/s
+
+    def __init__(self, capacity=CAPACITY):
+        self.readings = deque(maxlen=capacity)  # (time, distance)
+        self._lock = threading.Lock()
+
+    def update(self, t, distance):
+        """
+        Feed one raw reading
+
+        :param t: time.time() when the reading returned
+        :param distance: cm, -1 when invalid
+        """
+        if distance > 0:
+            # the echo took the round trip, the beam pointed there before
+            t -= 2 * distance / self.SOUND_SPEED
+        with self._lock:
+            self.readings.append((t, distance))
+
+    def samples(self):
+        """
+        :return: times and distances arrays, oldest first
+        :rtype: tuple
+        """
+        with self._lock:
+            readings = np.array(self.readings, dtype=float).reshape(-1, 2)
+        return readings[:, 0], readings[:, 1]
+
+    def clear(self):
+        with self._lock:
+            self.readings.clear()
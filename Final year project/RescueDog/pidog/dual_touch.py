@@ -1,11 +1,35 @@
 #!/usr/bin/env python3
-from robot_hat import Pin
+from .backend import Pin
 import time
+import threading
+from collections import deque
+from .console import warn, error
 
 
 class DualTouch():
+    '''
+    Dual touch pads, polled with read() ('N', 'L', 'R', 'LS', 'RS' from the
+    pads now, 'L' repeats while the pad is held), and after start(), edge
+    triggered on the pin interrupts, the gestures go to a queue (get())
+    and to the subscribers:
+
+        'L', 'R'                left / right touched
+        'LS', 'RS'              slides, 'LS' is left then right
+        'L_DOUBLE', 'R_DOUBLE'  touched again within DOUBLE_TAP_INTERVAL
+        'L_LONG', 'R_LONG'      held for LONG_PRESS, at release
+
+    touch = DualTouch('D2', 'D3')
+    touch.start()
+    touch.subscribe(lambda gesture, timestamp: print(gesture))
+    gesture, timestamp = touch.get(timeout=5)
+    '''
 
     SLIDE_MAX_INTERVAL = 0.5  # second, Maximum effective interval for sliding detection
+    DOUBLE_TAP_INTERVAL = 0.4  # second, from a release to the next touch of the same pad
+    LONG_PRESS = 1.0  # second
+    DEBOUNCE = 0.02  # second, edges closer than this on one pad are bounces
+    QUEUE_SIZE = 32  # gestures kept until read, the oldest dropped first
+    POLL_RATE = 100  # Hz, edge detection when the pins have no interrupt
 
     def __init__(self, sw1='D2', sw2='D3'):
 
@@ -14,6 +38,19 @@ class DualTouch():
         self.last_touch = 'N'
         self.last_touch_time = 0
 
+        self.started = False
+        self.gestures = deque(maxlen=self.QUEUE_SIZE)  # (gesture, timestamp)
+        self.dropped = 0
+        self.subscribers = []
+        self._cond = threading.Condition()
+        self._poll_thread = None
+        self._pins = {'L': self.touch_L, 'R': self.touch_R}
+        self._state = {'L': 0, 'R': 0}  # debounced value
+        self._edge_time = {'L': 0, 'R': 0}
+        self._settle = {'L': None, 'R': None}  # timer reading a bouncing pad again
+        self._press_time = {'L': 0, 'R': 0}
+        self._last_tap = None  # (pad, release time) of the last plain touch
+
     # def read(self):
     #     if self.touch_L.value() == 1:
     #         time.sleep(0.1)
@@ -30,6 +67,11 @@ class DualTouch():
     #     return 'N'
 
     def read(self):
+        """
+        :return: 'N', 'L', 'R', 'LS' or 'RS' from the pads now, leaves
+                 the gesture queue alone
+        :rtype: str
+        """
         if self.touch_L.value() == 1:
             if self.last_touch == 'R' and\
                 time.time() - self.last_touch_time <= self.SLIDE_MAX_INTERVAL:
@@ -48,4 +90,145 @@ class DualTouch():
             self.last_touch_time = time.time()
             self.last_touch = 'R'
             return val
-        return 'N'
\ No newline at end of file
+        return 'N'
+
+    # gestures
+    # =================================================================
+    def start(self):
+        """
+        Detect gestures on the pin interrupts, or a POLL_RATE thread if the
+        pins have none
+
+        :return: True on interrupts
+        :rtype: bool
+        """
+        if self.started:
+            return self._poll_thread is None
+        for pad, pin in self._pins.items():
+            self._state[pad] = pin.value()
+        self.started = True
+        try:
+            for pad, pin in self._pins.items():
+                # robot_hat Pin.irq drops the pull up unless given again
+                pin.irq(handler=lambda *args, pad=pad: self._edge(pad), trigger=Pin.IRQ_RISING_FALLING,
+                        bouncetime=int(self.DEBOUNCE * 1000), pull=Pin.PULL_UP)
+            return True
+        except Exception as e:
+            warn(f'dual_touch: no pin interrupt ({e}), polling at {self.POLL_RATE} Hz')
+            self._poll_thread = threading.Thread(name='dual_touch_thread', target=self._poll)
+            self._poll_thread.daemon = True
+            self._poll_thread.start()
+            return False
+
+    def stop(self):
+        # the interrupt handlers stay, and ignore edges until the next start()
+        self.started = False
+        if self._poll_thread is not None:
+            self._poll_thread.join()
+            self._poll_thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def _poll(self):
+        while self.started:
+            for pad in self._pins:
+                self._edge(pad)
+            time.sleep(1 / self.POLL_RATE)
+
+    def _edge(self, pad):
+        value = self._pins[pad].value()
+        now = time.time()
+        with self._cond:
+            if not self.started or value == self._state[pad]:
+                return
+            if now - self._edge_time[pad] < self.DEBOUNCE:
+                # read the pad again once settled, the last edge of a bounce may be a release
+                if self._settle[pad] is None:
+                    self._settle[pad] = threading.Timer(self.DEBOUNCE, self._settled, args=(pad,))
+                    self._settle[pad].daemon = True
+                    self._settle[pad].start()
+                return
+            self._state[pad] = value
+            self._edge_time[pad] = now
+            if value == 1:
+                gesture = self._touched(pad, now)
+            else:
+                gesture = self._released(pad, now)
+        if gesture is not None:
+            self._emit(gesture, now)
+
+    def _settled(self, pad):
+        with self._cond:
+            self._settle[pad] = None
+        self._edge(pad)
+
+    def _touched(self, pad, now):
+        other = 'R' if pad == 'L' else 'L'
+        if self._press_time[other] > 0 and now - self._press_time[other] <= self.SLIDE_MAX_INTERVAL:
+            # same names as read(): right then left is 'RS'
+            gesture = other + 'S'
+            self._last_tap = None
+        elif self._last_tap is not None and self._last_tap[0] == pad and self._last_tap[1] is not None and \
+                now - self._last_tap[1] <= self.DOUBLE_TAP_INTERVAL:
+            gesture = pad + '_DOUBLE'
+            self._last_tap = None
+        else:
+            gesture = pad
+            self._last_tap = (pad, None)
+        self._press_time[pad] = now
+        return gesture
+
+    def _released(self, pad, now):
+        if now - self._press_time[pad] >= self.LONG_PRESS:
+            self._last_tap = None
+            return pad + '_LONG'
+        if self._last_tap is not None and self._last_tap[0] == pad:
+            self._last_tap = (pad, now)
+        return None
+
+    def _emit(self, gesture, timestamp):
+        with self._cond:
+            if len(self.gestures) == self.gestures.maxlen:
+                self.dropped += 1
+            self.gestures.append((gesture, timestamp))
+            self._cond.notify_all()
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(gesture, timestamp)
+            except Exception as e:
+                error(f'dual_touch subscriber error: {e}')
+
+    def get(self, timeout=None):
+        """
+        Wait for the oldest queued gesture
+
+        :param timeout: seconds, None waits until one comes or stop()
+        :return: (gesture, timestamp), None on timeout
+        :rtype: tuple
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.gestures) > 0 or not self.started, timeout)
+            if len(self.gestures) == 0:
+                return None
+            return self.gestures.popleft()
+
+    def clear(self):
+        with self._cond:
+            self.gestures.clear()
+
+    def subscribe(self, callback):
+        """
+        Call callback(gesture, timestamp) on every gesture, from the
+        interrupt thread, keep it short
+
+        :return: callback, for unsubscribe()
+        """
+        with self._cond:
+            self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
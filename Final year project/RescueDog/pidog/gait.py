@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+'''
+Streaming gait generator, frame by frame leg coordinates from velocity setpoints.
+
+Walk and Trot emit whole fixed cycles. GaitGenerator keeps a continuous
+gait phase instead, so the speed and heading can change on any frame:
+
+    gait = GaitGenerator(frame_rate=100)
+    gait.set_velocity(vx=40, yaw_rate=0)  # mm/s, deg/s
+    coords = gait.next_frame()  # 4 * [y, z], same as Walk.get_coords() frames
+
+Every leg has its own phase offset. During swing it is raised and moved
+forward with a cosine profile; during stance it is moved back linearly.
+The walk pattern (one leg at a time, order 1, 4, 2, 3) and the trot
+pattern (diagonal pairs) are blended by trot_mix, 0 is walk and 1 is trot.
+The mix follows the commanded speed unless a gait is forced.
+'''
+from math import cos, sin, pi
+from .walk import Walk
+from .trot import Trot
+
+
+def _approach(value, target, max_step):
+    if target > value:
+        return min(target, value + max_step)
+    return max(target, value - max_step)
+
+
+def _blend(a, b, ratio):
+    return a + (b - a) * ratio
+
+
+class GaitGenerator():
+
+    WALK = 0
+    TROT = 1
+
+    FRAME_RATE = 100  # Hz
+    BODY_WIDTH = 98  # mm, same as Pidog.BODY_WIDTH
+    Z_ORIGIN = Walk.Z_ORIGIN
+    LEG_STEP_HEIGHT = Walk.LEG_STEP_HEIGHT
+
+    # walk: legs raised one by one in the order 1, 4, 2, 3
+    WALK_CYCLE = 1.5  # second
+    WALK_SWING = 1 / 8  # part of the cycle a leg is raised
+    WALK_PHASES = [0, 0.5, 0.75, 0.25]
+    WALK_CENTERS = [Walk.CENTER_OF_GRAVIRTY + offset for offset in Walk.LEG_POSITION_OFFSETS]
+    WALK_MAX_STRIDE = Walk.LEG_STEP_WIDTH
+
+    # trot: legs 1, 4 then legs 2, 3
+    TROT_CYCLE = 0.6  # second
+    TROT_SWING = 1 / 2
+    TROT_PHASES = [0, 0.5, 0.5, 0]
+    TROT_CENTERS = [Trot.CENTER_OF_GRAVITY + Trot.LEG_STAND_OFFSET * direction
+                    for direction in Trot.LEG_STAND_OFFSET_DIRS]
+    TROT_MAX_STRIDE = Trot.LEG_STEP_WIDTH
+
+    # walk to trot by speed, mm/s
+    TROT_SPEED_LOW = 40
+    TROT_SPEED_HIGH = 80
+
+    MAX_ACCELERATION = 200  # mm/s^2
+    MAX_YAW_ACCELERATION = 360  # deg/s^2
+    BLEND_TIME = 1.0  # second, time for a full walk <-> trot transition
+    LIFT_SPEED = 10  # mm/s, legs are fully raised above this speed
+
+    # -1: left legs, 1: right legs
+    LEGS_SIDE = [-1, 1, -1, 1]
+
+    def __init__(self, frame_rate=FRAME_RATE):
+        """
+        :param frame_rate: frames per second, the rate next_frame() is called at
+        :type frame_rate: int or float
+        """
+        self.frame_rate = frame_rate
+        self.dt = 1.0 / frame_rate
+        self.phase = 0.0
+        self.vx = 0.0
+        self.yaw_rate = 0.0
+        self.target_vx = 0.0
+        self.target_yaw_rate = 0.0
+        self.trot_mix = 0.0
+        self.lift = 0.0
+        self.forced_gait = None
+
+    def set_velocity(self, vx, yaw_rate=0, gait=None):
+        """
+        Set the velocity setpoints, used from the next frame
+
+        :param vx: forward speed, mm/s, negative for backward
+        :type vx: float
+        :param yaw_rate: turning speed, deg/s, positive turns left
+        :type yaw_rate: float
+        :param gait: force WALK or TROT, None to choose by speed
+        :type gait: int or None
+        """
+        self.target_vx = float(vx)
+        self.target_yaw_rate = float(yaw_rate)
+        self.forced_gait = gait
+
+    def is_still(self):
+        """
+        True when stopped with every foot on the ground
+        """
+        return self.target_vx == 0 and self.target_yaw_rate == 0 \
+            and self.vx == 0 and self.yaw_rate == 0 and self.lift == 0
+
+    def legs_speed(self):
+        # ground speed of each leg, mm/s
+        yaw = self.yaw_rate / 180 * pi * self.BODY_WIDTH / 2
+        return [self.vx + side * yaw for side in self.LEGS_SIDE]
+
+    def _update_setpoints(self, dt):
+        self.vx = _approach(self.vx, self.target_vx, self.MAX_ACCELERATION * dt)
+        self.yaw_rate = _approach(self.yaw_rate, self.target_yaw_rate, self.MAX_YAW_ACCELERATION * dt)
+
+        if self.forced_gait is not None:
+            target_mix = float(self.forced_gait)
+        else:
+            speed = max(abs(v) for v in self.legs_speed())
+            target_mix = (speed - self.TROT_SPEED_LOW) / (self.TROT_SPEED_HIGH - self.TROT_SPEED_LOW)
+            target_mix = min(1.0, max(0.0, target_mix))
+        self.trot_mix = _approach(self.trot_mix, target_mix, dt / self.BLEND_TIME)
+
+        moving = self.target_vx != 0 or self.target_yaw_rate != 0
+        speed = max(abs(v) for v in self.legs_speed())
+        target_lift = 1.0 if moving else min(1.0, speed / self.LIFT_SPEED)
+        self.lift = _approach(self.lift, target_lift, dt / self.BLEND_TIME * 2)
+
+    def next_frame(self, dt=None):
+        """
+        Advance one frame
+
+        :param dt: seconds this frame lasts, the real frame time when the
+                   frames are not executed at frame_rate, 1 / frame_rate by default
+        :type dt: float
+        :return: legs coords, 4 * [y, z]
+        :rtype: list
+        """
+        dt = self.dt if dt is None else dt
+        self._update_setpoints(dt)
+        mix = self.trot_mix
+        cycle = _blend(self.WALK_CYCLE, self.TROT_CYCLE, mix)
+        swing = _blend(self.WALK_SWING, self.TROT_SWING, mix)
+        max_stride = _blend(self.WALK_MAX_STRIDE, self.TROT_MAX_STRIDE, mix)
+        stance_time = (1 - swing) * cycle
+
+        coords = []
+        for i, speed in enumerate(self.legs_speed()):
+            center = _blend(self.WALK_CENTERS[i], self.TROT_CENTERS[i], mix)
+            stride = min(max_stride, max(-max_stride, speed * stance_time))
+            leg_phase = (self.phase - _blend(self.WALK_PHASES[i], self.TROT_PHASES[i], mix)) % 1.0
+            if leg_phase < swing:
+                # swing, move forward with a cosine profile
+                s = leg_phase / swing
+                y = center + stride / 2 - stride * (1 - cos(pi * s)) / 2
+                z = self.Z_ORIGIN - self.LEG_STEP_HEIGHT * self.lift * sin(pi * s)
+            else:
+                # stance, move back linearly
+                s = (leg_phase - swing) / (1 - swing)
+                y = center - stride / 2 + stride * s
+                z = self.Z_ORIGIN
+            coords.append([y, z])
+
+        if self.lift > 0:
+            self.phase = (self.phase + dt / cycle) % 1.0
+        return coords
+
+    def frames(self):
+        """
+        Endless generator of next_frame()
+        """
+        while True:
+            yield self.next_frame()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+'''
+Head yaw trajectory, where the head pointed at any time of the last
+seconds, from the head frames it executed.
+
+Every head frame is a linear move of the yaw servo from where it was to
+its target, over the frame time of Robot.servo_move (speed, max_dps).
+The head thread records it when it starts, and the actual end when
+servo_move returns. Between frames the head holds its yaw.
+
+A sweep then needs no stops: the ultrasonic keeps sampling while the head
+moves, and each sample gets the yaw interpolated at its timestamp:
+
+    trajectory = HeadTrajectory()
+    trajectory.begin(time(), 0.9, -90, 90)
+    ...
+    yaws = trajectory.at(sample_times)
+'''
+import threading
+import numpy as np
+from collections import deque
+
+
+class HeadTrajectory():
+    """
+    Ring buffer of timestamped yaw moves
+
+    :param capacity: head frames kept
+    :type capacity: int
+    """
+
+    DEFAULT_CAPACITY = 256  # head frames, a few sweeps
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.segments = deque(maxlen=capacity)  # [t0, t1, yaw0, yaw1]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.segments)
+
+    def begin(self, t, duration, yaw_from, yaw_to):
+        """
+        Record a head frame starting
+
+        :param t: time.time() of the frame start
+        :param duration: seconds, planned frame time
+        :param yaw_from: degrees, yaw servo at the start
+        :param yaw_to: degrees, yaw servo target
+        """
+        with self._lock:
+            if len(self.segments) > 0:
+                last = self.segments[-1]
+                if t < last[1]:
+                    # the previous frame was cut short (head_stop, scheduler), it ends here
+                    last[3] = self._yaw(last, t)
+                    last[1] = t
+            self.segments.append([t, t + max(0.0, duration), float(yaw_from), float(yaw_to)])
+
+    def end(self, t):
+        """
+        Record the actual end of the last frame
+        """
+        with self._lock:
+            if len(self.segments) > 0:
+                last = self.segments[-1]
+                last[1] = max(last[0], t)
+
+    def moving(self, t):
+        """
+        :param t: time.time()
+        :return: True while the last frame is not over
+        :rtype: bool
+        """
+        with self._lock:
+            return len(self.segments) > 0 and t < self.segments[-1][1]
+
+    @staticmethod
+    def _yaw(segment, t):
+        t0, t1, yaw0, yaw1 = segment
+        if t1 <= t0:
+            return yaw1
+        return yaw0 + (yaw1 - yaw0) * min(1.0, max(0.0, (t - t0) / (t1 - t0)))
+
+    def at(self, timestamps):
+        """
+        Yaw servo angles interpolated at the timestamps, clamped to the
+        first and last frames
+
+        :param timestamps: time.time() values, scalar or array
+        :return: degrees, float or array like timestamps, None if empty
+        """
+        with self._lock:
+            if len(self.segments) == 0:
+                return None
+            segments = np.array(self.segments)
+        # knots: every frame start and end, the yaw holds between frames
+        times = segments[:, :2].ravel()
+        yaws = segments[:, 2:].ravel()
+        # np.interp needs increasing times, a zero length frame is a step
+        times = np.maximum.accumulate(times)
+        values = np.interp(timestamps, times, yaws)
+        if np.ndim(values) == 0:
+            return float(values)
+        return values
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+'''
+Persistent IMU offsets, so that the imu thread can skip the startup
+calibration window.
+
+Offsets are stored per device and per temperature band in one .npz file.
+An entry older than MAX_AGE is stale and ignored. After a warm start,
+DriftCheck watches the first samples: if the dog is still and the
+residuals are off, the offsets are corrected from those samples and
+stored again, without stopping the imu thread.
+'''
+import os
+import numpy as np
+from time import time
+
+ACC_1G = -16384  # ax at rest, 2g range
+
+
+class ImuCalibrationCache():
+    """
+    :param path: .npz file
+    :type path: str
+    """
+
+    TEMPERATURE_BAND = 5  # degree C
+    MAX_AGE = 30 * 24 * 3600  # second
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}  # (device, band): (acc_offset, gyro_offset, temperature, time)
+        self.load()
+
+    def band(self, temperature):
+        return int(temperature // self.TEMPERATURE_BAND)
+
+    def load(self):
+        self.entries = {}
+        if not os.path.isfile(self.path):
+            return False
+        with np.load(self.path) as table:
+            for i, device in enumerate(table['device']):
+                key = (str(device), int(table['band'][i]))
+                self.entries[key] = (table['acc_offset'][i].tolist(), table['gyro_offset'][i].tolist(),
+                                     float(table['temperature'][i]), float(table['time'][i]))
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        keys = list(self.entries)
+        values = [self.entries[key] for key in keys]
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp,
+                 device=np.array([key[0] for key in keys], dtype=str),
+                 band=np.array([key[1] for key in keys], dtype=int),
+                 acc_offset=np.array([value[0] for value in values], dtype=float).reshape(-1, 3),
+                 gyro_offset=np.array([value[1] for value in values], dtype=float).reshape(-1, 3),
+                 temperature=np.array([value[2] for value in values], dtype=float),
+                 time=np.array([value[3] for value in values], dtype=float))
+        # never leave a half written cache
+        os.replace(tmp, self.path)
+
+    def lookup(self, device, temperature, now=None):
+        """
+        :return: (acc_offset, gyro_offset), None if missing or stale
+        """
+        entry = self.entries.get((device, self.band(temperature)))
+        if entry is None:
+            return None
+        now = time() if now is None else now
+        if now - entry[3] > self.MAX_AGE:
+            return None
+        return entry[0], entry[1]
+
+    def store(self, device, temperature, acc_offset, gyro_offset):
+        self.entries[(device, self.band(temperature))] = (
+            list(acc_offset), list(gyro_offset), float(temperature), time())
+        self.save()
+
+
+class DriftCheck():
+    """
+    Residuals of the first samples after a warm start. At rest, with good
+    offsets, the gyro reads about 0 and the accelerometer about [ACC_1G, 0, 0].
+
+    :param samples: number of samples to check
+    """
+
+    SAMPLES = 40  # 0.2 s at 200 Hz
+    STILL_GYRO_STD = 15  # LSB, about 1 dps, larger means the dog moved
+    GYRO_DRIFT = 8  # LSB, about 0.5 dps
+    ACC_DRIFT = 300  # LSB, about 0.02 G
+
+    def __init__(self, samples=SAMPLES):
+        self.samples = samples
+        self.acc = []
+        self.gyro = []
+
+    def add(self, acc, gyro):
+        """
+        :return: True when enough samples are collected
+        """
+        self.acc.append(acc)
+        self.gyro.append(gyro)
+        return len(self.acc) >= self.samples
+
+    def corrections(self):
+        """
+        :return: (acc_correction, gyro_correction) to add to the offsets,
+                 None if no drift or the dog was moving
+        """
+        acc = np.array(self.acc, dtype=float)
+        gyro = np.array(self.gyro, dtype=float)
+        if np.any(gyro.std(axis=0) > self.STILL_GYRO_STD):
+            return None
+        acc_error = acc.mean(axis=0) - [ACC_1G, 0, 0]
+        gyro_error = gyro.mean(axis=0)
+        if np.all(np.abs(gyro_error) <= self.GYRO_DRIFT) and np.all(np.abs(acc_error) <= self.ACC_DRIFT):
+            return None
+        return (-acc_error).round().tolist(), (-gyro_error).round().tolist()
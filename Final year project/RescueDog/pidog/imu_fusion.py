@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+'''
+IMU orientation filter and sample history for the SH3001.
+
+Sensor axes as mounted on Pidog: x points down (1G = -16384 at rest),
+pitch tilts the y axis and roll the z axis. Angles are in degrees, with
+the same signs as the accelerometer-only roll/pitch Pidog used before.
+Yaw is integrated from the gyro only and drifts slowly, positive when
+turning left.
+'''
+import threading
+import numpy as np
+from math import atan, atan2, sqrt
+
+ACC_LSB_PER_G = 16384  # 2g range
+GYRO_LSB_PER_DPS = 32768 / 2000  # 2000 dps range
+RAD_TO_DEG = 57.2957795
+
+
+def acc_roll_pitch(acc):
+    """
+    Roll and pitch in degrees from the accelerometer alone, like the
+    previous Pidog._imu_thread
+    """
+    ax, ay, az = acc
+    ay = -ay
+    az = -az
+    pitch = atan(ay / sqrt(ax * ax + az * az)) * RAD_TO_DEG
+    roll = atan(az / sqrt(ax * ax + ay * ay)) * RAD_TO_DEG
+    return roll, pitch
+
+
+class ComplementaryFilter():
+    """
+    Complementary filter, gyro integration corrected towards the
+    accelerometer angles with time constant tau
+
+    :param tau: seconds, larger trusts the gyro longer
+    :type tau: float
+    :param acc_gate: G, accelerometer correction is skipped when the
+                     acceleration norm is off 1G by more than this
+    :type acc_gate: float
+    """
+
+    TAU = 0.5  # second
+    ACC_GATE = 0.3  # G
+
+    def __init__(self, tau=TAU, acc_gate=ACC_GATE):
+        self.tau = tau
+        self.acc_gate = acc_gate
+        self.roll = 0.0
+        self.pitch = 0.0
+        self.yaw = 0.0
+        self.initialized = False
+
+    def reset(self, acc=None):
+        self.yaw = 0.0
+        self.initialized = False
+        if acc is not None:
+            self.roll, self.pitch = acc_roll_pitch(acc)
+            self.initialized = True
+
+    def update(self, acc, gyro, dt):
+        """
+        :param acc: [ax, ay, az], raw LSB with offsets applied
+        :param gyro: [gx, gy, gz], raw LSB with offsets applied
+        :param dt: seconds since the previous sample
+        :return: roll, pitch, yaw in degrees
+        :rtype: tuple
+        """
+        if not self.initialized:
+            self.reset(acc)
+            return self.roll, self.pitch, self.yaw
+
+        # body rates, deg/s; x is down so the axes map as below
+        roll_rate = gyro[1] / GYRO_LSB_PER_DPS
+        pitch_rate = -gyro[2] / GYRO_LSB_PER_DPS
+        yaw_rate = -gyro[0] / GYRO_LSB_PER_DPS
+
+        roll = self.roll + roll_rate * dt
+        pitch = self.pitch + pitch_rate * dt
+        self.yaw = (self.yaw + yaw_rate * dt + 180) % 360 - 180
+
+        norm = sqrt(acc[0] ** 2 + acc[1] ** 2 + acc[2] ** 2) / ACC_LSB_PER_G
+        if abs(norm - 1) < self.acc_gate:
+            acc_roll, acc_pitch = acc_roll_pitch(acc)
+            k = dt / (self.tau + dt)
+            roll += (acc_roll - roll) * k
+            pitch += (acc_pitch - pitch) * k
+        self.roll = roll
+        self.pitch = pitch
+        return self.roll, self.pitch, self.yaw
+
+
+class ImuHistory():
+    """
+    Fixed-capacity ring buffer of timestamped IMU samples.
+
+    One writer (the imu thread) appends, any thread reads consistent copies
+    through latest(), last() or window() instead of racing plain attributes.
+    Each sample: time, ax, ay, az, gx, gy, gz, roll, pitch, yaw.
+    """
+
+    DEFAULT_CAPACITY = 1024  # about 5 s at 200 Hz
+    FIELDS = ['time', 'ax', 'ay', 'az', 'gx', 'gy', 'gz', 'roll', 'pitch', 'yaw']
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = int(capacity)
+        self._data = np.zeros((self.capacity, len(self.FIELDS)))
+        self._index = 0  # next write position
+        self._count = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, t, acc, gyro, rpy):
+        with self._cond:
+            row = self._data[self._index]
+            row[0] = t
+            row[1:4] = acc
+            row[4:7] = gyro
+            row[7:10] = rpy
+            self._index = (self._index + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._cond.notify_all()
+
+    def _last_locked(self, n):
+        n = min(n, self._count)
+        idx = (self._index - n + np.arange(n)) % self.capacity
+        return self._data[idx]
+
+    def latest(self):
+        """
+        Newest sample as a dict of FIELDS, None if empty
+        """
+        with self._cond:
+            if self._count == 0:
+                return None
+            return dict(zip(self.FIELDS, self._data[(self._index - 1) % self.capacity].tolist()))
+
+    def last(self, n):
+        """
+        Copy of the newest n samples, oldest first, n * len(FIELDS) array
+        """
+        with self._cond:
+            return self._last_locked(n)
+
+    def window(self, seconds, now=None):
+        """
+        Copy of the samples of the last seconds, oldest first
+
+        :param now: reference time, default the newest sample time
+        """
+        with self._cond:
+            samples = self._last_locked(self._count)
+        if len(samples) == 0:
+            return samples
+        if now is None:
+            now = samples[-1, 0]
+        return samples[samples[:, 0] >= now - seconds]
+
+    def at(self, t, name='yaw'):
+        """
+        A field interpolated at time t, clamped to the oldest and newest
+        samples, None if empty. yaw is unwrapped across +-180 first.
+        """
+        with self._cond:
+            samples = self._last_locked(self._count)
+        if len(samples) == 0:
+            return None
+        values = self.column(samples, name)
+        if name == 'yaw':
+            values = np.degrees(np.unwrap(np.radians(values)))
+            return (float(np.interp(t, samples[:, 0], values)) + 180) % 360 - 180
+        return float(np.interp(t, samples[:, 0], values))
+
+    def wait_new(self, timeout=None):
+        """
+        Block until the next sample is appended
+
+        :return: True if a sample arrived, False on timeout
+        """
+        with self._cond:
+            return self._cond.wait(timeout)
+
+    def column(self, samples, name):
+        # eg: history.column(history.window(0.1), 'ax')
+        return samples[:, self.FIELDS.index(name)]
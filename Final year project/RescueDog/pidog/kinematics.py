@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+'''
+Vectorized kinematics helpers, NumPy versions of the per-leg math in Pidog.
+
+Legs order: left front, right front, left hind, right hind. Coordinates
+are [y, z] in mm per leg, angles are [leg, foot] in degrees per leg.
+'''
+import numpy as np
+import math
+from math import pi
+
+# The left and right sides are opposite
+LEGS_SIGN = np.array([1, -1, 1, -1], dtype=float)
+
+
+def _ufunc(np_func, math_func, exact, *args):
+    # SIMD builds of NumPy may differ from libm by an ulp,
+    # exact calls the math module like the scalar Pidog functions do
+    if not exact:
+        return np_func(*args)
+    if len(args) > 1:
+        args = np.broadcast_arrays(*args)
+    x = np.asarray(args[0], dtype=float)
+    values = map(math_func, *[np.ravel(a) for a in args])
+    return np.fromiter(values, float, x.size).reshape(x.shape)
+
+
+def coords2polar(coords, leg, foot, pitch=0.0, exact=False):
+    """
+    Vectorized coord2polar / fieldcoord2polar
+
+    :param coords: [..., 2] array of [y, z]
+    :param leg: upper leg length
+    :param foot: lower leg length
+    :param pitch: body pitch in radian added to alpha (fieldcoord2polar), scalar or broadcastable
+    :param exact: use libm acos/atan2, bit-for-bit equal to the scalar functions
+    :return: alpha, beta arrays in degrees
+    """
+    coords = np.asarray(coords, dtype=float)
+    y = coords[..., 0]
+    z = coords[..., 1]
+    # libm pow(x, 2) is not always x * x
+    square = lambda x: _ufunc(np.square, lambda v: pow(v, 2), exact, x)
+    u = np.sqrt(square(y) + square(z))
+    u2 = square(u)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_angle1 = (foot**2 + leg**2 - u2) / (2 * foot * leg)
+        cos_angle1 = np.clip(cos_angle1, -1, 1)
+        beta = _ufunc(np.arccos, math.acos, exact, cos_angle1)
+
+        angle1 = _ufunc(np.arctan2, math.atan2, exact, y, z)
+        cos_angle2 = (leg**2 + u2 - foot**2) / (2 * leg * u)
+        cos_angle2 = np.clip(cos_angle2, -1, 1)
+        angle2 = _ufunc(np.arccos, math.acos, exact, cos_angle2)
+    alpha = angle2 + angle1 + pitch
+
+    alpha = alpha / pi * 180
+    beta = beta / pi * 180
+    return alpha, beta
+
+
+def polar2legs_angles(alpha, beta):
+    """
+    Convert [..., 4] alpha, beta arrays into [..., 8] servo angles,
+    with the left and right sides opposite
+    """
+    leg_angle = alpha * LEGS_SIGN
+    foot_angle = (beta - 90) * LEGS_SIGN
+    angles = np.stack([leg_angle, foot_angle], axis=-1)
+    return angles.reshape(angles.shape[:-2] + (8,))
+
+
+def legs_angle_batch(coords, leg, foot):
+    """
+    Batch version of Pidog.legs_angle_calculation
+
+    :param coords: N frames * 4 legs * [y, z], or a single 4 * [y, z] frame
+    :type coords: list or numpy.ndarray
+    :param leg: upper leg length
+    :param foot: lower leg length
+    :return: N * 8 angles array (8 angles for a single frame)
+    :rtype: numpy.ndarray
+    """
+    alpha, beta = coords2polar(coords, leg, foot)
+    return polar2legs_angles(alpha, beta)
+
+
+def legs_angles2coords(angles, leg, foot):
+    """
+    Inverse of legs_angle_batch, feet [y, z] from servo angles
+
+    :param angles: [..., 8] servo angles in degrees
+    :param leg: upper leg length
+    :param foot: lower leg length
+    :return: [..., 4, 2] array of [y, z]
+    :rtype: numpy.ndarray
+    """
+    angles = np.asarray(angles, dtype=float)
+    angles = angles.reshape(angles.shape[:-1] + (4, 2)) * LEGS_SIGN[:, None]
+    alpha = np.radians(angles[..., 0])
+    beta = np.radians(angles[..., 1] + 90)
+    u = np.sqrt(np.maximum(1e-9, leg**2 + foot**2 - 2 * leg * foot * np.cos(beta)))
+    angle2 = np.arccos(np.clip((leg**2 + u**2 - foot**2) / (2 * leg * u), -1, 1))
+    angle1 = alpha - angle2
+    return np.stack([u * np.sin(angle1), u * np.cos(angle1)], axis=-1)
+
+
+def body_struct(body_width, body_length):
+    """
+    Shoulder positions relative to the body center, 3 * 4 (x, y, z) * legs
+    """
+    return np.array([
+        [-body_width / 2, -body_length / 2,  0],
+        [body_width / 2, -body_length / 2,  0],
+        [-body_width / 2,  body_length / 2,  0],
+        [body_width / 2,  body_length / 2,  0]]).T
+
+
+class PoseEngine():
+    """
+    Plain ndarray version of Pidog.set_legs + pose2coords + pose2legs_angle,
+    working on batches of (rpy, pose, legs coords).
+
+    Every argument broadcasts over a leading frames axis:
+        rpy: [3] or [N, 3], roll, pitch, yaw in radian
+        pose: [3] or [N, 3], body x, y, z in mm
+        legs_coords: [4, 2] or [N, 4, 2], [y, z] per leg like Pidog.set_legs
+
+    exact=True is a compatibility mode, not vectorized: acos, atan2, cos,
+    sin and pow go through the math module one element at a time, for
+    angles bit-for-bit equal to the previous np.matrix code. The default
+    NumPy ufuncs differ from it by about 1e-13 degrees (SIMD builds are not
+    libm, no operation order makes them equal). Pidog runs exact=True.
+    """
+
+    def __init__(self, leg, foot, body_width, body_length, body_height, exact=False):
+        self.leg = leg
+        self.foot = foot
+        self.body_width = body_width
+        self.body_length = body_length
+        self.body_height = body_height
+        self.exact = exact
+        self.BODY_STRUCT = body_struct(body_width, body_length)
+        # shoulder x, y used by leg_points
+        self._shoulder_x = self.BODY_STRUCT[0]
+        self._shoulder_y = self.BODY_STRUCT[1]
+        self._body_columns = np.ascontiguousarray(self.BODY_STRUCT.T[:, :, None])  # 4 * 3 * 1
+
+    def rotation(self, rpy):
+        """
+        rotx * roty * rotz of Pidog.pose2coords, [..., 3, 3]
+        """
+        rpy = np.asarray(rpy, dtype=float)
+        roll = rpy[..., 0]
+        pitch = rpy[..., 1]
+        yaw = rpy[..., 2]
+
+        # cos, sin of roll, -pitch, yaw in one call
+        angles = np.stack([roll, -pitch, yaw], axis=-1)
+        cos = _ufunc(np.cos, math.cos, self.exact, angles)
+        sin = _ufunc(np.sin, math.sin, self.exact, angles)
+        cr, cp, cy = cos[..., 0], cos[..., 1], cos[..., 2]
+        sr, sp, sy = sin[..., 0], sin[..., 1], sin[..., 2]
+
+        rotx = np.zeros(roll.shape + (3, 3))
+        rotx[..., 0, 0] = cr
+        rotx[..., 0, 2] = -sr
+        rotx[..., 1, 1] = 1
+        rotx[..., 2, 0] = sr
+        rotx[..., 2, 2] = cr
+        roty = np.zeros(roll.shape + (3, 3))
+        roty[..., 0, 0] = 1
+        roty[..., 1, 1] = cp
+        roty[..., 1, 2] = -sp
+        roty[..., 2, 1] = sp
+        roty[..., 2, 2] = cp
+        rotz = np.zeros(roll.shape + (3, 3))
+        rotz[..., 0, 0] = cy
+        rotz[..., 0, 1] = -sy
+        rotz[..., 1, 0] = sy
+        rotz[..., 1, 1] = cy
+        rotz[..., 2, 2] = 1
+        # np.matmul runs the same BLAS kernels as the np.matrix products,
+        # so results stay bit-for-bit equal
+        return np.matmul(np.matmul(rotx, roty), rotz)
+
+    def leg_points(self, legs_coords):
+        """
+        Foot points in the body frame, [..., 3, 4], same as Pidog.set_legs
+        """
+        legs_coords = np.asarray(legs_coords, dtype=float)
+        y = self._shoulder_y + legs_coords[..., 0]
+        z = self.body_height - legs_coords[..., 1]
+        x = np.broadcast_to(self._shoulder_x, y.shape)
+        return np.stack([x, y, z], axis=-2)
+
+    def pose2coords(self, rpy, pose, legs_coords):
+        """
+        :return: leg points and body points, both [..., 4, 3]
+        """
+        leg_points = self.leg_points(legs_coords)
+        pose = np.asarray(pose, dtype=float)[..., :, None]
+        rot_mat = self.rotation(rpy)
+        # rot_mat * BODY_STRUCT[:, i] for every leg, as matrix-vector products
+        body_rot = np.matmul(rot_mat[..., None, :, :], self._body_columns)[..., 0]
+        AB = - pose - np.swapaxes(body_rot, -1, -2) + leg_points
+        body_points = leg_points - AB
+        return np.swapaxes(leg_points, -1, -2), np.swapaxes(body_points, -1, -2)
+
+    def pose2legs_angle(self, rpy, pose, legs_coords):
+        """
+        :return: servo angles, [..., 8]
+        """
+        leg_points, body_points = self.pose2coords(rpy, pose, legs_coords)
+        coords = np.stack([
+            leg_points[..., 1] - body_points[..., 1],
+            body_points[..., 2] - leg_points[..., 2]], axis=-1)
+        pitch = np.asarray(rpy, dtype=float)[..., 1, None]
+        alpha, beta = coords2polar(coords, self.leg, self.foot, pitch=pitch, exact=self.exact)
+        return polar2legs_angles(alpha, beta)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+'''
+Occupancy grid of ultrasonic readings, in log-odds.
+
+Every reading lowers the odds of the cells its beam crossed (free) and
+raises the odds of the cell it ended in (occupied). A wall seen once
+shows at once, a spurious echo clears after a couple of beams through it.
+The beams of a batch (eg: a whole head sweep) are ray cast together,
+Bresenham in its DDA form, vectorized over every cell of every beam.
+
+Cells are [row, column] = [gy, gx], x to the right, y down, the
+legacy Modules/slam.py layout: a reading at angle a (degrees
+counterclockwise, 0 along +x) and d cm from (gx, gy) ends at
+gx + d cos(a) * cells per cm, gy - d sin(a) * cells per cm.
+
+    grid = OccupancyGrid(41, resolution=5, dtype=np.int8)
+    grid.update((20, 20), angles=[-90, -75, ..., 90], distances=[...])
+    print('\\n'.join(grid.render()))
+
+TiledOccupancyGrid has no bounds: square tiles in a dict keyed by tile
+coordinates, made on the first reading that reaches them, the ones far
+from the robot compressed to disk past max_tiles and read back when
+needed again.
+'''
+import os
+import zlib
+import tempfile
+import numpy as np
+
+L_OCC = 0.85  # log-odds added to the cell a beam ends in
+L_FREE = -0.4  # log-odds added to the cells a beam crosses
+L_MIN = -4.0  # clamp, a cell can turn again after a few readings
+L_MAX = 4.0
+L_THRESHOLD = 0.4  # above: occupied, one hit is enough
+INT_SCALE = 16  # log-odds step of integer grids, 1/16, L_MAX fits int8
+
+
+class OccupancyGrid():
+    """
+    :param size: cells per side, or (rows, columns)
+    :param resolution: cells per metre
+    :type resolution: float
+    :param dtype: numpy.float32, or numpy.int8 / int16 for log-odds in 1/INT_SCALE steps
+    """
+
+    MIN_RANGE = 3  # cm, closer readings are noise
+    MAX_RANGE = 300  # cm, further readings only clear the cells up to here
+
+    def __init__(self, size, resolution=5, dtype=np.float32):
+        if isinstance(size, int):
+            size = (size, size)
+        self.resolution = float(resolution)
+        self.dtype = np.dtype(dtype)
+        self.scale = 1 if self.dtype.kind == 'f' else INT_SCALE
+        self.log_odds = np.zeros(size, dtype=self.dtype)
+
+    @property
+    def shape(self):
+        return self.log_odds.shape
+
+    def clear(self):
+        self.log_odds[:] = 0
+
+    # beams
+    # =================================================================
+    def endpoints(self, origins, angles, distances):
+        """
+        End of every beam in cells, floats
+
+        :param origins: (gx, gy) of the sensor, or one per beam
+        :param angles: degrees counterclockwise, 0 along +x
+        :param distances: cm
+        :return: x0, y0, x1, y1 arrays
+        """
+        angles = np.radians(np.asarray(angles, dtype=float))
+        distances = np.asarray(distances, dtype=float) * self.resolution / 100
+        origins = np.broadcast_to(np.asarray(origins, dtype=float), (len(angles), 2))
+        x0, y0 = origins[:, 0], origins[:, 1]
+        return x0, y0, x0 + distances * np.cos(angles), y0 - distances * np.sin(angles)
+
+    @staticmethod
+    def ray_cells(x0, y0, x1, y1):
+        """
+        Cells crossed by every beam from (x0, y0) to (x1, y1), the end cells
+        excluded, all beams at once
+
+        :return: gx, gy int arrays, beam after beam
+        """
+        sx = np.floor(x0).astype(np.int64)
+        sy = np.floor(y0).astype(np.int64)
+        dx = np.floor(x1).astype(np.int64) - sx
+        dy = np.floor(y1).astype(np.int64) - sy
+        steps = np.maximum(np.abs(dx), np.abs(dy))
+        beam = np.repeat(np.arange(len(steps)), steps)
+        # step number along its own beam
+        k = np.arange(len(beam)) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = k / np.maximum(steps, 1)[beam]
+        gx = sx[beam] + np.rint(t * dx[beam]).astype(np.int64)
+        gy = sy[beam] + np.rint(t * dy[beam]).astype(np.int64)
+        return gx, gy
+
+    def _cells(self, gx, gy):
+        # keys of the cells inside the grid, each once: flat indices
+        rows, columns = self.shape
+        inside = (gx >= 0) & (gx < columns) & (gy >= 0) & (gy < rows)
+        return np.unique(gy[inside] * columns + gx[inside])
+
+    def _add(self, keys, value):
+        self._add_flat(self.log_odds, keys, value)
+
+    def _add_flat(self, array, index, value):
+        flat = array.reshape(-1)
+        if self.scale != 1:
+            value = round(value * self.scale)
+        cells = flat[index].astype(np.float32) + value
+        flat[index] = np.clip(cells, L_MIN * self.scale, L_MAX * self.scale).astype(self.dtype)
+
+    def update(self, origins, angles, distances, max_range=MAX_RANGE, min_range=MIN_RANGE):
+        """
+        Add a batch of readings, eg: a head sweep. In one batch a cell is
+        updated once, a hit wins over the beams crossing it.
+
+        :param origins: (gx, gy) of the sensor in cells, or one per reading
+        :param angles: degrees counterclockwise in the map frame, 0 along +x
+        :param distances: cm, <= min_range skipped (no echo is -1), beyond
+                          max_range only clear the cells up to max_range
+        :return: number of occupied and of free cell updates
+        :rtype: tuple
+        """
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        distances = np.atleast_1d(np.asarray(distances, dtype=float))
+        origins = np.asarray(origins, dtype=float)
+        valid = distances > min_range
+        if origins.ndim == 2:
+            origins = origins[valid]
+        angles = angles[valid]
+        distances = distances[valid]
+        if len(angles) == 0:
+            return 0, 0
+        hit = distances < max_range
+        x0, y0, x1, y1 = self.endpoints(origins, angles, np.minimum(distances, max_range))
+        gx, gy = self.ray_cells(x0, y0, x1, y1)
+        hits = self._cells(np.floor(x1[hit]).astype(np.int64), np.floor(y1[hit]).astype(np.int64))
+        free = np.setdiff1d(self._cells(gx, gy), hits, assume_unique=True)
+        self._add(free, L_FREE)
+        self._add(hits, L_OCC)
+        return len(hits), len(free)
+
+    # queries
+    # =================================================================
+    def probability(self):
+        """
+        :return: occupancy probability of every cell, 0.5 unknown
+        :rtype: numpy.ndarray
+        """
+        return 1 - 1 / (1 + np.exp(self.log_odds.astype(np.float32) / self.scale))
+
+    def occupied(self):
+        """
+        :return: bool array, True where occupied
+        """
+        return self.log_odds > L_THRESHOLD * self.scale
+
+    def is_occupied(self, gx, gy):
+        rows, columns = self.shape
+        if 0 <= gx < columns and 0 <= gy < rows:
+            return self.log_odds.item(gy, gx) > L_THRESHOLD * self.scale
+        return False
+
+    def render(self, occupied='#', free='.', unknown='.'):
+        """
+        The legacy string map, one string per row
+
+        :param unknown: character of the cells never seen, the legacy map
+                        draws them as free
+        :rtype: list
+        """
+        return self._render(self.log_odds, occupied, free, unknown)
+
+    def _render(self, log_odds, occupied, free, unknown):
+        chars = np.full(log_odds.shape, unknown, dtype='<U1')
+        chars[log_odds < 0] = free
+        chars[log_odds > L_THRESHOLD * self.scale] = occupied
+        return [''.join(row) for row in chars]
+
+
+class TiledOccupancyGrid(OccupancyGrid):
+    """
+    OccupancyGrid without bounds, any cell, negative included. A cell is
+    one dict lookup and one array index away, whatever the map size.
+
+    :param resolution: cells per metre
+    :type resolution: float
+    :param dtype: numpy.int8 by default, a quarter of float32
+    :param tile_size: cells per tile side
+    :param max_tiles: tiles kept in memory, the furthest from the last
+                      update go to spill_dir past that, None keeps all
+    :param spill_dir: directory of the evicted tiles, a temporary one by default
+    """
+
+    TILE_SIZE = 64  # cells, 12.8 m at 5 cells per metre
+    MAX_TILES = 256  # 1 MB of int8 tiles
+    KEY_OFFSET = 1 << 30  # cell keys pack gx and gy in an int64, |gx|, |gy| < 2**30
+
+    def __init__(self, resolution=5, dtype=np.int8, tile_size=TILE_SIZE, max_tiles=MAX_TILES,
+                 spill_dir=None):
+        self.resolution = float(resolution)
+        self.dtype = np.dtype(dtype)
+        self.scale = 1 if self.dtype.kind == 'f' else INT_SCALE
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.spill_dir = spill_dir
+        self.tiles = {}  # (tx, ty): array [row, column]
+        self.spilled = {}  # (tx, ty): file of the compressed tile
+        self.centre = (0, 0)  # tile of the last update, eviction keeps the tiles around it
+        self.evictions = 0
+        self.loads = 0
+
+    def clear(self):
+        for path in self.spilled.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.tiles.clear()
+        self.spilled.clear()
+
+    # tiles
+    # =================================================================
+    def tile(self, tx, ty, create=False):
+        """
+        :param create: make an unknown tile if it does not exist
+        :return: the tile array, None if unknown and not created
+        """
+        key = (tx, ty)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            return tile
+        if key in self.spilled:
+            tile = self._load(key)
+        elif create:
+            tile = np.zeros((self.tile_size, self.tile_size), dtype=self.dtype)
+        else:
+            return None
+        self.tiles[key] = tile
+        return tile
+
+    def _load(self, key):
+        path = self.spilled.pop(key)
+        with open(path, 'rb') as f:
+            data = zlib.decompress(f.read())
+        os.remove(path)
+        self.loads += 1
+        # frombuffer is read only
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.tile_size, self.tile_size).copy()
+
+    def _spill(self, key):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='pidog_map_')
+        path = os.path.join(self.spill_dir, f'{key[0]}_{key[1]}.tile')
+        with open(path, 'wb') as f:
+            f.write(zlib.compress(self.tiles.pop(key).tobytes()))
+        self.spilled[key] = path
+        self.evictions += 1
+
+    def evict(self):
+        """
+        Compress the tiles furthest from the last update to disk, down to max_tiles
+        """
+        if self.max_tiles is None or len(self.tiles) <= self.max_tiles:
+            return
+        cx, cy = self.centre
+        keys = sorted(self.tiles, key=lambda k: max(abs(k[0] - cx), abs(k[1] - cy)))
+        for key in keys[self.max_tiles:]:
+            self._spill(key)
+
+    def memory(self):
+        """
+        :return: tiles in memory and on disk, and their bytes
+        :rtype: dict
+        """
+        return {
+            'tiles': len(self.tiles),
+            'bytes': sum(tile.nbytes for tile in self.tiles.values()),
+            'spilled': len(self.spilled),
+            'spilled_bytes': sum(os.path.getsize(path) for path in self.spilled.values()),
+        }
+
+    # cells
+    # =================================================================
+    def _cells(self, gx, gy):
+        # keys of the cells, each once: gx and gy packed in an int64
+        return np.unique(((gx + self.KEY_OFFSET) << 32) | (gy + self.KEY_OFFSET))
+
+    def _add(self, keys, value):
+        gx = (keys >> 32) - self.KEY_OFFSET
+        gy = (keys & 0xFFFFFFFF) - self.KEY_OFFSET
+        tx, lx = np.divmod(gx, self.tile_size)
+        ty, ly = np.divmod(gy, self.tile_size)
+        local = ly * self.tile_size + lx
+        tile_keys = ((tx + self.KEY_OFFSET) << 32) | (ty + self.KEY_OFFSET)
+        order = np.argsort(tile_keys, kind='stable')
+        tile_keys, starts = np.unique(tile_keys[order], return_index=True)
+        for tile_key, index in zip(tile_keys, np.split(order, starts[1:])):
+            tile = self.tile(int(tx[index[0]]), int(ty[index[0]]), create=True)
+            self._add_flat(tile, local[index], value)
+
+    def update(self, origins, angles, distances, max_range=OccupancyGrid.MAX_RANGE,
+               min_range=OccupancyGrid.MIN_RANGE):
+        """
+        OccupancyGrid.update(), then evict()
+        """
+        origins = np.asarray(origins, dtype=float)
+        if len(origins):
+            x, y = origins.reshape(-1, 2)[-1]
+            self.centre = (int(x // self.tile_size), int(y // self.tile_size))
+        result = OccupancyGrid.update(self, origins, angles, distances, max_range, min_range)
+        self.evict()
+        return result
+
+    def value(self, gx, gy):
+        """
+        :return: log-odds of a cell, 0 if unknown
+        :rtype: float
+        """
+        tx, lx = divmod(gx, self.tile_size)
+        ty, ly = divmod(gy, self.tile_size)
+        tile = self.tile(tx, ty)
+        if tile is None:
+            return 0.0
+        return tile.item(ly, lx) / self.scale
+
+    def is_occupied(self, gx, gy):
+        return self.value(gx, gy) > L_THRESHOLD
+
+    # windows
+    # =================================================================
+    def bounds(self):
+        """
+        :return: (gx, gy, columns, rows) of all the tiles, None if empty
+        """
+        keys = list(self.tiles) + list(self.spilled)
+        if len(keys) == 0:
+            return None
+        xs = [k[0] for k in keys]
+        ys = [k[1] for k in keys]
+        return (min(xs) * self.tile_size, min(ys) * self.tile_size,
+                (max(xs) - min(xs) + 1) * self.tile_size, (max(ys) - min(ys) + 1) * self.tile_size)
+
+    def window(self, gx, gy, columns, rows):
+        """
+        :return: log-odds of the cells gx..gx+columns, gy..gy+rows, [row, column]
+        :rtype: numpy.ndarray
+        """
+        out = np.zeros((rows, columns), dtype=self.dtype)
+        size = self.tile_size
+        for ty in range(gy // size, (gy + rows - 1) // size + 1):
+            for tx in range(gx // size, (gx + columns - 1) // size + 1):
+                tile = self.tile(tx, ty)
+                if tile is None:
+                    continue
+                x0, y0 = max(gx, tx * size), max(gy, ty * size)
+                x1, y1 = min(gx + columns, (tx + 1) * size), min(gy + rows, (ty + 1) * size)
+                out[y0 - gy:y1 - gy, x0 - gx:x1 - gx] = tile[y0 - ty * size:y1 - ty * size,
+                                                            x0 - tx * size:x1 - tx * size]
+        # the spilled tiles read for this window go back to disk
+        self.evict()
+        return out
+
+    def probability(self, bounds=None):
+        """
+        :param bounds: (gx, gy, columns, rows), all the tiles by default
+        """
+        window = self.window(*(bounds or self.bounds() or (0, 0, 0, 0)))
+        return 1 - 1 / (1 + np.exp(window.astype(np.float32) / self.scale))
+
+    def occupied(self, bounds=None):
+        window = self.window(*(bounds or self.bounds() or (0, 0, 0, 0)))
+        return window > L_THRESHOLD * self.scale
+
+    def render(self, bounds=None, occupied='#', free='.', unknown='.'):
+        """
+        The legacy string map of a window, one string per row
+
+        :param bounds: (gx, gy, columns, rows), all the tiles by default
+        :rtype: list
+        """
+        window = self.window(*(bounds or self.bounds() or (0, 0, 0, 0)))
+        return self._render(window, occupied, free, unknown)
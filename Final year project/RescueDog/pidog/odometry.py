@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+'''
+Odometry, the pose of the dog on the floor from the legs frames it
+executed and the gyro yaw.
+
+Every legs frame (preset Walk / Trot actions, streaming gait, ...) is
+turned back into feet coordinates. The feet on the ground, the lowest
+ones in both frames, do not slip on the floor, so the body moved forward
+by as much as they moved back. On two feet (trot, fast streaming gait)
+a diagonal pair is no support and the body may tip onto a swing foot,
+the step is two_feet_stride times the commanded stride (the streaming
+gait velocity * dt, or the step length of a preset action). 1.0 trusts
+the command; calibrate it on the floor the dog walks on: reset(), trot a
+measured distance, then two_feet_stride *= measured / odometry.distance
+(Pidog.odometry.two_feet_stride on the dog).
+The turn is the imu yaw change over the frame, less the gyro drift learnt
+while the legs were idle, or without imu or after an idle time, the
+difference between the right and left feet.
+Frames where the feet on the ground change height (stand, sit, ...) are
+posture changes, not steps, and move nothing.
+
+The pose is x forward of the start pose, y to the left, in cm, theta in
+degrees counterclockwise, the frame of Pidog.heading_at and of the sim
+maps. Its covariance grows with the distance walked, the turns and the
+time, like an EKF prediction step.
+
+    odometry = Odometry(Pidog.LEG, Pidog.FOOT, Pidog.BODY_WIDTH)
+    odometry.legs_frame(angles, yaw=my_dog.yaw)
+    x, y, theta = odometry.pose()
+'''
+import threading
+import numpy as np
+from math import sin, cos, atan2, radians, degrees, sqrt
+from time import time
+from .kinematics import legs_angles2coords
+
+LEFT_LEGS = [0, 2]
+RIGHT_LEGS = [1, 3]
+
+
+class Odometry():
+    """
+    :param leg: upper leg length, mm
+    :param foot: lower leg length, mm
+    :param body_width: mm, between the left and right shoulders
+    :param pose: (x, y, theta) start pose, cm and degrees
+    :param two_feet_stride: part of the commanded stride covered on two
+                            feet, 1.0 until calibrated on hardware
+    """
+
+    STANCE_TOLERANCE = 3  # mm, feet this close to the lowest one are on the ground
+    MAX_FRAME_STEP = 50  # mm, feet on the ground moving more are not a step
+    MAX_FRAME_GAP = 1.2  # second, longer than any frame: the legs were idle, the yaw change is drift
+    DRIFT_TIME = 10  # second, idle time to fully trust a new yaw drift rate
+    MAX_DRIFT_RATE = 5  # degree per second, faster idle yaw changes are the dog being moved
+    # variances, growing like a random walk
+    DISTANCE_NOISE = 0.1  # cm^2 per cm walked, slip
+    TWO_FEET_NOISE = 0.5  # cm^2 per cm walked on two feet, the share of the stride varies
+    LATERAL_NOISE = 0.02  # cm^2 per cm walked, sideways drift
+    TURN_NOISE = 0.2  # degree^2 per degree turned
+    YAW_DRIFT = 0.04  # degree^2 per second, gyro yaw drift
+
+    def __init__(self, leg, foot, body_width, pose=(0, 0, 0), two_feet_stride=1.0):
+        self.leg = leg
+        self.foot = foot
+        self.body_width = body_width
+        self.two_feet_stride = two_feet_stride
+        self._lock = threading.Lock()
+        self.reset(pose)
+
+    def reset(self, pose=(0, 0, 0), covariance=None):
+        """
+        :param pose: (x, y, theta), cm and degrees
+        :param covariance: 3 * 3, cm and degrees, zero by default
+        """
+        with self._lock:
+            self.x, self.y, self.theta = [float(v) for v in pose]
+            self.P = np.zeros((3, 3)) if covariance is None else np.array(covariance, dtype=float)
+            self.distance = 0.0  # cm walked, for stats
+            self.steps = 0  # frames that moved the body
+            self._feet = None
+            self._yaw = None
+            self._time = None
+            self.yaw_drift_rate = 0.0  # degree per second, learnt while the legs are idle
+
+    def pose(self):
+        """
+        :return: (x, y, theta), cm and degrees
+        :rtype: tuple
+        """
+        with self._lock:
+            return self.x, self.y, self.theta
+
+    def covariance(self):
+        """
+        :return: 3 * 3 covariance of (x, y, theta), cm and degrees
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            return self.P.copy()
+
+    def legs_frame(self, angles, yaw=None, timestamp=None, stride=None):
+        """
+        Add an executed legs frame
+
+        :param angles: 8 legs servo angles, as given to servo_move
+        :param yaw: imu yaw at this frame, degrees counterclockwise, None
+                    to take the turn from the feet
+        :param timestamp: time.time() of the frame, now by default
+        :param stride: commanded body step of this frame, cm forward, None
+                       for a preset action, whose feet on the ground move
+                       by its step length
+        :return: (forward, turn) of this frame, cm and degrees
+        :rtype: tuple
+        """
+        timestamp = time() if timestamp is None else timestamp
+        feet = legs_angles2coords(angles, self.leg, self.foot)
+        contact = feet[:, 1] >= feet[:, 1].max() - self.STANCE_TOLERANCE
+        with self._lock:
+            last_feet, last_yaw, last_time = self._feet, self._yaw, self._time
+            self._feet, self._yaw, self._time = (feet, contact), yaw, timestamp
+        if last_feet is None:
+            return 0.0, 0.0
+        stance = contact & last_feet[1]
+        if np.count_nonzero(stance) < 2:
+            return 0.0, 0.0
+        # feet y points back, the body moved forward as much as its feet on the ground moved back
+        moved = feet[:, 0] - last_feet[0][:, 0]
+        lifted = np.abs(feet[:, 1] - last_feet[0][:, 1])
+        if np.any(lifted[stance] > self.STANCE_TOLERANCE) or np.any(np.abs(moved[stance]) > self.MAX_FRAME_STEP):
+            # posture change
+            return 0.0, 0.0
+        two_feet = np.count_nonzero(stance) == 2
+        if two_feet:
+            if stride is None:
+                # the action's step length, both feet on the ground move by it
+                stride = float(np.median(moved[stance])) / 10
+            forward = self.two_feet_stride * stride
+        else:
+            forward = float(moved[stance].mean()) / 10
+        dt = 0.0 if last_time is None else max(0.0, timestamp - last_time)
+        if dt > self.MAX_FRAME_GAP:
+            if yaw is not None and last_yaw is not None:
+                self._learn_drift((yaw - last_yaw + 180) % 360 - 180, dt)
+            dt = 0.0
+            last_yaw = None
+        if yaw is not None and last_yaw is not None:
+            turn = (yaw - last_yaw + 180) % 360 - 180 - self.yaw_drift_rate * dt
+        else:
+            left = stance[LEFT_LEGS]
+            right = stance[RIGHT_LEGS]
+            turn = 0.0
+            if left.any() and right.any():
+                # right feet pushing back more turn the body left
+                push = moved[RIGHT_LEGS][right].mean() - moved[LEFT_LEGS][left].mean()
+                turn = degrees(atan2(push, self.body_width))
+        noise = self.TWO_FEET_NOISE if two_feet else self.DISTANCE_NOISE
+        self.move(forward, turn, dt=dt, distance_noise=noise)
+        return forward, turn
+
+    def _learn_drift(self, change, dt):
+        # the dog stood still, the yaw change is the gyro drift
+        rate = change / dt
+        if abs(rate) > self.MAX_DRIFT_RATE:
+            return
+        weight = min(1.0, dt / self.DRIFT_TIME)
+        self.yaw_drift_rate += (rate - self.yaw_drift_rate) * weight
+
+    def move(self, forward, turn, left=0.0, dt=0.0, distance_noise=DISTANCE_NOISE):
+        """
+        Dead reckoning step in the body frame, the covariance grows with it
+
+        :param forward: cm
+        :param turn: degrees, counterclockwise
+        :param left: cm, sideways
+        :param dt: seconds since the last step, gyro drift
+        :param distance_noise: cm^2 per cm of this step
+        """
+        with self._lock:
+            heading = radians(self.theta + turn / 2)
+            c, s = cos(heading), sin(heading)
+            dx = forward * c - left * s
+            dy = forward * s + left * c
+            self.x += dx
+            self.y += dy
+            self.theta = (self.theta + turn + 180) % 360 - 180
+            distance = sqrt(forward ** 2 + left ** 2)
+            if distance > 0:
+                self.distance += distance
+                self.steps += 1
+            # x, y depend on theta through the heading, theta is in degrees
+            F = np.array([[1, 0, -dy * np.pi / 180],
+                          [0, 1, dx * np.pi / 180],
+                          [0, 0, 1]])
+            # forward, left and turn noise, rotated into the map frame
+            G = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+            Q = np.diag([distance_noise * distance,
+                         self.LATERAL_NOISE * distance,
+                         self.TURN_NOISE * abs(turn) + self.YAW_DRIFT * dt])
+            self.P = F @ self.P @ F.T + G @ Q @ G.T
@@ -1,16 +1,32 @@
 #!/usr/bin/env python3
 import os
 import sys
-from time import sleep, time
-from multiprocessing import Process, Value, Lock
+import pwd
+from time import sleep, time, perf_counter
+from multiprocessing import Process, Value, Lock, Queue
+import queue
 import threading
 import numpy as np
 from math import pi, sin, cos, sqrt, acos, atan2, atan
-from robot_hat import Robot, Pin, Ultrasonic, utils, Music, I2C
+from .backend import Robot, Pin, Ultrasonic, utils, Music, I2C
 from .sh3001 import Sh3001
 from .rgb_strip import RGBStrip
 from .sound_direction import SoundDirection
 from .dual_touch import DualTouch
+from .action_buffer import ActionBuffer, crossfade
+from .servo_scheduler import ServoScheduler, ServoTrack
+from .kinematics import legs_angle_batch, body_struct, PoseEngine
+from .gait import GaitGenerator
+from .imu_fusion import ComplementaryFilter, ImuHistory
+from .imu_calibration import ImuCalibrationCache, DriftCheck
+from .odometry import Odometry
+from .head_scan import HeadTrajectory
+from .sensor_bus import SensorBus
+from .distance_sampler import DistanceFilter, DistanceTrigger, DistanceRecorder
+from .balance import BalanceController
+from .audio_engine import AudioEngine
+from .telemetry import LoopStats, BusCounter, BusProxy, count_transactions, timed
+from .console import print_color, info, debug, warn, error, GRAY, RED, GREEN, YELLOW, BLUE, PURPLE, DARK_GREEN, WHITE
 import warnings
 warnings.filterwarnings("ignore") # ignore warnings for pygame # not work
 
@@ -40,36 +56,17 @@ warnings.filterwarnings("ignore") # ignore warnings for pygame # not work
 
 # user and User home directory
 is_run_with_root = (os.geteuid() == 0)
-User = os.popen('echo ${SUDO_USER:-$LOGNAME}').readline().strip()
-UserHome = os.popen('getent passwd %s | cut -d: -f 6' %User).readline().strip()
+# same as `echo ${SUDO_USER:-$LOGNAME}` and `getent passwd`, without spawning shells at import
+User = os.environ.get('SUDO_USER') or os.environ.get('LOGNAME', '')
+try:
+    UserHome = pwd.getpwnam(User).pw_dir
+except KeyError:
+    UserHome = os.path.expanduser('~')
 config_file = '%s/.config/pidog/pidog.conf' % UserHome
-
-# color:
-# https://gist.github.com/rene-d/9e584a7dd2935d0f461904b9f2950007
-# 1;30:gray 31:red, 32:green, 33:yellow, 34:blue, 35:purple, 36:dark green, 37:white
-GRAY = '1;30'
-RED = '0;31'
-GREEN = '0;32'
-YELLOW = '0;33'
-BLUE = '0;34'
-PURPLE = '0;35'
-DARK_GREEN = '0;36'
-WHITE = '0;37'
-
-def print_color(msg, end='\n', file=sys.stdout, flush=False, color=''):
-    print('\033[%sm%s\033[0m'%(color, msg), end=end, file=file, flush=flush)
-
-def info(msg, end='\n', file=sys.stdout, flush=False):
-    print_color(msg, end=end, file=file, flush=flush, color=WHITE)
-
-def debug(msg, end='\n', file=sys.stdout, flush=False):
-    print_color(msg, end=end, file=file, flush=flush, color=GRAY)
-
-def warn(msg, end='\n', file=sys.stdout, flush=False):
-    print_color(msg, end=end, file=file, flush=flush, color=YELLOW)
-
-def error(msg, end='\n', file=sys.stdout, flush=False):
-    print_color(msg, end=end, file=file, flush=flush, color=RED)
+# precompiled actions, made by: python3 -m pidog.actions_dictionary
+actions_table_file = '%s/.config/pidog/actions_table.npz' % UserHome
+# imu offsets per temperature band, written by the imu thread
+imu_calibration_file = '%s/.config/pidog/imu_calibration.npz' % UserHome
 
 
 def compare_version(original_version, object_version):
@@ -91,11 +88,7 @@ class Pidog():
     FOOT = 76
     BODY_LENGTH = 117
     BODY_WIDTH = 98
-    BODY_STRUCT = numpy_mat([
-        [-BODY_WIDTH / 2, -BODY_LENGTH / 2,  0],
-        [BODY_WIDTH / 2, -BODY_LENGTH / 2,  0],
-        [-BODY_WIDTH / 2,  BODY_LENGTH / 2,  0],
-        [BODY_WIDTH / 2,  BODY_LENGTH / 2,  0]]).T
+    BODY_STRUCT = body_struct(BODY_WIDTH, BODY_LENGTH)
     SOUND_DIR = f"{UserHome}/pidog/sounds/"
     # Servo Speed
     # HEAD_DPS = 300
@@ -123,34 +116,97 @@ class Pidog():
     HEAD_PITCH_MIN = -45
     HEAD_PITCH_MAX = 30
 
+    MCU_RESET_TIME = 0.2  # second, wait after utils.reset_mcu() before using the servos
+    ACTION_WAIT_TIMEOUT = 0.1  # second, max blocking time of action threads before checking exit_flag
+    ULTRASONIC_FAST_INTERVAL = 0.02  # second, ultrasonic sampling while the legs or the head move
+    ULTRASONIC_SLOW_INTERVAL = 0.1  # second, ultrasonic sampling at rest
+    SENSOR_BUS_RATE = 50  # Hz, touch and sound direction sampling for the sensor bus
+    BATTERY_INTERVAL = 1  # second, battery sampling for the sensor bus
+    IMU_RATE = 200  # Hz, imu thread sample rate, the SH3001 runs at 500 Hz ODR
+    GAIT_SPEED = 100  # legs speed while streaming gait frames, one frame per servo step
+    GAIT_MAX_FRAME_TIME = 0.1  # second, longer gaps between gait frames (first frame, stall) count as one nominal frame
+    HEAD_SWEEP_TIME = 0.8  # second, head_sweep() from one side to the other
+    POSE_ENGINE_EXACT = True  # pose2legs_angle bit-for-bit equal to the previous np.matrix code, see PoseEngine
+
     # init
     def __init__(self, leg_pins=DEFAULT_LEGS_PINS, head_pins=DEFAULT_HEAD_PINS, tail_pin=DEFAULT_TAIL_PIN,
-                 leg_init_angles=None, head_init_angles=None, tail_init_angle=None):
-
+                 leg_init_angles=None, head_init_angles=None, tail_init_angle=None,
+                 servo_scheduler=False, servo_rate=ServoScheduler.DEFAULT_RATE,
+                 actions_table=actions_table_file, profile_startup=False,
+                 imu_calibration=imu_calibration_file, stats_interval=None):
+        """
+        :param servo_scheduler: drive legs, head and tail from one fixed-rate loop
+                                instead of one thread per group
+        :type servo_scheduler: bool
+        :param servo_rate: rate of the servo loop in Hz, used with servo_scheduler
+        :type servo_rate: int
+        :param actions_table: precompiled actions table (.npz) to load if it exists, None to skip
+        :type actions_table: str
+        :param profile_startup: print the time of every startup stage, see startup_report()
+        :type profile_startup: bool
+        :param imu_calibration: imu offsets cache (.npz), None to calibrate on every start
+        :type imu_calibration: str
+        :param stats_interval: seconds, print stats_report() periodically, None to disable
+        :type stats_interval: float
+        """
+        self.imu_calibration = imu_calibration
+        # run time telemetry, see stats()
+        self.stats_interval = stats_interval
+        self.loop_stats = {}  # thread name: LoopStats, added when the thread starts
+        self.i2c_stats = BusCounter('i2c')
+        self.spi_stats = BusCounter('spi')
+        self.stats_start = perf_counter()
+        startup_start = perf_counter()
+        self.startup_times = []  # (stage, seconds)
+        self._music = None
+        self._music_lock = threading.Lock()
+        # imu, rgb_strip, dual_touch, ears: built on first use, None if their init failed
+        self._peripherals = {}
+        self._peripheral_locks = {name: threading.Lock() for name in ['imu', 'rgb_strip', 'dual_touch', 'ears']}
+        self._audio = None
+        self._audio_error = None  # why the audio engine failed to start, not retried
+        self._audio_lock = threading.Lock()
+        self.thread_list = []
 
-        utils.reset_mcu()
-        sleep(0.2)
+        self._startup_stage('reset_mcu', utils.reset_mcu)
+        mcu_ready = perf_counter() + self.MCU_RESET_TIME
 
-        from .actions_dictionary import ActionDict
-        self.actions_dict = ActionDict()
+        # read by the peripheral watchers (sound_direction heading_at), before they start
+        self.pitch = 0
+        self.roll = 0
+        self.yaw = 0
+        # imu samples, read these instead of accData / gyroData / roll / pitch for consistent values
+        self.imu_history = ImuHistory()
+        self.imu_filter = ComplementaryFilter()
+        # pose on the floor from the executed legs frames and the imu yaw, see odometry.pose()
+        self.odometry = Odometry(self.LEG, self.FOOT, self.BODY_WIDTH)
+        self.imu_acc_offset = [0, 0, 0]
+        self.imu_gyro_offset = [0, 0, 0]
+        self.accData = [0, 0, 0]  # ax,ay,az
+        self.gyroData = [0, 0, 0]  # gx,gy,gz
+        self.imu_fail_count = 0
+        self.rgb_thread_run = True
+        self.rgb_fail_count = 0
+        self.touch = 'N'
+
+        self._startup_stage('actions_dict', self._init_actions_dict, actions_table)
 
         self.body_height = 80
-        self.pose = numpy_mat([0.0,  0.0,  self.body_height]).T  # target position vector
+        self.pose = np.array([[0.0],  [0.0],  [self.body_height]])  # target position vector
+        # ndarray pose engine, pose_engine.pose2legs_angle also takes batches of (rpy, pose, legs coords)
+        self.pose_engine = PoseEngine(self.LEG, self.FOOT, self.BODY_WIDTH, self.BODY_LENGTH, self.body_height,
+                                      exact=self.POSE_ENGINE_EXACT)
+        self.legs_coords = None
         self.rpy = np.array([0.0,  0.0,  0.0]) * pi / 180  # Euler angle, converted to radian value
-        self.leg_point_struc = numpy_mat([
-            [-self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2,  0],
-            [self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2,  0],
-            [-self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2,  0],
-            [self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2,  0]
-        ]).T
-        self.pitch = 0
-        self.roll = 0
+        self.leg_point_struc = self.BODY_STRUCT.copy()
 
         self.roll_last_error = 0
         self.roll_error_integral = 0
         self.pitch_last_error = 0
         self.pitch_error_integral = 0
         self.target_rpy = [0, 0, 0]
+        # fixed-rate roll/pitch PID, see balance_start()
+        self.balance = BalanceController(lambda: (self.roll, self.pitch), rate=self.IMU_RATE)
 
         if leg_init_angles == None:
             leg_init_angles = self.actions_dict['lie'][0][0]
@@ -162,112 +218,385 @@ class Pidog():
         if tail_init_angle == None:
             tail_init_angle = [0]
 
-        self.thread_list = []
+        delay = mcu_ready - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        self.startup_times.append(('mcu_wait', max(0, delay)))
+        stage_start = perf_counter()
 
         try:
             debug(f"config_file: {config_file}")
             debug("robot_hat init ... ", end='', flush=True)
-            self.legs = Robot(pin_list=leg_pins, name='legs', init_angles=leg_init_angles, init_order=[
-                            0, 2, 4, 6, 1, 3, 5, 7], db=config_file)
-            self.head = Robot(pin_list=head_pins, name='head',
-                            init_angles=head_init_angles, db=config_file)
-            self.tail = Robot(pin_list=tail_pin, name='tail',
-                            init_angles=tail_init_angle, db=config_file)
-            # add thread
-            self.thread_list.extend(["legs", "head", "tail"])
+            # robot_hat waits after every servo it sets, the groups are on separate channels: all at once
+            robots = self._init_robots([
+                ('legs', dict(pin_list=leg_pins, init_angles=leg_init_angles, init_order=[0, 2, 4, 6, 1, 3, 5, 7])),
+                ('head', dict(pin_list=head_pins, init_angles=head_init_angles)),
+                ('tail', dict(pin_list=tail_pin, init_angles=tail_init_angle))])
+            self.legs, self.head, self.tail = robots
             # via
             self.legs.max_dps = self.LEGS_DPS
             self.head.max_dps = self.HEAD_DPS
             self.tail.max_dps = self.TAIL_DPS
+            # every servo is one pwm channel of the mcu, on the i2c bus
+            for name, robot in [('legs', self.legs), ('head', self.head), ('tail', self.tail)]:
+                for servo in robot.servo_list:
+                    count_transactions(servo, self.i2c_stats, name)
 
-            self.legs_action_buffer = []
-            self.head_action_buffer = []
-            self.tail_action_buffer = []
-
-            self.legs_thread_lock = threading.Lock()
-            self.head_thread_lock = threading.Lock()
-            self.tail_thread_lock = threading.Lock()
+            self.legs_action_buffer = ActionBuffer()
+            self.head_action_buffer = ActionBuffer()
+            self.tail_action_buffer = ActionBuffer()
 
             self.legs_actions_coords_buffer = []
 
             self.leg_current_angles = leg_init_angles
             self.head_current_angles = head_init_angles
+            # yaw of the executed head frames, see head_yaw_at()
+            self.head_trajectory = HeadTrajectory()
             self.tail_current_angles = tail_init_angle
 
             self.legs_speed = 90
             self.head_speed = 90
             self.tail_speed = 90
 
+            # streaming gait, see set_velocity()
+            self.gait = GaitGenerator(frame_rate=servo_rate if servo_scheduler else GaitGenerator.FRAME_RATE)
+            self.gait_streaming = False
+            self.gait_stopping = False
+            self.gait_stride = 0.0  # cm, commanded body step of the last gait frame, for the odometry
+            self._gait_time = None  # perf_counter() of the last gait frame
+
+            self.servo_scheduler = None
+            if servo_scheduler:
+                self.servo_scheduler = ServoScheduler([
+                    ServoTrack('legs', self.legs, self.legs_action_buffer,
+                               lambda: self.legs_speed, on_frame=self._on_legs_frame,
+                               source=self._gait_frame, source_active=lambda: self.gait_streaming),
+                    ServoTrack('head', self.head, self.head_action_buffer,
+                               lambda: self.head_speed, transform=self._head_servo_angles,
+                               on_frame=self._on_head_frame),
+                    ServoTrack('tail', self.tail, self.tail_action_buffer,
+                               lambda: self.tail_speed, on_frame=self._on_tail_frame),
+                ], rate=servo_rate)
+
             # done
             debug("done")
         except OSError:
             error("fail")
             raise OSError("rotbot_hat I2C init failed. Please try again.")
+        self.startup_times.append(('servos', perf_counter() - stage_start))
+
+        # the imu and rgb threads build their peripheral, and end if it failed
+        self.thread_list = ["legs", "head", "tail", "imu", "rgb"]
+
+        self.distance = Value('f', -1.0)
+        # filtered (time, distance) samples from the sensory process, see watch_distance()
+        self.distance_queue = Queue(maxsize=64)
+        self.distance_sample = (0.0, -1.0)
+        self.distance_triggers = []
+        self.distance_recorders = []
+        self.ultrasonic_fast = Value('b', 1)
+        self.thread_list.append("distance")
+
+        # latest samples of every sensor in shared memory, see pidog/sensor_bus.py
+        try:
+            self.sensor_bus = SensorBus(create=True)
+            self.thread_list.append("sensor_bus")
+        except Exception as e:
+            self.sensor_bus = None
+            warn(f"sensor bus init failed: {e}")
+
+        self.sensory_process = None
+        self.sensory_lock = Lock()
 
+        self.exit_flag = False
+        self._startup_stage('action_threads', self.action_threads_start)
+        self._startup_stage('sensory_process', self.sensory_process_start)
+        self.startup_times.append(('total', perf_counter() - startup_start))
+        # open the audio output and decode the sounds in the background
+        audio_thread = threading.Thread(name='audio_init_thread', target=lambda: self.audio)
+        audio_thread.daemon = True
+        audio_thread.start()
+        if profile_startup:
+            info(self.startup_report())
+
+    # startup
+    def _startup_stage(self, name, func, *args):
+        start = perf_counter()
         try:
-            debug("imu_sh3001 init ... ", end='', flush=True)
-            self.imu = Sh3001(db=config_file)
-            self.imu_acc_offset = [0, 0, 0]
-            self.imu_gyro_offset = [0, 0, 0]
-            self.accData = [0, 0, 0]  # ax,ay,az
-            self.gyroData = [0, 0, 0]  # gx,gy,gz
-            self.imu_fail_count = 0
-            # add imu thread
-            self.thread_list.append("imu")
-            debug("done")
+            return func(*args)
+        finally:
+            self.startup_times.append((name, perf_counter() - start))
+
+    def startup_report(self):
+        """
+        Time of every startup stage, until 'total' the dog is ready to move.
+        'servos' builds the legs, head and tail robots at once, robot_hat
+        waits 0.15 s after every servo it sets, so the 8 legs servos take
+        1.2 s of it. imu, rgb_strip, dual_touch, ears and sound_effect appear
+        on first use (the imu, rgb and sensor bus threads use the first
+        four), imu_calibration when the imu thread is done calibrating.
+
+        :rtype: str
+        """
+        lines = ['startup times:']
+        for name, seconds in self.startup_times:
+            lines.append(f'  {name:<20}{seconds * 1000:>8.1f} ms')
+        return '\n'.join(lines)
+
+    def _init_robots(self, groups):
+        # [(name, Robot kwargs)], the robots in the same order, OSError if one failed
+        robots = {}
+
+        def init_robot(name, kwargs):
+            try:
+                robots[name] = Robot(name=name, db=config_file, **kwargs)
+            except OSError as e:
+                robots[name] = e
+        threads = [threading.Thread(target=init_robot, args=group) for group in groups]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for name, _ in groups:
+            if isinstance(robots[name], OSError):
+                raise robots[name]
+        return [robots[name] for name, _ in groups]
+
+    def _init_actions_dict(self, actions_table):
+        from .actions_dictionary import ActionDict
+        self.actions_dict = ActionDict()
+        if actions_table is not None:
+            try:
+                if self.actions_dict.load(actions_table):
+                    debug(f"actions_table: {actions_table}")
+            except Exception as e:
+                warn(f"actions table load failed: {e}")
+
+    # peripherals, built on first use from any thread, so every message is a single line
+    def _init_imu(self):
+        try:
+            imu = Sh3001(db=config_file)
+            count_transactions(imu, self.i2c_stats, 'imu')
+            debug("imu_sh3001 init ... done")
+            return imu
         except OSError:
-            error("fail")
+            error("imu_sh3001 init ... fail")
+            return None
 
+    def _init_rgb_strip(self):
         try:
-            debug("rgb_strip init ... ", end='', flush=True)
-            self.rgb_thread_run = True
-            self.rgb_strip = RGBStrip(addr=0X74, nums=11)
-            self.rgb_strip.set_mode('breath', 'black')
-            self.rgb_fail_count = 0
-            # add rgb thread
-            self.thread_list.append("rgb")
-            debug("done")
+            rgb_strip = RGBStrip(addr=0X74, nums=11)
+            rgb_strip.bus = BusProxy(rgb_strip.bus, self.i2c_stats, 'rgb_strip')
+            rgb_strip.set_mode('breath', 'black')
+            # wrapped once, action_threads_start runs again from close()
+            rgb_strip.display = timed(rgb_strip.display, self._loop_stats('rgb', ['display']), 'display')
+            debug("rgb_strip init ... done")
+            return rgb_strip
         except OSError:
-            error("fail")
+            error("rgb_strip init ... fail")
+            return None
 
+    def _init_dual_touch(self):
         try:
-            debug("dual_touch init ... ", end='', flush=True)
-            self.dual_touch = DualTouch('D2', 'D3')
-            self.touch = 'N'
-            debug("done")
+            dual_touch = DualTouch('D2', 'D3')
+            # gestures on the pin interrupts, see get() and subscribe()
+            dual_touch.start()
+            debug("dual_touch init ... done")
+            return dual_touch
         except:
-            error("fail")
+            error("dual_touch init ... fail")
+            return None
 
+    def _init_sound_direction(self):
         try:
-            debug("sound_direction init ... ", end='', flush=True)
-            self.ears = SoundDirection()
+            ears = SoundDirection()
+            ears.spi = BusProxy(ears.spi, self.spi_stats, 'sound_direction')
+            # every detection read once on the busy pin edge, bearings in the map frame
+            ears.watch(heading=self.heading_at)
             # self.sound_direction = -1
-            debug("done")
+            debug("sound_direction init ... done")
+            return ears
         except:
-            error("fail")
-
+            error("sound_direction init ... fail")
+            return None
+
+    def _peripheral(self, name, init):
+        # built once, a failed init is not retried
+        if name not in self._peripherals:
+            with self._peripheral_locks[name]:
+                if name not in self._peripherals:
+                    self._peripherals[name] = self._startup_stage(name, init)
+        return self._peripherals[name]
+
+    @property
+    def imu(self):
+        return self._peripheral('imu', self._init_imu)
+
+    @property
+    def rgb_strip(self):
+        return self._peripheral('rgb_strip', self._init_rgb_strip)
+
+    @property
+    def dual_touch(self):
+        return self._peripheral('dual_touch', self._init_dual_touch)
+
+    @property
+    def ears(self):
+        return self._peripheral('ears', self._init_sound_direction)
+
+    def _init_music(self):
         try:
-            debug("sound_effect init ... ", end='', flush=True)
-            self.music = Music()
-            debug("done")
+            music = Music()
+            debug("sound_effect init ... done")
+            return music
         except:
-            error("fail")
-
-        self.distance = Value('f', -1.0)
+            error("sound_effect init ... fail")
+            return None
 
-        self.sensory_process = None
-        self.sensory_lock = Lock()
-
-        self.exit_flag = False
-        self.action_threads_start()
-        self.sensory_process_start()
+    def _init_audio(self):
+        try:
+            # no sound when running in the vnc environment otherwise, once instead of on every speak
+            utils.run_command('sudo killall pulseaudio')
+            audio = AudioEngine(self.SOUND_DIR)
+            debug("audio_engine init ... done")
+            return audio
+        except Exception as e:
+            error(f"audio_engine init ... fail: {e}")
+            self._audio_error = e
+            return None
+
+    @property
+    def audio(self):
+        # one open output stream with every sound decoded, see pidog/audio_engine.py
+        if self._audio is None and self._audio_error is None:
+            with self._audio_lock:
+                if self._audio is None and self._audio_error is None:
+                    self._audio = self._startup_stage('audio_engine', self._init_audio)
+        return self._audio
+
+    @property
+    def music(self):
+        # the sound mixer is slow to start and often unused, init on first use
+        if self._music is None:
+            with self._music_lock:
+                if self._music is None:
+                    self._music = self._startup_stage('sound_effect', self._init_music)
+        return self._music
 
     def read_distance(self):
         return round(self.distance.value, 2)
 
+    def heading_at(self, timestamp):
+        """
+        Heading in the map frame at a time of the last seconds, the imu yaw
+        interpolated, degrees counterclockwise from the start heading
+
+        :param timestamp: time.time()
+        :return: degrees, None before the first imu sample
+        :rtype: float
+        """
+        return self.imu_history.at(timestamp, 'yaw')
+
+    def read_distance_sample(self):
+        """
+        Latest filtered ultrasonic sample
+
+        :return: (time, distance in cm), distance is -1 when there is no echo
+        :rtype: tuple
+        """
+        return self.distance_sample
+
+    def watch_distance(self, threshold, below=True, callback=None):
+        """
+        Get notified when the distance crosses a threshold, instead of polling read_distance()
+
+        :param threshold: cm
+        :type threshold: float
+        :param below: fire when an obstacle comes closer than threshold, otherwise when it goes further
+        :type below: bool
+        :param callback: callable(time, distance), run in the distance thread, optional
+        :type callback: callable
+        :return: trigger, trigger.wait(timeout) blocks until past the threshold,
+                 trigger.get(timeout) returns the next crossing
+        :rtype: DistanceTrigger
+        """
+        trigger = DistanceTrigger(threshold, below=below, callback=callback)
+        t, distance = self.distance_sample
+        if t > 0:
+            trigger.update(t, distance)
+        self.distance_triggers = self.distance_triggers + [trigger]
+        return trigger
+
+    def unwatch_distance(self, trigger):
+        self.distance_triggers = [item for item in self.distance_triggers if item is not trigger]
+        self.distance_recorders = [item for item in self.distance_recorders if item is not trigger]
+
+    def record_distance(self):
+        """
+        Keep every raw ultrasonic reading from now on, timestamped, until unwatch_distance()
+
+        :return: recorder, recorder.samples() returns the times and distances arrays
+        :rtype: DistanceRecorder
+        """
+        recorder = DistanceRecorder()
+        self.distance_recorders = self.distance_recorders + [recorder]
+        return recorder
+
+    def head_yaw_at(self, timestamps):
+        """
+        Head yaw servo angle at times of the last seconds, interpolated on
+        the executed head frames, degrees counterclockwise from the nose
+
+        :param timestamps: time.time() values, scalar or array
+        :return: degrees, float or array like timestamps, None before the first head frame
+        """
+        return self.head_trajectory.at(timestamps)
+
+    def head_sweep(self, start=HEAD_YAW_MIN, end=HEAD_YAW_MAX, duration=HEAD_SWEEP_TIME, pitch=0):
+        """
+        Scan with the ultrasonic while the head turns without stopping,
+        each reading at the head yaw of its timestamp. The sweep starts
+        from the side nearest to the head, the readings taken on the way
+        there count too.
+
+        :param start: degrees, head yaw at one side
+        :param end: degrees, head yaw at the other side
+        :param duration: seconds from one side to the other, HEAD_DPS is the limit
+        :param pitch: degrees, head pitch
+        :return: (angles, distances) lists, degrees counterclockwise from the
+                 nose and cm, -1 when there is no echo
+        :rtype: tuple
+        """
+        yaw = self.head.servo_positions[0]
+        if abs(yaw - end) < abs(yaw - start):
+            start, end = end, start
+        # one frame lasts 1 s at most at speed 0
+        count = max(1, int(np.ceil(duration)))
+        speed = (1000 - duration / count * 1000) / 9.9
+        frames = [[angle, 0, pitch] for angle in np.linspace(start, end, count + 1)[1:]]
+        recorder = self.record_distance()
+        self.ultrasonic_fast.value = 1
+        try:
+            if abs(yaw - start) > 0.5:
+                self.head_move([[start, 0, pitch]], immediately=True, speed=100)
+                # the sweep speed would apply to the frame in progress too
+                self._wait_head_yaw(start)
+            self.head_move(frames, immediately=True, speed=speed)
+            self._wait_head_yaw(end)
+        finally:
+            self.unwatch_distance(recorder)
+        times, distances = recorder.samples()
+        angles = self.head_yaw_at(times)
+        if angles is None:
+            return [], []
+        return np.round(angles, 1).tolist(), distances.tolist()
+
     # action related: legs,head,tail,imu,rgb_strip
     def close_all_thread(self):
         self.exit_flag = True
+        self.balance.stop()
+        if self.servo_scheduler is not None:
+            self.servo_scheduler.stop()
 
     def close(self):
         import signal
@@ -295,18 +624,31 @@ class Pidog():
             self.stop_and_lie()
             self.close_all_thread()
 
-            self.legs_thread.join()
-            self.head_thread.join()
-            self.tail_thread.join()
+            if self.servo_scheduler is not None:
+                self.servo_scheduler.join()
+            else:
+                self.legs_thread.join()
+                self.head_thread.join()
+                self.tail_thread.join()
 
             if 'rgb' in self.thread_list:
                 self.rgb_thread_run = False
+                # only if built, the thread may still be building it
+                if self._peripherals.get('rgb_strip') is not None:
+                    self._peripherals['rgb_strip'].wake()
                 self.rgb_strip_thread.join()
-                self.rgb_strip.close()
+                if self._peripherals.get('rgb_strip') is not None:
+                    self._peripherals['rgb_strip'].close()
             if 'imu' in self.thread_list:
                 self.imu_thread.join()
+            if 'sensor_bus' in self.thread_list:
+                self.sensor_bus_thread.join()
+            if 'distance' in self.thread_list:
+                self.distance_thread.join()
             if self.sensory_process != None:
                 self.sensory_process.terminate()
+            if self.sensor_bus is not None:
+                self.sensor_bus.close()
 
             info('Quit')
         except Exception as e:
@@ -345,88 +687,351 @@ class Pidog():
     def legs_switch(self, flag=False):
         self.legs_sw_flag = flag
 
+    def _loop_stats(self, name, sections=()):
+        # one LoopStats per thread, kept when the threads start again
+        if name not in self.loop_stats:
+            self.loop_stats[name] = LoopStats(name, sections=list(sections))
+        return self.loop_stats[name]
+
     def action_threads_start(self):
         # Immutable objects int, float, string, tuple, etc., need to be declared with global
         # Variable object lists, dicts, instances of custom classes, etc., do not need to be declared with global
-        if 'legs' in self.thread_list:
+        if self.servo_scheduler is not None:
+            self.servo_scheduler.start()
+        elif 'legs' in self.thread_list:
+            self._loop_stats('legs', ['servo_move'])
             self.legs_thread = threading.Thread(name='legs_thread', target=self._legs_action_thread)
             self.legs_thread.daemon = True
             self.legs_thread.start()
-        if 'head' in self.thread_list:
+        if 'head' in self.thread_list and self.servo_scheduler is None:
+            self._loop_stats('head', ['servo_move'])
             self.head_thread = threading.Thread(name='head_thread', target=self._head_action_thread)
             self.head_thread.daemon = True
             self.head_thread.start()
-        if 'tail' in self.thread_list:
+        if 'tail' in self.thread_list and self.servo_scheduler is None:
+            self._loop_stats('tail', ['servo_move'])
             self.tail_thread = threading.Thread(name='tail_thread', target=self._tail_action_thread)
             self.tail_thread.daemon = True
             self.tail_thread.start()
         if 'rgb' in self.thread_list:
+            self._loop_stats('rgb', ['display'])
             self.rgb_strip_thread = threading.Thread(name='rgb_strip_thread', target=self._rgb_strip_thread)
             self.rgb_strip_thread.daemon = True
             self.rgb_strip_thread.start()
         if 'imu' in self.thread_list:
+            self._loop_stats('imu', ['mem_read'])
             self.imu_thread = threading.Thread(name='imu_thread', target=self._imu_thread)
             self.imu_thread.daemon = True
             self.imu_thread.start()
+        if 'distance' in self.thread_list:
+            self._loop_stats('distance')
+            self.distance_thread = threading.Thread(name='distance_thread', target=self._distance_thread)
+            self.distance_thread.daemon = True
+            self.distance_thread.start()
+        if 'sensor_bus' in self.thread_list:
+            self._loop_stats('sensor_bus', ['touch', 'sound', 'battery'])
+            self.sensor_bus_thread = threading.Thread(name='sensor_bus_thread', target=self._sensor_bus_thread)
+            self.sensor_bus_thread.daemon = True
+            self.sensor_bus_thread.start()
+        if self.stats_interval:
+            self.stats_thread = threading.Thread(name='stats_thread', target=self._stats_thread)
+            self.stats_thread.daemon = True
+            self.stats_thread.start()
 
     # legs
     def _legs_action_thread(self):
+        stats = self.loop_stats['legs']
         while not self.exit_flag:
             try:
-                with self.legs_thread_lock:
-                    self.leg_current_angles = list.copy(self.legs_action_buffer[0])
-                # Release lock after copying data before the next operations
+                stats.tick()
+                stats.depth(len(self.legs_action_buffer))
+                if self.gait_streaming:
+                    # queued frames first, then the streaming gait
+                    angles = self.legs_action_buffer.peek(timeout=0)
+                    from_gait = angles is None
+                    if from_gait:
+                        angles = self._gait_frame()
+                else:
+                    # block until a frame is available, timeout to check exit_flag
+                    angles = self.legs_action_buffer.peek(timeout=self.ACTION_WAIT_TIMEOUT)
+                    from_gait = False
+                if angles is None:
+                    continue
+                self.leg_current_angles = list.copy(angles)
+                start = perf_counter()
                 self.legs.servo_move(self.leg_current_angles, self.legs_speed)
-                with self.legs_thread_lock:
-                    self.legs_action_buffer.pop(0)
-            except IndexError:
-                sleep(0.001)
+                stats.add_time('servo_move', perf_counter() - start)
+                self._odometry_frame(angles, from_gait)
+                # pop after moving, so that legs done means the last frame is reached
+                if not from_gait:
+                    self.legs_action_buffer.pop()
             except Exception as e:
+                stats.error()
                 error(f'\r_legs_action_thread Exception:{e}')
                 break
 
     # head
     def _head_action_thread(self):
+        stats = self.loop_stats['head']
         while not self.exit_flag:
             try:
-                with self.head_thread_lock:
-                    self.head_current_angles = list.copy(self.head_action_buffer[0])
-                    self.head_action_buffer.pop(0)
-                # Release lock after copying data before the next operations
-                _angles = list.copy(self.head_current_angles)
-                _angles[0] = self.limit(self.HEAD_YAW_MIN, self.HEAD_YAW_MAX, _angles[0])
-                _angles[1] = self.limit(self.HEAD_ROLL_MIN, self.HEAD_ROLL_MAX, _angles[1])
-                _angles[2] = self.limit(self.HEAD_PITCH_MIN, self.HEAD_PITCH_MAX, _angles[2])
-                _angles[2] += self.HEAD_PITCH_OFFSET
-                self.head.servo_move(_angles, self.head_speed)
-            except IndexError:
-                sleep(0.001)
+                stats.tick()
+                stats.depth(len(self.head_action_buffer))
+                angles = self.head_action_buffer.get(timeout=self.ACTION_WAIT_TIMEOUT)
+                if angles is None:
+                    continue
+                self.head_current_angles = list.copy(angles)
+                targets = self._head_servo_angles(angles)
+                self._head_frame_begin(targets)
+                start = perf_counter()
+                self.head.servo_move(targets, self.head_speed)
+                stats.add_time('servo_move', perf_counter() - start)
+                self.head_trajectory.end(time())
             except Exception as e:
+                stats.error()
                 error(f'\r_head_action_thread Exception:{e}')
                 break
 
     # tail
     def _tail_action_thread(self):
+        stats = self.loop_stats['tail']
         while not self.exit_flag:
             try:
-                with self.tail_thread_lock:
-                    self.tail_current_angles = list.copy(self.tail_action_buffer[0])
-                    self.tail_action_buffer.pop(0)
-                # Release lock after copying data before the next operations
+                stats.tick()
+                stats.depth(len(self.tail_action_buffer))
+                angles = self.tail_action_buffer.get(timeout=self.ACTION_WAIT_TIMEOUT)
+                if angles is None:
+                    continue
+                self.tail_current_angles = list.copy(angles)
+                start = perf_counter()
                 self.tail.servo_move(self.tail_current_angles, self.tail_speed)
-            except IndexError:
-                sleep(0.001)
+                stats.add_time('servo_move', perf_counter() - start)
             except Exception as e:
+                stats.error()
                 error(f'\r_tail_action_thread Exception:{e}')
                 break
 
+    def _head_servo_angles(self, angles):
+        _angles = list.copy(angles)
+        _angles[0] = self.limit(self.HEAD_YAW_MIN, self.HEAD_YAW_MAX, _angles[0])
+        _angles[1] = self.limit(self.HEAD_ROLL_MIN, self.HEAD_ROLL_MAX, _angles[1])
+        _angles[2] = self.limit(self.HEAD_PITCH_MIN, self.HEAD_PITCH_MAX, _angles[2])
+        _angles[2] += self.HEAD_PITCH_OFFSET
+        return _angles
+
+    # servo scheduler callbacks, keep current angles like the action threads do
+    def _on_legs_frame(self, angles):
+        self.leg_current_angles = list.copy(angles)
+        self._odometry_frame(angles, self.servo_scheduler.tracks[0].from_source)
+
+    def _odometry_frame(self, angles, from_gait=False):
+        # imu yaw for the turns once the imu runs, the feet before
+        yaw = self.yaw if len(self.imu_history) > 0 else None
+        stride = self.gait_stride if from_gait else None
+        self.odometry.legs_frame(angles, yaw, stride=stride)
+
+    def _on_head_frame(self, angles):
+        self.head_current_angles = list.copy(angles)
+        self._head_frame_begin(self._head_servo_angles(angles))
+
+    def _wait_head_yaw(self, yaw, timeout=3):
+        # head done is the last frame taken, not executed: wait for the servo itself
+        yaw = self.limit(self.HEAD_YAW_MIN, self.HEAD_YAW_MAX, yaw)
+        deadline = time() + timeout
+        while abs(self.head.servo_positions[0] - yaw) > 0.5 and time() < deadline:
+            sleep(0.01)
+
+    def _head_frame_begin(self, targets):
+        # same timing rules as Robot.servo_move, from where the head servos are
+        positions = self.head.servo_positions
+        max_delta = max(abs(targets[i] - positions[i]) for i in range(len(positions)))
+        duration = self.frame_duration(self.head_speed)
+        if max_delta / duration > self.HEAD_DPS:
+            duration = max_delta / self.HEAD_DPS
+        self.head_trajectory.begin(time(), duration, positions[0], targets[0])
+
+    def _on_tail_frame(self, angles):
+        self.tail_current_angles = list.copy(angles)
+
+    # streaming gait
+    def set_velocity(self, vx, yaw_rate=0, gait=None):
+        """
+        Walk continuously at the given velocity. The gait generator feeds the
+        legs frame by frame, so a new setpoint takes effect on the next frame.
+
+        :param vx: forward speed, mm/s, negative for backward
+        :type vx: float
+        :param yaw_rate: turning speed, deg/s, positive turns left
+        :type yaw_rate: float
+        :param gait: GaitGenerator.WALK or GaitGenerator.TROT, None to choose by speed
+        :type gait: int or None
+        """
+        self.gait.set_velocity(vx, yaw_rate, gait)
+        self.gait_stopping = False
+        if not self.gait_streaming:
+            self.legs_action_buffer.clear()
+            self.legs_speed = self.GAIT_SPEED
+            self._gait_time = None
+            self.gait_streaming = True
+            if self.servo_scheduler is not None:
+                self.servo_scheduler.wake()
+
+    def gait_stop(self):
+        """
+        Slow down to a stop, streaming ends once every foot is on the ground
+        """
+        self.gait.set_velocity(0, 0)
+        self.gait_stopping = True
+
+    def _gait_frame(self):
+        if not self.gait_streaming:
+            return None
+        if self.gait_stopping and self.gait.is_still():
+            self.gait_streaming = False
+            self.gait_stopping = False
+            return None
+        # the gait advances by the real frame time, whatever the servo rate and overruns
+        now = perf_counter()
+        dt = self.gait.dt
+        if self._gait_time is not None and now - self._gait_time < self.GAIT_MAX_FRAME_TIME:
+            dt = now - self._gait_time
+        self._gait_time = now
+        coords = self.gait.next_frame(dt)
+        self.gait_stride = self.gait.vx * dt / 10
+        if self.balance.running:
+            rpy = self._balanced_rpy(0, 0, 0)
+            return self.pose_engine.pose2legs_angle(rpy, self.pose[:, 0], coords).tolist()
+        return self.legs_angle_calculation(coords)
+
+    def servo_loop_stats(self):
+        """
+        Jitter and overrun statistics of the unified servo loop
+
+        :return: stats dict, None if servo_scheduler is not enabled
+        :rtype: dict
+        """
+        if self.servo_scheduler is None:
+            return None
+        return self.servo_scheduler.stats()
+
+    # telemetry
+    def stats(self, reset=False):
+        """
+        Snapshot of the run time telemetry: every thread loop (period
+        histogram, time in servo_move / display / mem_read, cpu load, dropped
+        frames, errors), i2c and spi transactions and bytes, queue depths.
+        Rates are averages since the start or the last reset.
+
+        :param reset: start a new measuring window after this snapshot
+        :type reset: bool
+        :rtype: dict
+        """
+        queues = {}
+        for name in ['legs', 'head', 'tail']:
+            buffer = getattr(self, f'{name}_action_buffer', None)
+            if buffer is not None:
+                queues[name] = {'depth': len(buffer), 'dropped': buffer.dropped}
+        try:
+            depth = self.distance_queue.qsize()
+        except NotImplementedError:
+            depth = -1
+        threads = {name: loop.snapshot() for name, loop in self.loop_stats.items()}
+        rgb_strip = self._peripherals.get('rgb_strip')
+        # samples the ultrasonic thread could not queue
+        dropped = threads['ultrasonic']['dropped'] if 'ultrasonic' in threads else 0
+        queues['distance'] = {'depth': depth, 'dropped': dropped}
+
+        stats = {
+            'time': time(),
+            'elapsed': perf_counter() - self.stats_start,
+            'threads': threads,
+            'buses': {'i2c': self.i2c_stats.snapshot(), 'spi': self.spi_stats.snapshot()},
+            'queues': queues,
+            'servo_scheduler': self.servo_loop_stats(),
+            'rgb_strip': rgb_strip.frame_stats() if rgb_strip is not None else None,
+            'balance': {'running': self.balance.running, 'ticks': self.balance.ticks,
+                        'overruns': self.balance.overruns},
+        }
+        if reset:
+            self.reset_stats()
+        return stats
+
+    def reset_stats(self):
+        self.stats_start = perf_counter()
+        for loop in list(self.loop_stats.values()):
+            loop.reset()
+        self.i2c_stats.reset()
+        self.spi_stats.reset()
+        if self.servo_scheduler is not None:
+            self.servo_scheduler.reset_stats()
+        if self._peripherals.get('rgb_strip') is not None:
+            self._peripherals['rgb_strip'].reset_frame_stats()
+
+    def stats_report(self, stats=None):
+        """
+        stats() as a table
+
+        :rtype: str
+        """
+        if stats is None:
+            stats = self.stats()
+        lines = [f"stats over {stats['elapsed']:.1f} s:",
+                 f"  {'thread':<12}{'Hz':>7}{'period ms':>16}{'cpu':>7}"
+                 f"{'dropped':>9}{'errors':>8}{'queue':>7}  sections ms (mean/max, load)"]
+        for name, loop in stats['threads'].items():
+            sections = ', '.join(
+                f"{section} {item['mean_ms']:.2f}/{item['max_ms']:.2f} {item['load'] * 100:.0f}%"
+                for section, item in loop['sections'].items() if item['calls'] > 0)
+            period = f"{loop['period_mean_ms']:.1f}/{loop['period_max_ms']:.1f}"
+            lines.append(f"  {name:<12}{loop['rate']:>7.1f}{period:>16}{loop['cpu_load'] * 100:>6.1f}%"
+                         f"{loop['dropped']:>9}{loop['errors']:>8}{loop['queue_depth_max']:>7}  {sections}")
+        scheduler = stats['servo_scheduler']
+        if scheduler is not None:
+            lines.append(f"  {'servo loop':<12}{scheduler['ticks'] / max(1e-9, stats['elapsed']):>7.1f}"
+                         f"  jitter {scheduler['jitter_mean_ms']:.2f}/{scheduler['jitter_max_ms']:.2f} ms"
+                         f"  work {scheduler['work_mean_ms']:.2f}/{scheduler['work_max_ms']:.2f} ms"
+                         f"  overruns {scheduler['overruns']}")
+        frames = stats.get('rgb_strip')
+        if frames is not None:
+            lines.append(f"  {'rgb frames':<12}{frames['fps']:>7.1f}"
+                         f"  written {frames['written']}, unchanged {frames['unchanged']}, late {frames['late']}"
+                         f"  lateness {frames['lateness_mean_ms']:.2f}/{frames['lateness_max_ms']:.2f} ms"
+                         f"  idle {frames['idle'] * 100:.0f}%")
+        for name, bus in stats['buses'].items():
+            devices = ', '.join(f'{device} {count}' for device, count in bus['devices'].items())
+            lines.append(f"  {name}: {bus['transactions_per_s']:.0f} tx/s, {bus['bytes_per_s']:.0f} B/s,"
+                         f" load {bus['load'] * 100:.1f}%, errors {bus['errors']}  ({devices})")
+        queues = ', '.join(f"{name} {item['depth']} (dropped {item['dropped']})"
+                           for name, item in stats['queues'].items())
+        lines.append(f"  queues: {queues}")
+        return '\n'.join(lines)
+
+    def _stats_thread(self):
+        next_dump = perf_counter() + self.stats_interval
+        while not self.exit_flag:
+            delay = next_dump - perf_counter()
+            if delay > 0:
+                sleep(min(delay, self.ACTION_WAIT_TIMEOUT))
+                continue
+            next_dump += self.stats_interval
+            try:
+                info(self.stats_report(self.stats(reset=True)))
+            except Exception as e:
+                error(f'\r_stats_thread Exception:{e}')
+                break
+
     # rgb strip
     def _rgb_strip_thread(self):
+        stats = self.loop_stats['rgb']
+        if self.rgb_strip is None:
+            return
         while self.rgb_thread_run:
             try:
+                stats.tick()
                 self.rgb_strip.show()
                 self.rgb_fail_count = 0
             except Exception as e:
+                stats.error()
                 self.rgb_fail_count += 1
                 sleep(0.001)
                 if self.rgb_fail_count > 10:
@@ -435,7 +1040,44 @@ class Pidog():
 
     # IMU
 
+    def _imu_calibration_cache(self):
+        # (cache, device, temperature), cache is None when disabled or unreadable
+        if self.imu_calibration is None:
+            return None, None, None
+        try:
+            cache = ImuCalibrationCache(self.imu_calibration)
+            return cache, self.imu.device_id(), self.imu.sh3001_gettempdata()
+        except Exception as e:
+            warn(f'\rimu calibration cache: {e}')
+            return None, None, None
+
     def _imu_thread(self):
+        if self.imu is None:
+            return
+        calibration_start = perf_counter()
+        cache, device, temperature = self._imu_calibration_cache()
+        cached = cache.lookup(device, temperature) if cache is not None else None
+        drift_check = None
+        if cached is not None:
+            # warm start, no calibration window
+            self.imu_acc_offset, self.imu_gyro_offset = cached
+            drift_check = DriftCheck()
+            self.startup_times.append(('imu_calibration', perf_counter() - calibration_start))
+        else:
+            complete = self._imu_calibrate()
+            self.startup_times.append(('imu_calibration', perf_counter() - calibration_start))
+            if cache is not None and complete:
+                self._imu_calibration_store(cache, device, temperature)
+        self._imu_loop(cache, device, temperature, drift_check)
+
+    def _imu_calibration_store(self, cache, device, temperature):
+        # a disk error is not an imu read failure, never counted in imu_fail_count
+        try:
+            cache.store(device, temperature, self.imu_acc_offset, self.imu_gyro_offset)
+        except Exception as e:
+            warn(f'\rimu calibration cache: {e}')
+
+    def _imu_calibrate(self):
         # imu calibrate
         _ax = 0
         _ay = 0
@@ -443,10 +1085,12 @@ class Pidog():
         _gx = 0
         _gy = 0
         _gz = 0
-        time = 10
-        for _ in range(time):
+        samples = 10
+        complete = True
+        for _ in range(samples):
             data = self.imu._sh3001_getimudata()
             if data == False:
+                complete = False
                 break
 
             self.accData, self.gyroData = data
@@ -458,40 +1102,70 @@ class Pidog():
             _gz += self.gyroData[2]
             sleep(0.1)
 
-        self.imu_acc_offset[0] = round(-16384 - _ax/time, 0)
-        self.imu_acc_offset[1] = round(0 - _ay/time, 0)
-        self.imu_acc_offset[2] = round(0 - _az/time, 0)
-        self.imu_gyro_offset[0] = round(0 - _gx/time, 0)
-        self.imu_gyro_offset[1] = round(0 - _gy/time, 0)
-        self.imu_gyro_offset[2] = round(0 - _gz/time, 0)
-
+        self.imu_acc_offset[0] = round(-16384 - _ax/samples, 0)
+        self.imu_acc_offset[1] = round(0 - _ay/samples, 0)
+        self.imu_acc_offset[2] = round(0 - _az/samples, 0)
+        self.imu_gyro_offset[0] = round(0 - _gx/samples, 0)
+        self.imu_gyro_offset[1] = round(0 - _gy/samples, 0)
+        self.imu_gyro_offset[2] = round(0 - _gz/samples, 0)
+        return complete
+
+    def _imu_loop(self, cache=None, device=None, temperature=None, drift_check=None):
+        period = 1.0 / self.IMU_RATE
+        last_time = None
+        next_tick = time()
+        stats = self.loop_stats['imu']
         while not self.exit_flag:
             try:
+                stats.tick()
+                start = perf_counter()
                 data = self.imu._sh3001_getimudata()
+                stats.add_time('mem_read', perf_counter() - start)
                 if data == False:
                     self.imu_fail_count += 1
                     if self.imu_fail_count > 10:
                         error('\r_imu_thread imu data error')
                         break
-                self.accData, self.gyroData = data
-                self.accData[0] += self.imu_acc_offset[0]
-                self.accData[1] += self.imu_acc_offset[1]
-                self.accData[2] += self.imu_acc_offset[2]
-                self.gyroData[0] += self.imu_gyro_offset[0]
-                self.gyroData[1] += self.imu_gyro_offset[1]
-                self.gyroData[2] += self.imu_gyro_offset[2]
-                ax = self.accData[0]
-                ay = self.accData[1]
-                az = self.accData[2]
-                ay = -ay
-                az = -az
-
-                self.pitch = atan(ay/sqrt(ax*ax+az*az))*57.2957795
-                self.roll = atan(az/sqrt(ax*ax+ay*ay))*57.2957795
+                now = time()
+                acc, gyro = data
+                acc = [acc[i] + self.imu_acc_offset[i] for i in range(3)]
+                gyro = [gyro[i] + self.imu_gyro_offset[i] for i in range(3)]
+
+                # gyro integration corrected by the accelerometer
+                dt = period if last_time is None else now - last_time
+                last_time = now
+                roll, pitch, yaw = self.imu_filter.update(acc, gyro, dt)
+                self.imu_history.append(now, acc, gyro, [roll, pitch, yaw])
+
+                # after a warm start, fix the cached offsets if they drifted
+                if drift_check is not None and drift_check.add(acc, gyro):
+                    corrections = drift_check.corrections()
+                    drift_check = None
+                    if corrections is not None:
+                        acc_correction, gyro_correction = corrections
+                        self.imu_acc_offset = [self.imu_acc_offset[i] + acc_correction[i] for i in range(3)]
+                        self.imu_gyro_offset = [self.imu_gyro_offset[i] + gyro_correction[i] for i in range(3)]
+                        debug(f'\rimu offsets drifted, corrected: {self.imu_acc_offset} {self.imu_gyro_offset}')
+                        if cache is not None:
+                            self._imu_calibration_store(cache, device, temperature)
+                if self.sensor_bus is not None:
+                    self.sensor_bus.write('imu', acc + gyro + [roll, pitch, yaw], now)
+
+                # whole new objects, readers never see half updated lists
+                self.accData, self.gyroData = acc, gyro
+                self.roll, self.pitch, self.yaw = roll, pitch, yaw
 
                 self.imu_fail_count = 0
-                sleep(0.05)
+                # absolute schedule, missed samples are dropped
+                next_tick += period
+                delay = next_tick - time()
+                if delay > 0:
+                    sleep(delay)
+                else:
+                    stats.drop(int(-delay / period) + 1)
+                    next_tick = time()
             except Exception as e:
+                stats.error()
                 self.imu_fail_count += 1
                 sleep(0.001)
                 if self.imu_fail_count > 10:
@@ -499,20 +1173,84 @@ class Pidog():
                     self.exit_flag = True
                     break
 
+    # distance: dispatch ultrasonic samples to the triggers
+    def _distance_thread(self):
+        stats = self.loop_stats['distance']
+        while not self.exit_flag:
+            try:
+                try:
+                    t, distance, raw = self.distance_queue.get(timeout=self.ACTION_WAIT_TIMEOUT)
+                except queue.Empty:
+                    continue
+                stats.tick()
+                stats.depth(self.distance_queue.qsize())
+                self.distance_sample = (t, distance)
+                self.ultrasonic_fast.value = int(self.gait_streaming or not self.is_legs_done()
+                                                 or self.head_trajectory.moving(time()))
+                for trigger in self.distance_triggers:
+                    trigger.update(t, distance)
+                for recorder in self.distance_recorders:
+                    recorder.update(t, raw)
+            except Exception as e:
+                stats.error()
+                error(f'\r_distance_thread Exception:{e}')
+                break
+
+    # sensor bus: touch, sound direction, battery
+    # ultrasonic and imu are published by their own threads
+    def _sensor_bus_thread(self):
+        period = 1.0 / self.SENSOR_BUS_RATE
+        last_battery = 0
+        direction = -1
+        last_sound = 0
+        stats = self.loop_stats['sensor_bus']
+        while not self.exit_flag:
+            try:
+                stats.tick()
+                now = time()
+                dual_touch = self.dual_touch
+                if dual_touch is not None:
+                    # raw pins, DualTouch.read() keeps slide state for its caller
+                    self.sensor_bus.write('touch', [dual_touch.touch_L.value(),
+                                                    dual_touch.touch_R.value()], now)
+                    stats.add_time('touch', time() - now)
+                ears = self.ears
+                if ears is not None:
+                    start = time()
+                    if ears.watching:
+                        # the watcher's newest reading, its queue stays for the apps
+                        latest = ears.latest
+                        detected = latest is not None and latest[0] > last_sound
+                        if detected:
+                            last_sound, direction = latest[0], latest[1]
+                    else:
+                        detected = ears.isdetected()
+                        if detected:
+                            direction = ears.read()
+                    self.sensor_bus.write('sound', [int(detected), direction], now)
+                    stats.add_time('sound', time() - start)
+                if now - last_battery >= self.BATTERY_INTERVAL:
+                    last_battery = now
+                    start = time()
+                    self.sensor_bus.write('battery', [self.get_battery_voltage()], now)
+                    stats.add_time('battery', time() - start)
+                sleep(period)
+            except Exception as e:
+                stats.error()
+                error(f'\r_sensor_bus_thread Exception:{e}')
+                break
+
     # clear actions buff
     def legs_stop(self):
-        with self.legs_thread_lock:
-            self.legs_action_buffer.clear()
+        self.legs_action_buffer.clear()
         self.wait_legs_done()
 
     def head_stop(self):
-        with self.head_thread_lock:
-            self.head_action_buffer.clear()
+        self.head_action_buffer.clear()
         self.wait_head_done()
 
     def tail_stop(self):
-        with self.tail_thread_lock:
-            self.tail_action_buffer.clear()
+        self.tail_action_buffer.clear()
         self.wait_tail_done()
 
     def body_stop(self):
@@ -520,14 +1258,45 @@ class Pidog():
         self.head_stop()
         self.tail_stop()
 
+    # blend
+    @staticmethod
+    def frame_duration(speed):
+        # seconds per frame at speed, same rule as Robot.servo_move (max_dps aside)
+        speed = min(100, max(0, speed))
+        return (-9.9 * speed + 1000) / 1000
+
+    def _blend_move(self, buffer, current_angles, frames, speed, blend):
+        # crossfade the pending frames into the new ones, without draining
+        count = max(1, int(round(blend / self.frame_duration(speed))))
+
+        def make_frames(pending):
+            old = pending if len(pending) > 0 else [current_angles]
+            return crossfade(old, frames, count)
+        return buffer.replace(make_frames)
+
     # move
-    def legs_move(self, target_angles, immediately=True, speed=50):
+    def legs_move(self, target_angles, immediately=True, speed=50, blend=0):
+        """
+        Queue legs frames
+
+        :param target_angles: list of 8 angles frames
+        :param immediately: replace the pending frames, otherwise append
+        :param speed: 0-100
+        :param blend: seconds, with immediately, crossfade from the current
+            trajectory into the new one instead of stopping first
+        :return: completion handle, handle.wait(timeout) blocks until the frames are done
+        :rtype: ActionHandle
+        """
         if immediately == True:
+            self.gait_streaming = False
+            if blend > 0 and len(target_angles) > 0:
+                self.legs_speed = speed
+                return self._blend_move(self.legs_action_buffer, self.leg_current_angles,
+                                        target_angles, speed, blend)
             self.legs_stop()
         self.legs_speed = speed
-        with self.legs_thread_lock:
-            self.legs_action_buffer += target_angles
-        
+        return self.legs_action_buffer.push(target_angles)
+
     def head_rpy_to_angle(self, target_yrp, roll_comp=0, pitch_comp=0):
         yaw, roll, pitch = target_yrp
         signed = -1 if yaw < 0 else 1
@@ -537,40 +1306,61 @@ class Pidog():
         yaw_servo = yaw
         return [yaw_servo, roll_servo, pitch_servo]
 
-    def head_move(self, target_yrps, roll_comp=0, pitch_comp=0, immediately=True, speed=50):
-        if immediately == True:
-            self.head_stop()
-        self.head_speed = speed
-        
+    def head_move(self, target_yrps, roll_comp=0, pitch_comp=0, immediately=True, speed=50, blend=0):
         angles = [self.head_rpy_to_angle(
             target_yrp, roll_comp, pitch_comp) for target_yrp in target_yrps]
 
-        with self.head_thread_lock:
-            self.head_action_buffer += angles
+        return self.head_move_raw(angles, immediately=immediately, speed=speed, blend=blend)
 
-    def head_move_raw(self, target_angles, immediately=True, speed=50):
+    def head_move_raw(self, target_angles, immediately=True, speed=50, blend=0):
+        """
+        Queue head frames, see legs_move for blend
+        """
         if immediately == True:
+            if blend > 0 and len(target_angles) > 0:
+                self.head_speed = speed
+                return self._blend_move(self.head_action_buffer, self.head_current_angles,
+                                        target_angles, speed, blend)
             self.head_stop()
         self.head_speed = speed
-        with self.head_thread_lock:
-            self.head_action_buffer += target_angles
+        return self.head_action_buffer.push(target_angles)
 
     def tail_move(self, target_angles, immediately=True, speed=50):
         if immediately == True:
             self.tail_stop()
         self.tail_speed = speed
-        with self.tail_thread_lock:
-            self.tail_action_buffer += target_angles
-        
+        return self.tail_action_buffer.push(target_angles)
+
     # ultrasonic
     def _ultrasonic_thread(self, distance_addr, lock):
+        distance_filter = DistanceFilter()
+        stats = self.loop_stats['ultrasonic']
         while True:
             try:
+                stats.tick()
+                start = time()
+                raw = self.ultrasonic.read()
+                t = time()
+                stats.add_time('read', t - start)
+                val = round(distance_filter.update(raw), 2)
                 with lock:
-                    val = round(float(self.ultrasonic.read()), 2)
                     distance_addr.value = val
-                sleep(0.01)
+                if self.sensor_bus is not None:
+                    self.sensor_bus.write('ultrasonic', [val], t)
+                try:
+                    # the raw reading too, for head sweeps
+                    self.distance_queue.put_nowait((t, val, distance_filter.valid(raw)))
+                except queue.Full:
+                    # the distance thread is not running, read_distance() still works
+                    stats.drop()
+                # adaptive rate: faster while moving
+                if self.ultrasonic_fast.value:
+                    interval = self.ULTRASONIC_FAST_INTERVAL
+                else:
+                    interval = self.ULTRASONIC_SLOW_INTERVAL
+                sleep(max(0, interval - (time() - start)))
             except Exception as e:
+                stats.error()
                 sleep(0.1)
                 error(f'\rultrasonic_thread  except: {e}')
                 break
@@ -599,6 +1389,8 @@ class Pidog():
     def sensory_process_start(self):
         if self.sensory_process != None:
             self.sensory_process.terminate()
+        # written by the sensory process, in shared memory
+        self.loop_stats['ultrasonic'] = LoopStats('ultrasonic', sections=['read'], shared=True)
         self.sensory_process = Process(name='sensory_process',
                                          target=self.sensory_process_work,
                                          args=(self.distance, self.sensory_lock))
@@ -628,15 +1420,11 @@ class Pidog():
         if not is_run_with_root and not hasattr(self, "speak_first"):
             self.speak_first = True
             warn("Play sound needs to be run with sudo.")
-        status, _ = utils.run_command('sudo killall pulseaudio') # Solve the problem that there is no sound when running in the vnc environment
-
-        if os.path.isfile(name):
-            self.music.sound_play_threading(name, volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.mp3'):
-            self.music.sound_play_threading(self.SOUND_DIR+name+'.mp3', volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.wav'):
-            self.music.sound_play_threading(self.SOUND_DIR+name+'.wav', volume)
-        else:
+
+        if self.audio is None:
+            warn(f'Cannot play {name}, audio engine init failed: {self._audio_error}')
+            return False
+        if self.audio.play(name, volume) is None:
             warn(f'No sound found for {name}')
             return False
 
@@ -652,15 +1440,11 @@ class Pidog():
         if not is_run_with_root and not hasattr(self, "speak_first"):
             self.speak_first = True
             warn("Play sound needs to be run with sudo.")
-        _status, _ = utils.run_command('sudo killall pulseaudio') # Solve the problem that there is no sound when running in the vnc environment
-        
-        if os.path.isfile(name):
-            self.music.sound_play(name, volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.mp3'):
-            self.music.sound_play(self.SOUND_DIR+name+'.mp3', volume)
-        elif os.path.isfile(self.SOUND_DIR+name+'.wav'):
-            self.music.sound_play(self.SOUND_DIR+name+'.wav', volume)
-        else:
+
+        if self.audio is None:
+            warn(f'Cannot play {name}, audio engine init failed: {self._audio_error}')
+            return False
+        if not self.audio.play_block(name, volume):
             warn(f'No sound found for {name}')
             return False
 
@@ -696,7 +1480,38 @@ class Pidog():
         if z != None:
             self.pose[2, 0] = float(z)
 
+    # balance
+    def balance_start(self, roll=0, pitch=0):
+        """
+        Run the balance controller at IMU_RATE. While it runs, set_rpy(pid=True)
+        and the streaming gait add its corrections to the body rpy.
+
+        :param roll: target roll in degrees
+        :param pitch: target pitch in degrees
+        """
+        self.target_rpy[0] = roll
+        self.target_rpy[1] = pitch
+        self.balance.set_target(roll, pitch)
+        self.balance.start()
+
+    def balance_stop(self):
+        self.balance.stop()
+        self.balance.reset()
+
+    def _balanced_rpy(self, roll, pitch, yaw):
+        # body rpy in radians with the balance corrections
+        roll_correction, pitch_correction = self.balance.correction()
+        return np.array([roll + roll_correction, pitch + pitch_correction, yaw]) / 180. * pi
+
     def set_rpy(self, roll=None, pitch=None, yaw=None, pid=False):
+        if pid and self.balance.running:
+            # corrections come from the balance thread, roll and pitch are the base pose in degrees
+            roll = 0 if roll is None else roll
+            pitch = 0 if pitch is None else pitch
+            yaw = self.rpy[2] / pi * 180 if yaw is None else yaw
+            self.rpy = self._balanced_rpy(roll, pitch, yaw)
+            return
+
         if roll is None:
             roll = self.rpy[0]
         if pitch is None:
@@ -729,79 +1544,18 @@ class Pidog():
             self.rpy[2] = yaw / 180. * pi
 
     def set_legs(self, legs_list):
-        self.legpoint_struc = numpy_mat([
-            [-self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2 +
-                legs_list[0][0], self.body_height - legs_list[0][1]],
-            [self.BODY_WIDTH / 2, -self.BODY_LENGTH / 2 +
-                legs_list[1][0], self.body_height - legs_list[1][1]],
-            [-self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2 +
-                legs_list[2][0], self.body_height - legs_list[2][1]],
-            [self.BODY_WIDTH / 2,  self.BODY_LENGTH / 2 +
-                legs_list[3][0], self.body_height - legs_list[3][1]]
-        ]).T
+        self.legs_coords = legs_list
+        self.legpoint_struc = self.pose_engine.leg_points(legs_list)
 
     # pose and Euler Angle algorithm
     def pose2coords(self):
-        roll = self.rpy[0]
-        pitch = self.rpy[1]
-        yaw = self.rpy[2]
-
-        rotx = numpy_mat([
-            [cos(roll), 0, -sin(roll)],
-            [0, 1,           0],
-            [sin(roll), 0,  cos(roll)]])
-        roty = numpy_mat([
-            [1,         0,          0],
-            [0, cos(-pitch), -sin(-pitch)],
-            [0, sin(-pitch),  cos(-pitch)]])
-        rotz = numpy_mat([
-            [cos(yaw), -sin(yaw), 0],
-            [sin(yaw),  cos(yaw), 0],
-            [0,         0, 1]])
-        rot_mat = rotx * roty * rotz
-        AB = numpy_mat(np.zeros((3, 4)))
-        for i in range(4):
-            AB[:, i] = - self.pose - rot_mat * \
-                self.BODY_STRUCT[:, i] + self.legpoint_struc[:, i]
-
-        body_coor_list = []
-        for i in range(4):
-            body_coor_list.append([(self.legpoint_struc - AB).T[i, 0],
-                                  (self.legpoint_struc - AB).T[i, 1], (self.legpoint_struc - AB).T[i, 2]])
-
-        leg_coor_list = []
-        for i in range(4):
-            leg_coor_list.append(
-                [self.legpoint_struc.T[i, 0], self.legpoint_struc.T[i, 1], self.legpoint_struc.T[i, 2]])
-
-        return {"leg": leg_coor_list, "body": body_coor_list}
+        leg_points, body_points = self.pose_engine.pose2coords(
+            self.rpy, self.pose[:, 0], self.legs_coords)
+        return {"leg": leg_points.tolist(), "body": body_points.tolist()}
 
     def pose2legs_angle(self):
-        data = self.pose2coords()
-        leg_coor_list = data["leg"]
-        body_coor_list = data["body"]
-        coords = []
-        angles = []
-
-        for i in range(4):
-            coords.append([
-                leg_coor_list[i][1] - body_coor_list[i][1],
-                body_coor_list[i][2] - leg_coor_list[i][2]])
-
-        angles = []
-
-        for i, coord in enumerate(coords):
-
-            leg_angle, foot_angle = self.fieldcoord2polar(coord)
-            # The left and right sides are opposite
-            leg_angle = leg_angle
-            foot_angle = foot_angle-90
-            if i % 2 != 0:
-                leg_angle = -leg_angle
-                foot_angle = -foot_angle
-            angles += [leg_angle, foot_angle]
-
-        return angles
+        angles = self.pose_engine.pose2legs_angle(self.rpy, self.pose[:, 0], self.legs_coords)
+        return angles.tolist()
 
     # Pose calculated coord is Field coord, acoord refer to field, not refer to robot
     def fieldcoord2polar(self, coord):
@@ -872,6 +1626,18 @@ class Pidog():
 
         return translate_list
 
+    @classmethod
+    def legs_angle_calculation_batch(cls, coords):
+        """
+        Vectorized legs_angle_calculation for a whole gait
+
+        :param coords: N frames * 4 legs * [y, z]
+        :type coords: list or numpy.ndarray
+        :return: N * 8 angles, same clamping and left/right signs as legs_angle_calculation
+        :rtype: numpy.ndarray
+        """
+        return legs_angle_batch(coords, cls.LEG, cls.FOOT)
+
     # limit
     def limit(self, min, max, x):
         if x > max:
@@ -908,47 +1674,57 @@ class Pidog():
 
     # do action
     def do_action(self, action_name, step_count=1, speed=50, pitch_comp=0):
+        """
+        Queue a preset action
+
+        :return: completion handle of the last step, None on error
+        :rtype: ActionHandle
+        """
+        handle = None
         try:
             actions, part = self.actions_dict[action_name]
             if part == 'legs':
                 for _ in range(step_count):
-                    self.legs_move(actions, immediately=False, speed=speed)
+                    handle = self.legs_move(actions, immediately=False, speed=speed)
             elif part == 'head':
                 for _ in range(step_count):
-                    self.head_move(actions, pitch_comp=pitch_comp, immediately=False, speed=speed)
+                    handle = self.head_move(actions, pitch_comp=pitch_comp, immediately=False, speed=speed)
             elif part == 'tail':
                 for _ in range(step_count):
-                    self.tail_move(actions, immediately=False, speed=speed)
+                    handle = self.tail_move(actions, immediately=False, speed=speed)
+            return handle
         except KeyError:
             error("do_action: No such action")
         except Exception as e:
             error(f"do_action:{e}")
 
-    def wait_legs_done(self):
-        while not self.is_legs_done():
-            sleep(0.001)
+    # wait: block on the buffers' condition variables, return False on timeout
+    def wait_legs_done(self, timeout=None):
+        return self.legs_action_buffer.wait_empty(timeout)
 
-    def wait_head_done(self):
-        while not self.is_head_done():
-            sleep(0.001)
+    def wait_head_done(self, timeout=None):
+        return self.head_action_buffer.wait_empty(timeout)
 
-    def wait_tail_done(self):
-        while not self.is_tail_done():
-            sleep(0.001)
+    def wait_tail_done(self, timeout=None):
+        return self.tail_action_buffer.wait_empty(timeout)
 
-    def wait_all_done(self):
-        self.wait_legs_done()
-        self.wait_head_done()
-        self.wait_tail_done()
+    def wait_all_done(self, timeout=None):
+        if timeout is None:
+            return self.wait_legs_done() and self.wait_head_done() and self.wait_tail_done()
+        deadline = time() + timeout
+        for wait_done in (self.wait_legs_done, self.wait_head_done, self.wait_tail_done):
+            if not wait_done(max(0, deadline - time())):
+                return False
+        return True
 
     def is_legs_done(self):
-        return not bool(len(self.legs_action_buffer) > 0)
+        return self.legs_action_buffer.is_empty()
 
     def is_head_done(self):
-        return not bool(len(self.head_action_buffer) > 0)
+        return self.head_action_buffer.is_empty()
 
     def is_tail_done(self):
-        return not bool(len(self.tail_action_buffer) > 0)
+        return self.tail_action_buffer.is_empty()
 
     def is_all_done(self):
         return self.is_legs_done() and self.is_head_done() and self.is_tail_done()
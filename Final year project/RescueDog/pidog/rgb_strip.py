@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import time
-from smbus import SMBus
+import threading
+from collections import OrderedDict
+from .backend import SMBus
 import numpy as np
 import math
 
@@ -30,6 +32,16 @@ class RGBStrip():
 
     MIN_DELAY = 0.05
 
+    # frame registers written by display(): from FRAME_REG of the frame 1 page,
+    # one row of ROW_SIZE registers per colour, 2 unused registers then a byte per light
+    FRAME_REG = 0x20
+    ROW_SIZE = 0x10
+    REGISTERS = 3 * ROW_SIZE
+    I2C_BLOCK_MAX = 32  # smbus block write limit, bytes
+    MERGE_GAP = 2  # unchanged registers rewritten rather than starting a new transaction (address + register)
+
+    CACHE_SIZE = 16  # modes whose frames are kept, least recently used dropped first
+
     # region constants
     CONFIGURE_CMD_PAGE = 0XFD
     FRAME1_PAGE = 0x00
@@ -107,14 +119,23 @@ class RGBStrip():
         self.brightness = 1,
         self.delay = 0.1
         self.frames = []
+        self.payloads = []  # frames packed to registers
+        self.cache = OrderedDict()  # (style, color, bps, brightness): (max_frames, frames, payloads)
         self.current_frame = 0
         self.bps = 1.5 # beats per second
         self.is_changed = False
+        self.mode_changed = threading.Event()  # wakes show() when idle on static content
+        self.static = False  # every frame of the mode is the same
+        self.next_time = None  # perf_counter() time of the next frame, None to start over
+        self.idle_since = None  # start of the current wait on static content
+        self.reset_frame_stats()
 
         # Initial
         # =================================================================
         self.bus = SMBus(1)
         self.addr = addr
+        self.page = None  # page selected on the chip, None if unknown
+        self.image = None  # frame registers last written, None if unknown
 
         # Setting SLED1735 Ram Page to Function Page
         self.write_cmd(self.CONFIGURE_CMD_PAGE, self.FUNCTION_PAGE)
@@ -153,11 +174,19 @@ class RGBStrip():
         # Clear LED CTL Registers (Frame1Page)
         self.write_Ndata(0X00, 0XFF, 0X10)
         self.write_Ndata(0x20, 0x00, 0X80)
+        # frame registers cleared above
+        self.image = np.zeros(self.REGISTERS, dtype=np.uint8)
 
     # i2c communicate
     # =================================================================
     def write_cmd(self, reg, cmd):
         self.bus.write_byte_data(self.addr, reg, cmd)
+        if reg == self.CONFIGURE_CMD_PAGE:
+            self.page = cmd
+
+    def select_page(self, page):
+        if self.page != page:
+            self.write_cmd(self.CONFIGURE_CMD_PAGE, page)
 
     def write_Ndata(self, startaddr, data, length):
         addr = startaddr
@@ -172,42 +201,79 @@ class RGBStrip():
 
     # display fuction
     # =================================================================
+    def pack(self, image):
+        """
+        Frame registers of an image, see FRAME_REG
+
+        :param image: rgb datas, should be a x*3 array
+        :type image: list [[r, g, b], [r, g, b], ...]
+        :return: REGISTERS bytes
+        :rtype: numpy.ndarray
+        """
+        return self.pack_frames([image])[0]
+
+    def pack_frames(self, frames):
+        """
+        pack() every frame at once
+
+        :param frames: n*x*3 rgb datas
+        :return: n*REGISTERS bytes
+        :rtype: numpy.ndarray
+        """
+        pixels = np.asarray(frames, dtype=float).reshape(len(frames), -1, 3)[:, :self.ROW_SIZE - 2]
+        registers = np.zeros((len(pixels), 3, self.ROW_SIZE), dtype=np.uint8)
+        registers[:, :, 2:2 + pixels.shape[1]] = np.clip(pixels, 0, 255).transpose(0, 2, 1)
+        return registers.reshape(len(pixels), self.REGISTERS)
+
+    def changed_ranges(self, registers):
+        """
+        Register ranges differing from the last written image, close ranges
+        merged into one burst of at most I2C_BLOCK_MAX bytes
+
+        :param registers: frame registers from pack()
+        :return: [[start, end], ...], offsets from FRAME_REG
+        :rtype: list
+        """
+        if self.image is None:
+            changed = range(self.REGISTERS)
+        else:
+            changed = np.flatnonzero(registers != self.image).tolist()
+        ranges = []
+        for i in changed:
+            if ranges and i - ranges[-1][1] <= self.MERGE_GAP and i + 1 - ranges[-1][0] <= self.I2C_BLOCK_MAX:
+                ranges[-1][1] = i + 1
+            else:
+                ranges.append([i, i + 1])
+        return ranges
+
     def display(self, image):
         """
-        Display the rgb datas
+        Display the rgb datas, writing only the registers changed since the
+        last frame, nothing for an identical frame
 
-        :param image: rgb datas, should be a x*3 array 
+        :param image: rgb datas, should be a x*3 array, or registers from pack()
         :type image: list [[r, g, b], [r, g, b], ...]
+        :return: False if unchanged, nothing written
+        :rtype: bool
         """
-        # 'lambda x: x[0]'  same as  'fun(x): return x[0]'
-        reds = list(map(lambda x: x[0], image))
-        greens = list(map(lambda x: x[1], image))
-        blues = list(map(lambda x: x[2], image))
-        revert_image = [reds, greens, blues]
-
-        reg = 0x20  # Register start address of a page
-        empty = 0  # Register address vacancy position (needs to be filled with 0)
-        pos = 0  # data position, index
-
-        for i in range(3):
-            # Set the page to write
-            if i == 0:
-                self.write_cmd(self.CONFIGURE_CMD_PAGE, self.FRAME1_PAGE)  
-            elif reg == 0x20:
-                self.write_cmd(self.CONFIGURE_CMD_PAGE, self.FRAME2_PAGE)
-
-            color = i % 3
-            data = revert_image[color][pos*14:(pos+1)*14]
-            data.insert(empty, 0)  # The written data is filled with 0
-            data.insert(empty + 1, 0)
-
-            self.bus.write_i2c_block_data(self.addr, reg, data)
-            if color == 2:
-                empty += 3
-                pos += 1
-            reg += 0x10
-            if reg == 0xA0:
-                reg = 0x20
+        if isinstance(image, np.ndarray) and image.shape == (self.REGISTERS,):
+            registers = image
+        else:
+            registers = self.pack(image)
+        ranges = self.changed_ranges(registers)
+        if len(ranges) == 0:
+            return False
+        try:
+            self.select_page(self.FRAME1_PAGE)
+            for start, end in ranges:
+                self.bus.write_i2c_block_data(self.addr, self.FRAME_REG + start, registers[start:end].tolist())
+        except Exception:
+            # chip state unknown after a failed write, rewrite everything next frame
+            self.page = None
+            self.image = None
+            raise
+        self.image = registers.copy()
+        return True
 
     # 
     # calulate rgb data of different styles
@@ -419,7 +485,13 @@ class RGBStrip():
             raise ValueError("Invalid brightness value.")
 
         self.is_changed = True
-        
+        self.mode_changed.set()
+
+    def wake(self):
+        """
+        Return from a show() waiting for a mode change, eg: to stop the thread calling it
+        """
+        self.mode_changed.set()
 
     # calulate and display frames
     # =================================================================
@@ -437,34 +509,163 @@ class RGBStrip():
         elif self.style == 'listen':
             return self.listen(frame_index, light_index, color=self.color)
 
+    def brightness_grid(self, style, max_frames):
+        """
+        Brightness of every light in every frame, breath, boom, bark, speak
+        and listen with their default A and sig, computed at once
+
+        :return: max_frames*light_num brightness
+        :rtype: numpy.ndarray
+        """
+        frame_index = np.arange(max_frames, dtype=float)[:, None]
+        light_index = np.arange(self.light_num, dtype=float)[None, :]
+
+        def cos_func(peak, a, x, offset=0):
+            return (peak/2.0) * np.cos(a*x + offset) + peak/2
+
+        if style in ('breath', 'boom'):
+            period = max_frames if style == 'breath' else max_frames*2.0
+            offset = -cos_func(1, float(2*math.pi/period), frame_index)
+            return self.Normal_distribution_calculate(5, 2, 5, light_index, offset)
+        elif style in ('bark', 'speak'):
+            peak = (self.light_num-1)/2
+            period = max_frames*2.0 if style == 'bark' else max_frames
+            u_offset = cos_func(peak, float(2*math.pi/period), frame_index)
+            u = np.where(light_index <= peak, u_offset, 2*peak - u_offset)
+            return self.Normal_distribution_calculate(u, 1, 2.5, light_index, 0)
+        elif style == 'listen':
+            peak = self.light_num-1
+            u = cos_func(peak, float(2*math.pi/max_frames), frame_index, math.pi/2)
+            return self.Normal_distribution_calculate(u, 1, 2.5, light_index, 0)
+
+    def synthesize(self, style, color, bps, brightness):
+        """
+        Frames of a mode, from the cache if computed before
+
+        :return: max_frames, frames (max_frames*light_num*[r, g, b]), payloads (packed frames)
+        :rtype: tuple
+        """
+        key = (style, tuple(color), bps, brightness)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        max_frames = int(1/bps/self.MIN_DELAY)
+        color = np.array(color) * brightness
+        if style == 'monochromatic':
+            frames = np.tile(color, (max_frames, self.light_num, 1))
+        else:
+            grid = self.brightness_grid(style, max_frames)
+            frames = np.maximum(0, (color * grid[..., None]).astype(int))
+        payloads = list(self.pack_frames(frames))
+        self.cache[key] = (max_frames, frames.tolist(), payloads)
+        if len(self.cache) > self.CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return self.cache[key]
+
     def show(self):
-        if self.style is not None:
-            # if changed, calulate frames
-            if self.is_changed:
-                self.is_changed = False
-                self.frames.clear()
-                self.max_frames = int(1/self.bps/self.MIN_DELAY)
-                for frame_index in range(self.max_frames):
-                    frame = [] # 11*[r, g ,b]
-                    for light_index in range(self.light_num):
-                        _data = self.calulate_data(frame_index, light_index)
-                        frame.append(_data)
-                    if __name__ == '__main__':
+        """
+        Display the current mode. Animated styles show one frame every
+        MIN_DELAY on an absolute schedule, frames missed when late are
+        skipped to keep the tempo. Static content (no style, monochromatic,
+        identical frames) is displayed once, then show() blocks until the
+        next set_mode() or wake().
+        """
+        if self.is_changed:
+            # clear after is_changed, a set_mode() from now on wakes the next wait
+            self.is_changed = False
+            self.mode_changed.clear()
+            if self.style is not None:
+                self.max_frames, self.frames, self.payloads = self.synthesize(
+                    self.style, self.color, self.bps, self.brightness)
+                self.static = all(np.array_equal(payload, self.payloads[0]) for payload in self.payloads)
+                if __name__ == '__main__':
+                    for frame_index, frame in enumerate(self.frames):
                         print(f"{frame_index}:{frame}")
-                    self.frames.append(frame)
-            # dispaly frame-by-frame, to quickly change mode or close 
-            if self.current_frame >= self.max_frames:
-                self.current_frame = 0
-            self.display(self.frames[self.current_frame])
-            self.current_frame += 1
-            time.sleep(self.MIN_DELAY)
-        # --- close ---
-        else: 
-            time.sleep(self.MIN_DELAY)
+            self.next_time = None
+
+        # --- no mode yet, closed, or nothing animates ---
+        if self.style is None or len(self.payloads) == 0 or (self.static and self.next_time is not None):
+            self.idle_since = time.perf_counter()
+            self.wait_mode_change()
+            self.idle_time += time.perf_counter() - max(self.idle_since, self.frame_stats_start)
+            self.idle_since = None
+            return
+
+        now = time.perf_counter()
+        if self.next_time is None:
+            self.next_time = now
+        elif now < self.next_time:
+            if self.wait_mode_change(self.next_time - now):
+                return  # new mode, its first frame at once
+            now = time.perf_counter()
+        elif now - self.next_time >= self.MIN_DELAY:
+            late = int((now - self.next_time) / self.MIN_DELAY)
+            self.current_frame += late
+            self.next_time += late * self.MIN_DELAY
+            self.frames_late += late
+        lateness = now - self.next_time
+        self.lateness_sum += lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+
+        # dispaly frame-by-frame, to quickly change mode or close
+        self.current_frame %= self.max_frames
+        if not self.display(self.payloads[self.current_frame]):
+            self.frames_unchanged += 1
+        self.current_frame += 1
+        self.frames_shown += 1
+        self.next_time += self.MIN_DELAY
+
+    def wait_mode_change(self, timeout=None):
+        """
+        :return: True on set_mode() or wake(), False on timeout
+        :rtype: bool
+        """
+        changed = self.mode_changed.wait(timeout)
+        if changed and not self.is_changed:
+            # a wake(), nothing new for the next wait
+            self.mode_changed.clear()
+        return changed
+
+    def reset_frame_stats(self):
+        self.frame_stats_start = time.perf_counter()
+        self.frames_shown = 0
+        self.frames_unchanged = 0
+        self.frames_late = 0
+        self.lateness_sum = 0.0
+        self.lateness_max = 0.0
+        self.idle_time = 0.0
+
+    def frame_stats(self):
+        """
+        Frame timing since the last reset_frame_stats()
+
+        :return: frames shown and per second, frames written and unchanged (no
+                 i2c traffic), frames skipped when late, mean/max lateness
+                 against the schedule (ms), share of the time idle
+        :rtype: dict
+        """
+        now = time.perf_counter()
+        elapsed = max(1e-9, now - self.frame_stats_start)
+        shown = max(1, self.frames_shown)
+        idle = self.idle_time
+        idle_since = self.idle_since
+        if idle_since is not None:
+            idle += now - max(idle_since, self.frame_stats_start)
+        return {
+            'frames': self.frames_shown,
+            'fps': self.frames_shown / elapsed,
+            'written': self.frames_shown - self.frames_unchanged,
+            'unchanged': self.frames_unchanged,
+            'late': self.frames_late,
+            'lateness_mean_ms': self.lateness_sum / shown * 1000,
+            'lateness_max_ms': self.lateness_max * 1000,
+            'idle': idle / elapsed,
+        }
 
     def close(self):
         self.style = None
         self.is_changed = True
+        self.mode_changed.set()
         self.display([[0, 0, 0]]*self.light_num)
         time.sleep(self.MIN_DELAY)
 
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+'''
+Shared memory sensor bus, the latest timestamped sample of every sensor in
+one multiprocessing.shared_memory block, readable from any process on the
+machine without pipes, RPC or pickling.
+
+    # in Pidog
+    bus = SensorBus(create=True)
+    bus.write('ultrasonic', [distance])
+
+    # in another process, eg: the web server or a planner
+    bus = SensorBus(name='pidog_sensor_bus')
+    t, (distance,) = bus.read('ultrasonic')
+
+Layout, a header (magic, version, owner pid) then one row per channel:
+    seq (uint64) | check (uint64) | time (float64) | values (float64 * CHANNEL_SIZE)
+Every channel has exactly one writer and its own seqlock: the writer
+makes seq odd, writes, then makes it even again; readers retry while seq
+is odd or changed during the copy. Readers never block the writer.
+
+NumPy stores carry no memory barrier. On x86 other processes see them in
+program order, on the weakly ordered ARM of the Raspberry Pi they may
+not, and a 32 bit Pi may tear a 64 bit word. So seq alone is not
+trusted: check is the xor of the time and values words and the final
+seq, and readers also retry until it matches what they copied.
+'''
+import os
+import numpy as np
+from time import time, sleep
+from multiprocessing import shared_memory, resource_tracker
+
+DEFAULT_NAME = 'pidog_sensor_bus'
+MAGIC = 0x50444f47  # 'PDOG'
+VERSION = 2
+
+# channel: value fields
+CHANNELS = {
+    'ultrasonic': ['distance'],
+    'imu': ['ax', 'ay', 'az', 'gx', 'gy', 'gz', 'roll', 'pitch', 'yaw'],
+    'touch': ['left', 'right'],
+    'sound': ['detected', 'direction'],
+    'battery': ['voltage'],
+}
+CHANNEL_NAMES = list(CHANNELS)
+CHANNEL_SIZE = max(len(fields) for fields in CHANNELS.values())
+
+HEADER_SIZE = 24  # magic, version, owner pid (uint64 each)
+ROW_SIZE = 3 + CHANNEL_SIZE  # 8 bytes words: seq, check, time, values
+BUS_SIZE = HEADER_SIZE + len(CHANNELS) * ROW_SIZE * 8
+
+READ_RETRIES = 1000
+
+
+class SensorBus():
+    """
+    :param name: shared memory name
+    :type name: str
+    :param create: create the block (the writer side, Pidog), otherwise attach to it
+    :type create: bool
+    """
+
+    def __init__(self, name=DEFAULT_NAME, create=False):
+        self.name = name
+        self.owner = create
+        if create:
+            self.shm = self._create(name)
+        else:
+            self.shm = self._attach(name)
+        if self.shm.size < BUS_SIZE:
+            size = self.shm.size
+            self.shm.close()
+            raise ValueError(f'{name} is not a pidog sensor bus (version {VERSION}), {size} bytes')
+
+        buf = self.shm.buf
+        self._header = np.ndarray((3,), dtype=np.uint64, buffer=buf)
+        rows = len(CHANNELS)
+        # the same memory seen as uint64 for seq and check, and float64 for the rest
+        self._words = np.ndarray((rows, ROW_SIZE), dtype=np.uint64, buffer=buf, offset=HEADER_SIZE)
+        self._seq = self._words[:, 0]
+        self._rows = np.ndarray((rows, ROW_SIZE), dtype=np.float64, buffer=buf, offset=HEADER_SIZE)
+
+        if create:
+            self._rows[:] = 0
+            self._rows[:, 2] = -1  # time, never written
+            self._seq[:] = 0
+            self._words[:, 1] = np.bitwise_xor.reduce(self._words[:, 2:], axis=1)
+            self._header[0] = MAGIC
+            self._header[1] = VERSION
+            self._header[2] = os.getpid()
+        elif self._header[0] != MAGIC or self._header[1] != VERSION:
+            raise ValueError(f'{name} is not a pidog sensor bus (version {VERSION})')
+
+    @classmethod
+    def _create(cls, name):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=BUS_SIZE)
+        except FileExistsError:
+            pass
+        # left over by a run that was killed, or still owned by a running Pidog,
+        # looked at untracked: the resource tracker would unlink a live block at exit
+        old = cls._attach(name)
+        owner = None
+        if old.size >= HEADER_SIZE:
+            header = np.ndarray((3,), dtype=np.uint64, buffer=old.buf)
+            if header[0] == MAGIC and header[1] == VERSION:
+                owner = int(header[2])
+            del header
+        if owner is not None and cls._alive(owner):
+            old.close()
+            raise FileExistsError(f'{name} is written by a running process (pid {owner})')
+        # stale, maybe of another version or size: start over
+        old.close()
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=BUS_SIZE)
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # another user's process
+            return True
+        return True
+
+    @staticmethod
+    def _attach(name):
+        # readers must not unlink the block when they exit
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13, no track argument
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+            return shm
+
+    def _index(self, channel):
+        try:
+            return CHANNEL_NAMES.index(channel)
+        except ValueError:
+            raise KeyError(f'unknown sensor bus channel: {channel}')
+
+    def write(self, channel, values, t=None):
+        """
+        Publish the latest sample of a channel, only one writer per channel
+
+        :param channel: one of CHANNELS
+        :type channel: str
+        :param values: values in the order of CHANNELS[channel]
+        :type values: list
+        :param t: sample time, default time.time()
+        :type t: float
+        """
+        i = self._index(channel)
+        row = self._rows[i]
+        words = self._words[i]
+        seq = self._seq
+        end = int(seq[i]) + 2
+        seq[i] += 1  # odd: write in progress
+        row[2] = time() if t is None else t
+        row[3:3 + len(values)] = values
+        words[1] = np.bitwise_xor.reduce(words[2:]) ^ np.uint64(end)
+        seq[i] += 1  # even: consistent
+
+    def read(self, channel):
+        """
+        Latest sample of a channel
+
+        :return: time (-1 if never written) and values list
+        :rtype: tuple
+        """
+        i = self._index(channel)
+        n = len(CHANNELS[channel])
+        seq = self._seq
+        words = self._words[i]
+        for _ in range(READ_RETRIES):
+            start = int(seq[i])
+            if start & 1:
+                # writer in progress, let it finish
+                sleep(0)
+                continue
+            copy = words[1:].copy()  # check, time, values
+            if int(seq[i]) != start or int(np.bitwise_xor.reduce(copy[1:])) ^ start != int(copy[0]):
+                # changed during the copy, or stores seen out of order
+                sleep(0)
+                continue
+            data = copy[1:].view(np.float64)
+            return float(data[0]), data[1:1 + n].tolist()
+        raise TimeoutError(f'sensor bus channel {channel} kept changing')
+
+    def read_dict(self, channel):
+        """
+        Latest sample of a channel as a dict with a 'time' key
+        """
+        t, values = self.read(channel)
+        data = dict(zip(CHANNELS[channel], values))
+        data['time'] = t
+        return data
+
+    def snapshot(self):
+        """
+        Latest sample of every channel, {channel: {'time': t, field: value, ...}}
+        """
+        return {channel: self.read_dict(channel) for channel in CHANNEL_NAMES}
+
+    def close(self):
+        # release the views before the block
+        self._header = self._seq = self._rows = self._words = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
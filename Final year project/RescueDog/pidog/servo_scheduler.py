@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import threading
+from time import sleep, perf_counter
+from .console import error
+
+
+class ServoTrack():
+    """
+    Interpolation state of one servo group (legs, head or tail)
+
+    :param robot: robot_hat.Robot of the group
+    :param buffer: ActionBuffer feeding the group
+    :param get_speed: callable returning the current speed, 0-100
+    :param transform: callable converting a frame into servo positions, optional
+    :param on_frame: callable(frame) run when a frame starts, optional
+    :param source: callable returning the next frame or None, used while the buffer is empty, optional
+    :param source_active: callable, True while source has frames to give
+    """
+
+    def __init__(self, name, robot, buffer, get_speed, transform=None, on_frame=None,
+                 source=None, source_active=None):
+        self.name = name
+        self.robot = robot
+        self.buffer = buffer
+        self.get_speed = get_speed
+        self.transform = transform
+        self.on_frame = on_frame
+        self.source = source
+        self.source_active = source_active
+        self.from_source = False
+        self.steps = 0  # 0 means idle
+        self.step = 0
+        self.deltas = []
+        self.generation = None
+
+    def is_active(self):
+        return self.steps > 0
+
+    def is_streaming(self):
+        return self.source_active is not None and self.source_active()
+
+    def next_frame(self):
+        frame = self.buffer.peek(timeout=0)
+        self.from_source = False
+        if frame is None and self.source is not None:
+            frame = self.source()
+            self.from_source = True
+        return frame
+
+    def begin(self, frame, rate):
+        # same timing rules as Robot.servo_move
+        if self.on_frame is not None:
+            self.on_frame(frame)
+        targets = self.transform(frame) if self.transform is not None else frame
+        positions = self.robot.servo_positions
+        deltas = [targets[i] - positions[i] for i in range(len(positions))]
+        max_delta = max(abs(d) for d in deltas)
+
+        speed = min(100, max(0, self.get_speed()))
+        total_time = (-9.9 * speed + 1000) / 1000  # second
+        if max_delta / total_time > self.robot.max_dps:
+            total_time = max_delta / self.robot.max_dps
+
+        if self.from_source:
+            # a streamed frame is one tick, the source follows the real frame time
+            self.steps = 1
+        else:
+            self.steps = max(1, int(total_time * rate))
+        self.step = 0
+        self.deltas = [d / self.steps for d in deltas]
+        self.generation = self.buffer.generation
+
+    def advance(self):
+        positions = self.robot.servo_positions
+        for i in range(len(positions)):
+            positions[i] += self.deltas[i]
+        self.step += 1
+
+    def finish(self):
+        self.steps = 0
+        if not self.from_source:
+            self.buffer.pop()
+
+
+class ServoScheduler():
+    """
+    One fixed-rate loop interpolating legs, head and tail together and
+    writing all servos in a single pass per tick, instead of one
+    Robot.servo_move loop per thread.
+
+    Only channels whose angle changed since the last tick are written.
+    """
+
+    DEFAULT_RATE = 100  # Hz
+    IDLE_TIMEOUT = 0.1  # second, max blocking time while every buffer is empty
+    ANGLE_RESOLUTION = 0.01  # degree, smaller changes are not written
+
+    def __init__(self, tracks, rate=DEFAULT_RATE):
+        self.tracks = tracks
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.running = False
+        self.thread = None
+        self._wake = threading.Event()
+        for track in self.tracks:
+            track.buffer.add_listener(self._wake)
+        self._written = [[None] * len(track.robot.servo_positions) for track in self.tracks]
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(name='servo_scheduler_thread', target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+
+    def wake(self):
+        # leave the idle wait, eg: a track source became active
+        self._wake.set()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    # stats
+    # =================================================================
+    def reset_stats(self):
+        with self._stats_lock:
+            self._ticks = 0
+            self._overruns = 0
+            self._jitter_sum = 0.0
+            self._jitter_max = 0.0
+            self._work_sum = 0.0
+            self._work_max = 0.0
+            self._writes = 0
+
+    def stats(self):
+        """
+        Timing statistics since the last reset_stats()
+
+        :return: ticks, overruns, mean/max jitter (ms), mean/max tick work time (ms), servo writes
+        :rtype: dict
+        """
+        with self._stats_lock:
+            ticks = max(1, self._ticks)
+            return {
+                'rate': self.rate,
+                'ticks': self._ticks,
+                'overruns': self._overruns,
+                'jitter_mean_ms': self._jitter_sum / ticks * 1000,
+                'jitter_max_ms': self._jitter_max * 1000,
+                'work_mean_ms': self._work_sum / ticks * 1000,
+                'work_max_ms': self._work_max * 1000,
+                'writes': self._writes,
+                'writes_per_tick': self._writes / ticks,
+            }
+
+    # loop
+    # =================================================================
+    def _is_idle(self):
+        for track in self.tracks:
+            if track.is_active() or not track.buffer.is_empty() or track.is_streaming():
+                return False
+        return True
+
+    def _loop(self):
+        next_tick = perf_counter()
+        while self.running:
+            # block while there is nothing to move
+            self._wake.clear()
+            if self._is_idle():
+                self._wake.wait(self.IDLE_TIMEOUT)
+                next_tick = perf_counter()
+                continue
+
+            start = perf_counter()
+            jitter = abs(start - next_tick)
+            try:
+                writes = self._tick()
+            except Exception as e:
+                error(f'\r_servo_scheduler Exception:{e}')
+                self.running = False
+                break
+            work = perf_counter() - start
+
+            with self._stats_lock:
+                self._ticks += 1
+                self._jitter_sum += jitter
+                self._jitter_max = max(self._jitter_max, jitter)
+                self._work_sum += work
+                self._work_max = max(self._work_max, work)
+                self._writes += writes
+
+            # absolute schedule, missed ticks are dropped instead of accumulated
+            next_tick += self.period
+            delay = next_tick - perf_counter()
+            if delay < 0:
+                with self._stats_lock:
+                    self._overruns += 1
+                next_tick = perf_counter()
+            else:
+                sleep(delay)
+
+    def _tick(self):
+        for track in self.tracks:
+            # the buffer was cleared, stop where the servos are now
+            if track.is_active() and not track.from_source \
+                    and track.generation != track.buffer.generation:
+                track.steps = 0
+            if not track.is_active():
+                frame = track.next_frame()
+                if frame is None:
+                    continue
+                track.begin(frame, self.rate)
+            track.advance()
+            if track.step >= track.steps:
+                track.finish()
+        return self._write()
+
+    def _write(self):
+        # one pass over every channel of every group
+        writes = 0
+        for n, track in enumerate(self.tracks):
+            robot = track.robot
+            written = self._written[n]
+            for i, position in enumerate(robot.servo_positions):
+                angle = robot.direction[i] * (robot.origin_positions[i] + position + robot.offset[i])
+                if written[i] is not None and abs(angle - written[i]) < self.ANGLE_RESOLUTION:
+                    continue
+                robot.servo_list[i].angle(angle)
+                written[i] = angle
+                writes += 1
+        return writes
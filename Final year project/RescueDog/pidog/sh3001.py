@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
+import os
 import time
-from robot_hat import I2C, fileDB
+import uuid
+import zlib
+from .backend import I2C, fileDB
 
 # from filedb import fileDB
 
@@ -34,6 +37,26 @@ def stop_func():
     return False
 
 
+# per robot identifiers, the first readable one keys the calibration cache
+HOST_ID_FILES = ['/sys/firmware/devicetree/base/serial-number',  # raspberry pi serial number
+                 '/etc/machine-id']
+
+
+def host_id():
+    '''
+    Identifier of this robot: the board serial number, else the os machine id, else the mac address
+    '''
+    for path in HOST_ID_FILES:
+        try:
+            with open(path) as f:
+                value = f.read().strip('\x00\n ')
+            if value:
+                return value
+        except OSError:
+            pass
+    return '%012x' % uuid.getnode()
+
+
 # endregion: General function
 
 
@@ -388,6 +411,7 @@ class Sh3001(I2C):
         if not self.is_avaliable():
             raise IOError("SH3001 is not avaliable")
         self.sh3001_init()
+        self.db_path = db
         self.db = fileDB(db=db)
         self.acc_offset = self.get_from_config('calibrate_offset_list',
                                                default_value=str(
@@ -407,6 +431,21 @@ class Sh3001(I2C):
         value = [float(i.strip()) for i in value.strip("[]").split(",")]
         return list(value)
 
+    def device_id(self):
+        '''
+        Identifier of this sensor on this robot, used to key the calibration
+        cache. The SH3001 has no serial number, so it is the robot's
+        (host_id()), the bus and address, and the config file with its
+        mtime: a cache copied to another robot, or a new config, misses.
+        '''
+        try:
+            mtime = os.path.getmtime(self.db_path)
+        except (OSError, TypeError):
+            mtime = 0
+        config = zlib.crc32(('%s:%d' % (self.db_path, mtime)).encode())
+        return 'sh3001-%s-%s-%#x-%08x' % (host_id(), getattr(self, '_bus', 1),
+                                           getattr(self, 'address', self.SH3001_ADDRESS), config)
+
     def new_list(self, value):
         return [value for i in range(3)]
 
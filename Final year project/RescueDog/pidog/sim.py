@@ -0,0 +1,937 @@
+#!/usr/bin/env python3
+'''
+Simulated hardware backend, selected with PIDOG_BACKEND=sim (see
+pidog/backend.py). It stands in for robot_hat, smbus, spidev and gpiozero,
+with every model driven by one SimWorld:
+
+- servos slew towards their command at the max_dps of their Robot
+  (Pidog sets LEGS_DPS, HEAD_DPS, TAIL_DPS), every servo write is an i2c
+  transaction with the bus latency
+- the body follows the legs: the feet on the ground give the body roll,
+  pitch and height, and their slip in the body frame moves the dog on a
+  2D map
+- the SH3001 is simulated at register level from that pose, with noise
+  and gyro bias, so the calibration and filters run unchanged
+- the ultrasonic casts a beam from the head into the walls of the map
+- touch pins and sound direction are set from the world
+
+Hardware timings (servo steps, slew, bus latency, ultrasonic echo) run
+on the world clock, time_scale times faster than real time.
+
+    PIDOG_BACKEND=sim PIDOG_SIM_MAP=room.json PIDOG_SIM_TIME_SCALE=4 python3 examples/3_patrol.py
+
+    from pidog import Pidog, sim
+    sim.world.add_box(60, -20, 20, 40)  # cm, before Pidog()
+    my_dog = Pidog()
+    sim.world.emit_sound(0, 100)
+    print(sim.world.pose())
+
+Maps are json files, in cm, x forward of the start pose, y to the left:
+    {"walls": [[x1, y1, x2, y2], ...], "boxes": [[x, y, width, depth], ...],
+     "start": [x, y, heading]}
+'''
+import os
+import json
+import random
+import threading
+from time import sleep, perf_counter
+from math import sin, cos, acos, atan, atan2, sqrt, radians, degrees
+from multiprocessing import RawArray
+import numpy as np
+from .kinematics import body_struct, LEGS_SIGN
+
+# pidog mechanics, same as Pidog
+LEG = 42  # mm
+FOOT = 76
+BODY_LENGTH = 117
+BODY_WIDTH = 98
+BODY_STRUCT = body_struct(BODY_WIDTH, BODY_LENGTH)
+
+ACC_LSB_PER_G = 16384
+GYRO_LSB_PER_DPS = 32768 / 2000
+SOUND_SPEED = 34300  # cm/s
+
+MCU_ADDRESS = 0x14
+SH3001_ADDRESS = 0x36
+RGB_STRIP_ADDRESS = 0x74
+
+
+def _int16_bytes(value):
+    value = int(max(-32768, min(32767, round(value)))) & 0xFFFF
+    return [value & 0xFF, value >> 8]  # low byte first
+
+
+def leg_fk(alpha, beta):
+    """
+    Foot [y, z] in mm from the leg angles in degrees, inverse of Pidog.coord2polar
+    """
+    alpha = radians(alpha)
+    beta = radians(beta)
+    u = sqrt(max(1e-9, LEG**2 + FOOT**2 - 2 * LEG * FOOT * cos(beta)))
+    angle2 = acos(max(-1, min(1, (LEG**2 + u**2 - FOOT**2) / (2 * LEG * u))))
+    angle1 = alpha - angle2
+    return u * sin(angle1), u * cos(angle1)
+
+
+class SimClock():
+    """
+    Simulated time, time_scale times faster than perf_counter()
+    """
+
+    def __init__(self, time_scale=1.0):
+        self._real_origin = perf_counter()
+        self._sim_origin = 0.0
+        self._time_scale = float(time_scale)
+
+    @property
+    def time_scale(self):
+        return self._time_scale
+
+    @time_scale.setter
+    def time_scale(self, value):
+        # rebase, simulated time stays continuous
+        self._sim_origin = self.now()
+        self._real_origin = perf_counter()
+        self._time_scale = float(value)
+
+    def now(self):
+        return self._sim_origin + (perf_counter() - self._real_origin) * self._time_scale
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            sleep(seconds / self._time_scale)
+
+
+class SimWorld():
+    """
+    The simulated robot and its surroundings
+
+    :param time_scale: hardware timings run this many times faster than real time
+    :type time_scale: float
+    :param seed: noise seed, None for random
+    """
+
+    CHANNELS = 16
+    SERVO_DPS = 428  # degrees per second of a servo not driven by a Robot
+    I2C_CLOCK = 100000  # Hz, 9 clocks per byte
+    I2C_OVERHEAD = 0.00005  # second per transaction, start, address, stop and driver
+    ULTRASONIC_OFFSET = 6  # cm, sensor ahead of the body center
+    ULTRASONIC_BEAM = 15  # degrees, full cone
+    ULTRASONIC_NOISE = 0.3  # cm
+    ACC_NOISE = 20  # LSB
+    GYRO_NOISE = 3  # LSB
+    GYRO_BIAS = [12, -7, 5]  # LSB
+    CONTACT = 3  # mm, feet closer than this to the ground plane are on the ground
+    TEMPERATURE = 30  # degree C
+    BATTERY = 7.6  # V
+    SOUND_BUSY_PIN = 6  # gpio of the sound direction module
+
+    # shared pose layout
+    X, Y, HEADING, ROLL, PITCH, HEIGHT = range(6)
+
+    def __init__(self, time_scale=1.0, seed=None):
+        self.clock = SimClock(time_scale)
+        self.rng = random.Random(seed)
+        self.walls = np.zeros((0, 4))
+        self.slope = [0.0, 0.0]  # ground roll, pitch in degrees
+        self.temperature = self.TEMPERATURE
+        self.battery = self.BATTERY
+        self.channels = {}  # robot name: servo channels
+        self.pins = {}  # pin name: value
+        self.i2c_devices = {
+            MCU_ADDRESS: RegisterDevice(),
+            SH3001_ADDRESS: Sh3001Device(self),
+            RGB_STRIP_ADDRESS: PagedRegisterDevice(),
+        }
+        self._lock = threading.Lock()
+        self._irqs = {}  # pin name: [(handler, trigger)]
+        self._gpio_devices = {}  # gpio number: [DigitalInputDevice]
+        self._sound = None  # world (x, y) of the last sound, until read
+        # shared with the sensory process: servos and pose
+        self._servos = np.frombuffer(RawArray('d', self.CHANNELS * 4), dtype=np.float64).reshape(-1, 4)
+        self._servos[:, 3] = self.SERVO_DPS
+        self._pose = np.frombuffer(RawArray('d', 6), dtype=np.float64)
+        self._feet = None  # feet in the body frame at the last update, mm
+        self._imu_last = None  # (time, roll, pitch, heading)
+        self.set_room(400, 300)
+
+    # time
+    # =================================================================
+    @property
+    def time_scale(self):
+        return self.clock.time_scale
+
+    @time_scale.setter
+    def time_scale(self, value):
+        self.clock.time_scale = value
+
+    def now(self):
+        return self.clock.now()
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    def i2c_transaction(self, nbytes):
+        self.clock.sleep(self.I2C_OVERHEAD + nbytes * 9 / self.I2C_CLOCK)
+
+    # map
+    # =================================================================
+    def set_room(self, length, width):
+        """
+        Empty rectangular room, in cm, centered on the dog facing +x
+        """
+        x = length / 2
+        y = width / 2
+        self.walls = np.array([[-x, -y, x, -y], [x, -y, x, y], [x, y, -x, y], [-x, y, -x, -y]], dtype=float)
+        self.set_pose(0, 0, 0)
+
+    def add_wall(self, x1, y1, x2, y2):
+        self.walls = np.vstack([self.walls, [x1, y1, x2, y2]])
+
+    def add_box(self, x, y, width, depth):
+        """
+        Box with its near left corner at (x, y), width along y, depth along x
+        """
+        corners = [(x, y), (x + depth, y), (x + depth, y - width), (x, y - width)]
+        for i in range(4):
+            self.add_wall(*corners[i], *corners[(i + 1) % 4])
+
+    def load_map(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.walls = np.zeros((0, 4))
+        for wall in data.get('walls', []):
+            self.add_wall(*wall)
+        for box in data.get('boxes', []):
+            self.add_box(*box)
+        self.set_pose(*data.get('start', [0, 0, 0]))
+
+    def set_pose(self, x, y, heading=0):
+        """
+        :param x: cm
+        :param y: cm
+        :param heading: degrees, counterclockwise from +x
+        """
+        self._pose[self.X] = x
+        self._pose[self.Y] = y
+        self._pose[self.HEADING] = heading
+        self._imu_last = None
+
+    def pose(self):
+        """
+        :return: x, y (cm), heading (degrees), roll, pitch (degrees), body height (mm)
+        :rtype: tuple
+        """
+        return tuple(float(v) for v in self._pose)
+
+    # servos
+    # =================================================================
+    def add_robot(self, name, channels):
+        self.channels[name] = [_channel_number(channel) for channel in channels]
+
+    def servo_command(self, channel, angle, dps):
+        now = self.clock.now()
+        servo = self._servos[channel]
+        servo[1] = self.servo_angle(channel, now)
+        servo[0] = angle
+        servo[2] = now
+        servo[3] = dps
+
+    def servo_angle(self, channel, now=None):
+        """
+        Where the servo is, slewing towards its command at its dps
+        """
+        target, position, start, dps = self._servos[channel]
+        now = self.clock.now() if now is None else now
+        step = dps * max(0.0, now - start)
+        delta = target - position
+        if abs(delta) <= step:
+            return float(target)
+        return float(position + step * (1 if delta > 0 else -1))
+
+    def joint_angles(self, name, now=None):
+        now = self.clock.now() if now is None else now
+        return [self.servo_angle(channel, now) for channel in self.channels.get(name, [])]
+
+    # body
+    # =================================================================
+    def feet(self, now=None):
+        """
+        Feet in the body frame, mm, 4 * (x right, y back, z up), shoulders at z = 0
+        """
+        angles = self.joint_angles('legs', now)
+        if len(angles) != 8:
+            return None
+        feet = np.zeros((4, 3))
+        for i in range(4):
+            sign = LEGS_SIGN[i]
+            y, z = leg_fk(angles[2 * i] * sign, angles[2 * i + 1] * sign + 90)
+            feet[i] = [BODY_STRUCT[0][i], BODY_STRUCT[1][i] + y, -z]
+        return feet
+
+    def ground(self, feet):
+        """
+        Ground plane z = a * x + b * y + c under the feet, and the feet on it
+        """
+        lowest = np.argsort(feet[:, 2])
+        three = feet[lowest[:3]]
+        A = np.column_stack([three[:, 0], three[:, 1], np.ones(3)])
+        try:
+            plane = np.linalg.solve(A, three[:, 2])
+        except np.linalg.LinAlgError:
+            plane = np.array([0.0, 0.0, three[:, 2].mean()])
+        last = feet[lowest[3]]
+        if abs(last[2] - (plane[0] * last[0] + plane[1] * last[1] + plane[2])) < self.CONTACT:
+            # all four on the ground, least squares plane
+            A = np.column_stack([feet[:, 0], feet[:, 1], np.ones(4)])
+            plane = np.linalg.lstsq(A, feet[:, 2], rcond=None)[0]
+        residual = feet[:, 2] - (plane[0] * feet[:, 0] + plane[1] * feet[:, 1] + plane[2])
+        return plane, np.abs(residual) < self.CONTACT
+
+    def update(self):
+        """
+        Move the body with the legs: tilt from the ground plane, and
+        translation and rotation from the feet on the ground, which do not
+        slip on the floor
+        """
+        with self._lock:
+            feet = self.feet()
+            if feet is None:
+                return
+            plane, contact = self.ground(feet)
+            a, b, c = plane
+            # the body is tilted opposite to the ground seen from the body
+            self._pose[self.ROLL] = degrees(atan(a))
+            self._pose[self.PITCH] = degrees(atan(-b))
+            self._pose[self.HEIGHT] = -c
+
+            last = self._feet
+            self._feet = (feet, contact)
+            if last is None:
+                return
+            stance = contact & last[1]
+            if np.count_nonzero(stance) < 2:
+                return
+            p = last[0][stance, :2]
+            q = feet[stance, :2]
+            # feet seen from the body moved by q = R p + t, the body moved the other way
+            pc = p - p.mean(axis=0)
+            qc = q - q.mean(axis=0)
+            angle = atan2(np.sum(pc[:, 0] * qc[:, 1] - pc[:, 1] * qc[:, 0]), np.sum(pc * qc))
+            R = np.array([[cos(angle), -sin(angle)], [sin(angle), cos(angle)]])
+            t = q.mean(axis=0) - R @ p.mean(axis=0)
+            origin = -R.T @ t  # new body center in the old body frame
+            forward = -origin[1] / 10  # cm, body y points back
+            left = -origin[0] / 10  # body x points right
+            heading = radians(self._pose[self.HEADING])
+            self._pose[self.X] += forward * cos(heading) - left * sin(heading)
+            self._pose[self.Y] += forward * sin(heading) + left * cos(heading)
+            # x right, y back is a clockwise frame seen from above
+            self._pose[self.HEADING] += degrees(angle)
+
+    # sensors
+    # =================================================================
+    def imu_sample(self):
+        """
+        Raw SH3001 accelerometer and gyro, LSB, in the sensor axes of
+        pidog/imu_fusion.py: x down, roll on z, pitch on y
+        """
+        self.update()
+        # rates per wall clock second, Pidog integrates them in real time whatever the time scale
+        now = perf_counter()
+        roll = self._pose[self.ROLL] + self.slope[0]
+        pitch = self._pose[self.PITCH] + self.slope[1]
+        heading = self._pose[self.HEADING]
+        rates = [0.0, 0.0, 0.0]
+        if self._imu_last is not None and now > self._imu_last[0]:
+            dt = now - self._imu_last[0]
+            rates = [(roll - self._imu_last[1]) / dt, (pitch - self._imu_last[2]) / dt,
+                     (heading - self._imu_last[3]) / dt]
+        self._imu_last = (now, roll, pitch, heading)
+
+        r = radians(roll)
+        p = radians(pitch)
+        noise = lambda sigma: self.rng.gauss(0, sigma)
+        acc = [-ACC_LSB_PER_G * cos(p) * cos(r) + noise(self.ACC_NOISE),
+               -ACC_LSB_PER_G * sin(p) + noise(self.ACC_NOISE),
+               -ACC_LSB_PER_G * cos(p) * sin(r) + noise(self.ACC_NOISE)]
+        gyro = [-rates[2] * GYRO_LSB_PER_DPS + self.GYRO_BIAS[0] + noise(self.GYRO_NOISE),
+                rates[0] * GYRO_LSB_PER_DPS + self.GYRO_BIAS[1] + noise(self.GYRO_NOISE),
+                -rates[1] * GYRO_LSB_PER_DPS + self.GYRO_BIAS[2] + noise(self.GYRO_NOISE)]
+        return acc, gyro
+
+    def ray(self, x, y, bearing):
+        """
+        Distance in cm to the first wall from (x, y) along bearing (degrees), inf if none
+        """
+        if len(self.walls) == 0:
+            return float('inf')
+        dx, dy = cos(radians(bearing)), sin(radians(bearing))
+        x1, y1, x2, y2 = self.walls.T
+        ex, ey = x2 - x1, y2 - y1
+        denom = dx * ey - dy * ex
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = ((x1 - x) * ey - (y1 - y) * ex) / denom
+            s = ((x1 - x) * dy - (y1 - y) * dx) / denom
+        hits = t[(denom != 0) & (t > 0) & (s >= 0) & (s <= 1)]
+        return float(hits.min()) if len(hits) > 0 else float('inf')
+
+    def distance(self):
+        """
+        Ultrasonic distance in cm, the nearest echo within the beam
+        """
+        x, y, heading = self._pose[self.X], self._pose[self.Y], self._pose[self.HEADING]
+        head = self.channels.get('head')
+        # head yaw, positive turns left
+        bearing = heading + (self.servo_angle(head[0]) if head else 0)
+        sx = x + self.ULTRASONIC_OFFSET * cos(radians(bearing))
+        sy = y + self.ULTRASONIC_OFFSET * sin(radians(bearing))
+        half = self.ULTRASONIC_BEAM / 2
+        return min(self.ray(sx, sy, bearing + offset) for offset in np.linspace(-half, half, 5))
+
+    def emit_sound(self, x, y):
+        """
+        A sound at (x, y) cm, detected by the sound direction module until read
+        """
+        pending = self._sound is not None
+        self._sound = (x, y)
+        if not pending:
+            self._gpio_changed(self.SOUND_BUSY_PIN)
+
+    def sound_bearing(self):
+        """
+        Bearing of the pending sound relative to the dog, degrees clockwise
+        from the nose in 20 degrees steps like the module, None if none
+        """
+        if self._sound is None:
+            return None
+        x, y = self._sound
+        self._sound = None
+        self._gpio_changed(self.SOUND_BUSY_PIN)
+        bearing = degrees(atan2(y - self._pose[self.Y], x - self._pose[self.X])) - self._pose[self.HEADING]
+        return int(round(-bearing / 20)) * 20 % 360
+
+    def set_pin(self, name, value):
+        """
+        Set an input pin, eg: world.set_pin('D2', 1) touches the left touch pad
+        """
+        old = self.pins.get(name, 0)
+        self.pins[name] = value
+        if old != value:
+            # like robot_hat Pin.irq on a pulled up input: falling is pressed (value 1), rising released
+            for handler, trigger in self._irqs.get(name, []):
+                if trigger == Pin.IRQ_RISING_FALLING or \
+                        (trigger == Pin.IRQ_FALLING and value) or (trigger == Pin.IRQ_RISING and not value):
+                    handler()
+
+    def _gpio_changed(self, pin):
+        # gpiozero DigitalInputDevice callbacks, without arguments
+        value = self.gpio(pin)
+        for device in self._gpio_devices.get(pin, []):
+            callback = device.when_activated if value else device.when_deactivated
+            if callback is not None:
+                callback()
+
+    def gpio(self, pin):
+        if pin == self.SOUND_BUSY_PIN:
+            # busy is pulled low while a direction is ready
+            return 0 if self._sound is not None else 1
+        return self.pins.get(f'GPIO{pin}', 0)
+
+
+def _channel_number(channel):
+    if isinstance(channel, str):
+        return int(channel.strip('P'))
+    return int(channel)
+
+
+# i2c devices
+# =================================================================
+class RegisterDevice():
+    """
+    i2c device with 256 byte registers
+    """
+
+    def __init__(self):
+        self.registers = bytearray(256)
+
+    def read(self, reg, length):
+        return [self.registers[(reg + i) & 0xFF] for i in range(length)]
+
+    def write(self, reg, data):
+        for i, value in enumerate(data):
+            self.registers[(reg + i) & 0xFF] = value & 0xFF
+
+
+class PagedRegisterDevice(RegisterDevice):
+    """
+    Register pages selected by PAGE_REG, like the SLED1735 of the rgb strip
+    """
+
+    PAGE_REG = 0xFD
+
+    def __init__(self):
+        super().__init__()
+        self.page = 0
+        self.pages = {}  # page: bytearray
+
+    def _page(self):
+        return self.pages.setdefault(self.page, bytearray(256))
+
+    def read(self, reg, length):
+        page = self._page()
+        return [page[(reg + i) & 0xFF] for i in range(length)]
+
+    def write(self, reg, data):
+        if reg == self.PAGE_REG and len(data) > 0:
+            self.page = data[0]
+            return
+        page = self._page()
+        for i, value in enumerate(data):
+            page[(reg + i) & 0xFF] = value & 0xFF
+
+
+class Sh3001Device(RegisterDevice):
+
+    CHIP_ID = 0x0F
+    DATA = 0x00  # acc x, y, z, gyro x, y, z, low byte first
+    TEMP_CONF0 = 0x20
+    TEMP_ZL = 0x0C
+
+    def __init__(self, world):
+        super().__init__()
+        self.world = world
+        self.registers[self.CHIP_ID] = 0x61
+
+    def read(self, reg, length):
+        if reg < self.DATA + 12 and reg + length > self.DATA:
+            acc, gyro = self.world.imu_sample()
+            data = []
+            for value in acc + gyro:
+                data += _int16_bytes(value)
+            self.registers[self.DATA:self.DATA + 12] = bytes(data)
+        if reg <= self.TEMP_ZL < reg + length:
+            # Sh3001.sh3001_gettempdata: (TEMP_ZL - TEMP_CONF0[1]) / 16 + 25
+            raw = self.registers[self.TEMP_CONF0 + 1] + round((self.world.temperature - 25) * 16)
+            self.registers[self.TEMP_ZL] = max(0, min(255, raw))
+        return super().read(reg, length)
+
+
+# robot_hat
+# =================================================================
+class fileDB():
+    """
+    Reads the robot_hat config file if there is one, changes stay in memory
+    """
+
+    def __init__(self, db=None, mode=None, owner=None):
+        self.db = db
+        self.values = {}
+        if db is not None and os.path.isfile(db):
+            with open(db) as f:
+                for line in f:
+                    if '=' in line and not line.lstrip().startswith('#'):
+                        name, value = line.split('=', 1)
+                        self.values[name.strip()] = value.strip()
+
+    def get(self, name, default_value=None):
+        return self.values.get(name, default_value)
+
+    def set(self, name, value):
+        self.values[name] = str(value)
+
+
+class I2C():
+
+    def __init__(self, address=None, bus=1, *args, **kwargs):
+        self.address = address
+        self._bus = bus
+
+    def _device(self):
+        device = world.i2c_devices.get(self.address)
+        if device is None:
+            raise OSError(f'[Errno 121] Remote I/O error, no device at {self.address:#x}')
+        return device
+
+    def is_avaliable(self):
+        return self.address in world.i2c_devices
+
+    def is_ready(self):
+        return self.is_avaliable()
+
+    def scan(self):
+        return sorted(world.i2c_devices)
+
+    def write(self, data):
+        data = [data] if isinstance(data, int) else list(data)
+        world.i2c_transaction(len(data))
+        self._device().write(data[0], data[1:])
+
+    def read(self, length=1):
+        world.i2c_transaction(length)
+        return self._device().read(0, length)
+
+    def mem_write(self, data, memaddr):
+        data = [data] if isinstance(data, int) else list(data)
+        world.i2c_transaction(len(data) + 1)
+        self._device().write(memaddr, data)
+
+    def mem_read(self, length, memaddr):
+        world.i2c_transaction(length + 1)
+        return self._device().read(memaddr, length)
+
+
+class Servo(I2C):
+    """
+    One pwm channel of the hat mcu, with a simulated servo on it
+    """
+
+    REG_CHN = 0x20
+    PERIOD = 4095
+    MAX_PW = 2500  # us
+    MIN_PW = 500
+    FREQ = 50
+
+    def __init__(self, channel, address=MCU_ADDRESS, *args, **kwargs):
+        super().__init__(address=address)
+        self.channel = _channel_number(channel)
+        self.max_dps = SimWorld.SERVO_DPS
+
+    def angle(self, angle):
+        angle = max(-90, min(90, angle))
+        pulse_width = self.MIN_PW + (angle + 90) / 180 * (self.MAX_PW - self.MIN_PW)
+        value = int(pulse_width / (1000000 / self.FREQ) * self.PERIOD)
+        self.write([self.REG_CHN + self.channel, value >> 8, value & 0xFF])
+        world.servo_command(self.channel, angle, self.max_dps)
+
+    def pulse_width_time(self, pulse_width_time):
+        self.angle((pulse_width_time - self.MIN_PW) / (self.MAX_PW - self.MIN_PW) * 180 - 90)
+
+
+class Robot():
+    """
+    Same interface and timing as robot_hat.Robot
+    """
+
+    max_dps = 428  # degrees per second
+
+    def __init__(self, pin_list, db=None, name=None, init_angles=None, init_order=None, **kwargs):
+        self.pin_num = len(pin_list)
+        self.name = name if name is not None else 'other'
+        self.offset_value_name = f"{self.name}_servo_offset_list"
+        self.db = fileDB(db=db)
+        offset = self.db.get(self.offset_value_name, default_value=str(self.new_list(0)))
+        self.offset = [float(i.strip()) for i in offset.strip('[]').split(',')]
+        self.servo_list = []
+        self.servo_positions = []
+        self.origin_positions = self.new_list(0)
+        self.direction = self.new_list(1)
+        if init_angles is None:
+            init_angles = self.new_list(0)
+        if init_order is None:
+            init_order = range(self.pin_num)
+        for i, pin in enumerate(pin_list):
+            self.servo_list.append(Servo(pin))
+            self.servo_positions.append(init_angles[i])
+        world.add_robot(self.name, pin_list)
+        for i in init_order:
+            self.servo_list[i].angle(self.offset[i] + self.servo_positions[i])
+            world.sleep(0.15)
+        # like servo_write_raw, the head and tail built at the same time must not
+        # move the body while the legs are half set
+        if self.name == 'legs':
+            world.update()
+
+    def new_list(self, default_value):
+        return [default_value] * self.pin_num
+
+    def servo_write_raw(self, angle_list):
+        for i in range(self.pin_num):
+            self.servo_list[i].max_dps = self.max_dps
+            self.servo_list[i].angle(angle_list[i])
+        if self.name == 'legs':
+            world.update()
+
+    def servo_write_all(self, angles):
+        rel_angles = []
+        for i in range(self.pin_num):
+            rel_angles.append(self.direction[i] * (self.origin_positions[i] + angles[i] + self.offset[i]))
+        self.servo_write_raw(rel_angles)
+
+    def servo_move(self, targets, speed=50, bpm=None):
+        speed = max(0, min(100, speed))
+        step_time = 10  # ms
+        delta = [targets[i] - self.servo_positions[i] for i in range(self.pin_num)]
+        max_delta = int(max(abs(d) for d in delta))
+        if max_delta == 0:
+            world.sleep(step_time / 1000)
+            return
+        if bpm:
+            total_time = 60 / bpm * 1000
+        else:
+            total_time = -9.9 * speed + 1000
+        if max_delta / total_time * 1000 > self.max_dps:
+            total_time = max_delta / self.max_dps * 1000
+        max_step = max(1, int(total_time / step_time))
+        steps = [d / max_step for d in delta]
+        for _ in range(max_step):
+            start = world.now()
+            for j in range(self.pin_num):
+                self.servo_positions[j] += steps[j]
+            self.servo_write_all(self.servo_positions)
+            world.sleep(step_time / 1000 - (world.now() - start))
+
+    def set_offset(self, offset_list):
+        offset_list = [min(max(offset, -20), 20) for offset in offset_list]
+        self.db.set(self.offset_value_name, str(offset_list))
+        self.offset = offset_list
+
+    def calibration(self):
+        self.servo_positions = list(self.origin_positions)
+        self.servo_write_all(self.servo_positions)
+
+    def reset(self, angles=None):
+        if angles is None:
+            angles = self.new_list(0)
+        self.servo_positions = list(angles)
+        self.servo_write_all(self.servo_positions)
+
+    def soft_reset(self):
+        self.servo_write_all(self.new_list(0))
+
+
+class Pin():
+
+    OUT = 0x01
+    IN = 0x02
+    PULL_UP = 0x11
+    PULL_DOWN = 0x12
+    PULL_NONE = None
+    IRQ_FALLING = 0x21
+    IRQ_RISING = 0x22
+    IRQ_RISING_FALLING = 0x23
+
+    def __init__(self, pin, mode=None, pull=None, active_state=None, *args, **kwargs):
+        self._name = pin
+        self._mode = mode
+        self._pull = pull
+
+    def name(self):
+        return self._name
+
+    def value(self, value=None):
+        if value is None:
+            return world.pins.get(self._name, 0)
+        world.pins[self._name] = 1 if value else 0
+        return world.pins[self._name]
+
+    def on(self):
+        return self.value(1)
+
+    def off(self):
+        return self.value(0)
+
+    high = on
+    low = off
+
+    def mode(self, mode=None):
+        if mode is None:
+            return self._mode
+        self._mode = mode
+
+    def pull(self, pull=None):
+        if pull is None:
+            return self._pull
+        self._pull = pull
+
+    def irq(self, handler=None, trigger=None, bouncetime=200, pull=None):
+        world._irqs[self._name] = [(handler, trigger)]
+
+    def close(self):
+        world._irqs.pop(self._name, None)
+
+
+class Ultrasonic():
+
+    def __init__(self, trig, echo, timeout=0.02):
+        self.trig = trig
+        self.echo = echo
+        self.timeout = timeout
+
+    def _read(self):
+        distance = world.distance()
+        if distance * 2 / SOUND_SPEED > self.timeout:
+            world.sleep(self.timeout)
+            return -1
+        world.sleep(distance * 2 / SOUND_SPEED)
+        return round(max(2.0, distance + world.rng.gauss(0, world.ULTRASONIC_NOISE)), 2)
+
+    def read(self, times=10):
+        for _ in range(times):
+            distance = self._read()
+            if distance != -1:
+                return distance
+        return -1
+
+
+class Music():
+    """
+    Silent robot_hat Music, sound files are only checked
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.volume = 100
+
+    def music_set_volume(self, value):
+        self.volume = value
+
+    def sound_length(self, filename):
+        return 0
+
+    def sound_play(self, filename, volume=None):
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(filename)
+
+    def sound_play_threading(self, filename, volume=None):
+        self.sound_play(filename, volume)
+
+    def music_play(self, filename, loops=1, start=0.0, volume=None):
+        self.sound_play(filename, volume)
+
+    def music_stop(self):
+        pass
+
+    def music_pause(self):
+        pass
+
+    def music_resume(self):
+        pass
+
+
+class _Utils():
+    """
+    robot_hat.utils, commands are not run
+    """
+
+    @staticmethod
+    def reset_mcu():
+        world.sleep(0.01)
+
+    @staticmethod
+    def run_command(cmd):
+        return 0, ''
+
+    @staticmethod
+    def get_battery_voltage():
+        world.i2c_transaction(3)
+        return world.battery + world.rng.gauss(0, 0.01)
+
+
+utils = _Utils()
+
+
+# smbus, spidev, gpiozero
+# =================================================================
+class SMBus():
+
+    def __init__(self, bus=1):
+        self.bus = bus
+
+    def _device(self, addr):
+        device = world.i2c_devices.get(addr)
+        if device is None:
+            raise OSError(f'[Errno 121] Remote I/O error, no device at {addr:#x}')
+        return device
+
+    def write_byte_data(self, addr, reg, value):
+        world.i2c_transaction(2)
+        self._device(addr).write(reg, [value])
+
+    def write_i2c_block_data(self, addr, reg, data):
+        world.i2c_transaction(len(data) + 1)
+        self._device(addr).write(reg, list(data))
+
+    def read_byte_data(self, addr, reg):
+        world.i2c_transaction(2)
+        return self._device(addr).read(reg, 1)[0]
+
+    def read_i2c_block_data(self, addr, reg, length):
+        world.i2c_transaction(length + 1)
+        return self._device(addr).read(reg, length)
+
+    def close(self):
+        pass
+
+
+class SpiDev():
+    """
+    The sound direction module on spi 0.0
+    """
+
+    def __init__(self):
+        self.max_speed_hz = 500000
+        self.mode = 0
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+
+    def xfer2(self, data, speed_hz=0, delay_usecs=0):
+        world.sleep(len(data) * 8 / (speed_hz or self.max_speed_hz) + delay_usecs / 1e6)
+        bearing = world.sound_bearing()
+        if bearing is None:
+            return [0] * (len(data) - 2) + [255, 255]
+        # inverse of SoundDirection.read
+        raw = (360 + 160 - bearing) % 360
+        return [0] * (len(data) - 2) + [raw & 0xFF, raw >> 8]
+
+    def close(self):
+        pass
+
+
+class InputDevice():
+
+    def __init__(self, pin, pull_up=False, active_state=None, *args, **kwargs):
+        self.pin = pin
+
+    @property
+    def value(self):
+        return world.gpio(self.pin)
+
+    def close(self):
+        pass
+
+
+class DigitalInputDevice(InputDevice):
+
+    def __init__(self, pin, pull_up=False, active_state=None, bounce_time=None, *args, **kwargs):
+        super().__init__(pin, pull_up, active_state)
+        self.when_activated = None
+        self.when_deactivated = None
+        world._gpio_devices.setdefault(pin, []).append(self)
+
+    def close(self):
+        devices = world._gpio_devices.get(self.pin, [])
+        if self in devices:
+            devices.remove(self)
+
+
+class OutputDevice():
+
+    def __init__(self, pin, active_high=True, initial_value=False, *args, **kwargs):
+        self.pin = pin
+        self.value = 1 if initial_value else 0
+
+    def on(self):
+        self.value = 1
+
+    def off(self):
+        self.value = 0
+
+    def close(self):
+        pass
+
+
+world = SimWorld(time_scale=float(os.environ.get('PIDOG_SIM_TIME_SCALE', 1)))
+if os.environ.get('PIDOG_SIM_MAP'):
+    world.load_map(os.environ['PIDOG_SIM_MAP'])
@@ -29,21 +29,49 @@
 
 '''
 
-import spidev
-from gpiozero import OutputDevice, InputDevice
+import time
+import threading
+from collections import deque
+from .backend import SpiDev, OutputDevice, DigitalInputDevice
+from .console import error
 
 
 class SoundDirection():
+    """
+    Polled with isdetected() and read(), or after watch(), a background
+    thread woken by the busy pin falling edge reads every detection once
+    and queues (timestamp, direction, bearing):
+
+        direction  degrees clockwise from the nose, like read()
+        bearing    map frame, degrees counterclockwise, heading(timestamp) - direction
+
+    ears.watch(heading=lambda t: imu_history.at(t, 'yaw'))
+    timestamp, direction, bearing = ears.get(timeout=5)
+    """
+
     CS_DELAY_US = 500  # Mhz
     CLOCK_SPEED = 10000000  # 10 MHz
+    QUEUE_SIZE = 32  # readings kept until read, the oldest dropped first
+    LEVEL_CHECK = 0.05  # second, busy level also checked this often, for edges missed
 
     def __init__(self, busy_pin=6):
-        self.spi = spidev.SpiDev()
+        self.spi = SpiDev()
         self.spi.open(0, 0)
         #
-        self.busy = InputDevice(busy_pin, pull_up=False)
-
-    def read(self):
+        self.busy = DigitalInputDevice(busy_pin, pull_up=False)
+
+        self.watching = False
+        self.heading = None
+        self.readings = deque(maxlen=self.QUEUE_SIZE)  # (timestamp, direction, bearing)
+        self.latest = None  # newest reading, also once taken from the queue
+        self.dropped = 0
+        self.subscribers = []
+        self._cond = threading.Condition()
+        self._edge = threading.Event()
+        self._edge_time = 0
+        self._thread = None
+
+    def _xfer(self):
         result = self.spi.xfer2([0, 0, 0, 0, 0, 0], self.CLOCK_SPEED,
                                 self.CS_DELAY_US)
 
@@ -57,9 +85,137 @@ class SoundDirection():
             val = (360 + 160 - val) % 360  # Convert zero
             return val
 
+    def read(self):
+        """
+        :return: direction in degrees clockwise from the nose, -1 if none,
+                 after watch(): the oldest queued direction
+        :rtype: int
+        """
+        if self.watching:
+            with self._cond:
+                if len(self.readings) == 0:
+                    return -1
+                return self.readings.popleft()[1]
+        return self._xfer()
+
     def isdetected(self):
+        """
+        :return: a direction is ready to read(), after watch(): one is queued
+        :rtype: bool
+        """
+        if self.watching:
+            return len(self.readings) > 0
         return self.busy.value == 0
 
+    # watcher
+    # =================================================================
+    def watch(self, heading=None):
+        """
+        Read every detection in a background thread
+
+        :param heading: heading(timestamp), the dog's heading in degrees
+                        counterclockwise in the map frame at that time, eg: the
+                        imu yaw; None, or returning None, for no bearing
+        :type heading: callable
+        """
+        self.heading = heading
+        if self.watching:
+            return
+        self.watching = True
+        self.busy.when_deactivated = self._busy_falling
+        self._thread = threading.Thread(name='sound_direction_thread', target=self._watch)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def unwatch(self):
+        self.watching = False
+        self.busy.when_deactivated = None
+        self._edge.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._cond:
+            self._cond.notify_all()
+
+    def _busy_falling(self, *args):
+        self._edge_time = time.time()
+        self._edge.set()
+
+    def _watch(self):
+        while self.watching:
+            if self._edge.wait(self.LEVEL_CHECK):
+                self._edge.clear()
+                timestamp = self._edge_time
+            else:
+                timestamp = time.time()
+            if not self.watching or self.busy.value != 0:
+                continue
+            try:
+                direction = self._xfer()
+            except Exception as e:
+                error(f'sound_direction read error: {e}')
+                continue
+            if direction < 0:
+                continue
+            self._publish(timestamp, direction)
+
+    def _publish(self, timestamp, direction):
+        bearing = None
+        if self.heading is not None:
+            try:
+                heading = self.heading(timestamp)
+            except Exception:
+                heading = None
+            if heading is not None:
+                bearing = (heading - direction + 180) % 360 - 180
+        reading = (timestamp, direction, bearing)
+        with self._cond:
+            if len(self.readings) == self.readings.maxlen:
+                self.dropped += 1
+            self.readings.append(reading)
+            self.latest = reading
+            self._cond.notify_all()
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(*reading)
+            except Exception as e:
+                error(f'sound_direction subscriber error: {e}')
+
+    def get(self, timeout=None):
+        """
+        Wait for the oldest queued reading
+
+        :param timeout: seconds, None waits until one comes or unwatch()
+        :return: (timestamp, direction, bearing), None on timeout
+        :rtype: tuple
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: len(self.readings) > 0 or not self.watching, timeout)
+            if len(self.readings) == 0:
+                return None
+            return self.readings.popleft()
+
+    def clear(self):
+        with self._cond:
+            self.readings.clear()
+
+    def subscribe(self, callback):
+        """
+        Call callback(timestamp, direction, bearing) on every reading, from
+        the watcher thread
+
+        :return: callback, for unsubscribe()
+        """
+        with self._cond:
+            self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
 
 if __name__ == '__main__':
     from time import sleep
@@ -67,4 +223,4 @@ if __name__ == '__main__':
     while True:
         if sd.isdetected():
             print(f"Sound detected at {sd.read()} degrees")
-        sleep(0.2)
\ No newline at end of file
+        sleep(0.2)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+'''
+Run time instrumentation of the Pidog threads and buses.
+
+LoopStats follows one loop: a histogram of its period, the time spent in
+named sections (servo_move, display, mem_read, ...), its cpu time, dropped
+frames, errors and the depth of the queue it serves. Only the loop's own
+thread writes it, so recording takes no lock; readers take snapshot().
+
+BusCounter counts transactions and bytes of one bus (I2C, SPI), fed by
+count_transactions() for python driver objects (robot_hat I2C, PWM,
+Sh3001) or BusProxy for C extension objects (smbus.SMBus, spidev.SpiDev).
+
+    stats = LoopStats('imu', sections=['mem_read'])
+    while True:
+        stats.tick()
+        start = perf_counter()
+        data = imu.mem_read(12, reg)
+        stats.add_time('mem_read', perf_counter() - start)
+'''
+import threading
+from time import perf_counter, thread_time
+from multiprocessing import RawArray
+import numpy as np
+
+# period histogram upper edges, ms, the last bin is everything above
+PERIOD_BINS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+def _len(data):
+    return len(data) if isinstance(data, (list, tuple, bytes, bytearray)) else 1
+
+
+# bytes of one call, method name: (direction, callable(args, result))
+# a register address counts as one written byte
+TRANSACTIONS = {
+    # robot_hat I2C, PWM, Sh3001
+    'write': ('write', lambda args, result: _len(args[0])),
+    'read': ('read', lambda args, result: args[0] if len(args) > 0 else 1),
+    'mem_write': ('write', lambda args, result: _len(args[0]) + 1),
+    'mem_read': ('read', lambda args, result: args[0] + 1),
+    # smbus.SMBus
+    'write_byte': ('write', lambda args, result: 1),
+    'write_byte_data': ('write', lambda args, result: 2),
+    'write_word_data': ('write', lambda args, result: 3),
+    'write_i2c_block_data': ('write', lambda args, result: _len(args[2]) + 1),
+    'read_byte': ('read', lambda args, result: 1),
+    'read_byte_data': ('read', lambda args, result: 2),
+    'read_word_data': ('read', lambda args, result: 3),
+    'read_i2c_block_data': ('read', lambda args, result: args[2] + 1),
+    # spidev.SpiDev, full duplex
+    'xfer': ('both', lambda args, result: _len(args[0])),
+    'xfer2': ('both', lambda args, result: _len(args[0])),
+    'writebytes': ('write', lambda args, result: _len(args[0])),
+    'readbytes': ('read', lambda args, result: args[0]),
+}
+
+
+class LoopStats():
+    """
+    :param name: loop name, eg: 'imu'
+    :type name: str
+    :param sections: names of the timed sections, add_time() ignores others
+    :type sections: list
+    :param shared: keep the counters in shared memory, for a loop running
+                   in a forked process (eg: the ultrasonic thread)
+    :type shared: bool
+    """
+
+    # flat counters layout, histogram and sections follow
+    TICKS, PERIOD_SUM, PERIOD_MAX, CPU, DROPPED, ERRORS, DEPTH, DEPTH_MAX, START, LAST = range(10)
+    FIELDS = 10
+
+    def __init__(self, name, sections=(), shared=False):
+        self.name = name
+        self.sections = list(sections)
+        self._hist = self.FIELDS
+        self._section = self._hist + len(PERIOD_BINS_MS) + 1
+        size = self._section + 3 * len(self.sections)  # calls, sum, max
+        if shared:
+            self._data = np.frombuffer(RawArray('d', size), dtype=np.float64)
+        else:
+            self._data = np.zeros(size)
+        self._edges = [edge / 1000 for edge in PERIOD_BINS_MS]
+        self._index = {section: self._section + 3 * i for i, section in enumerate(self.sections)}
+        self._cpu_start = 0.0
+        self.reset()
+
+    def reset(self):
+        # LAST = 0 makes the next tick() start over, also in a forked loop
+        self._data[:] = 0
+        self._data[self.START] = perf_counter()
+
+    def tick(self):
+        """
+        Start of one loop iteration, records the period since the last one
+        """
+        now = perf_counter()
+        data = self._data
+        if data[self.LAST] == 0:
+            # thread_time() is per thread, take the origin in the loop's own thread
+            self._cpu_start = thread_time()
+        else:
+            period = now - data[self.LAST]
+            data[self.PERIOD_SUM] += period
+            if period > data[self.PERIOD_MAX]:
+                data[self.PERIOD_MAX] = period
+            n = 0
+            for edge in self._edges:
+                if period < edge:
+                    break
+                n += 1
+            data[self._hist + n] += 1
+            data[self.TICKS] += 1
+            data[self.CPU] = thread_time() - self._cpu_start
+        data[self.LAST] = now
+
+    def add_time(self, section, seconds):
+        i = self._index.get(section)
+        if i is None:
+            return
+        data = self._data
+        data[i] += 1
+        data[i + 1] += seconds
+        if seconds > data[i + 2]:
+            data[i + 2] = seconds
+
+    def drop(self, count=1):
+        """
+        Frames or samples lost, eg: a missed tick or a full queue
+        """
+        self._data[self.DROPPED] += count
+
+    def error(self):
+        self._data[self.ERRORS] += 1
+
+    def depth(self, value):
+        """
+        Depth of the queue served by the loop
+        """
+        self._data[self.DEPTH] = value
+        if value > self._data[self.DEPTH_MAX]:
+            self._data[self.DEPTH_MAX] = value
+
+    def snapshot(self):
+        """
+        :return: loops, mean/max period (ms), period histogram, cpu time and
+                 load (fraction of the elapsed time), time per section,
+                 dropped, errors, queue depth
+        :rtype: dict
+        """
+        data = self._data.copy()
+        elapsed = max(1e-9, perf_counter() - data[self.START])
+        ticks = data[self.TICKS]
+        hist = {}
+        for n, edge in enumerate(PERIOD_BINS_MS):
+            hist[f'<{edge}ms'] = int(data[self._hist + n])
+        hist[f'>={PERIOD_BINS_MS[-1]}ms'] = int(data[self._hist + len(PERIOD_BINS_MS)])
+        sections = {}
+        for section, i in self._index.items():
+            calls = data[i]
+            sections[section] = {
+                'calls': int(calls),
+                'total_ms': data[i + 1] * 1000,
+                'mean_ms': data[i + 1] / max(1, calls) * 1000,
+                'max_ms': data[i + 2] * 1000,
+                'load': data[i + 1] / elapsed,
+            }
+        return {
+            'loops': int(ticks),
+            'rate': ticks / elapsed,
+            'period_mean_ms': data[self.PERIOD_SUM] / max(1, ticks) * 1000,
+            'period_max_ms': data[self.PERIOD_MAX] * 1000,
+            'period_hist': hist,
+            'cpu_s': data[self.CPU],
+            'cpu_load': data[self.CPU] / elapsed,
+            'sections': sections,
+            'dropped': int(data[self.DROPPED]),
+            'errors': int(data[self.ERRORS]),
+            'queue_depth': int(data[self.DEPTH]),
+            'queue_depth_max': int(data[self.DEPTH_MAX]),
+        }
+
+
+class BusCounter():
+    """
+    Transactions and bytes of one bus, shared by every device on it
+
+    :param name: bus name, eg: 'i2c'
+    :type name: str
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.start = perf_counter()
+            self.transactions = 0
+            self.bytes_written = 0
+            self.bytes_read = 0
+            self.busy_time = 0.0
+            self.errors = 0
+            self.devices = {}  # device name: transactions
+
+    def add(self, device, direction, nbytes, seconds, ok=True):
+        with self._lock:
+            self.transactions += 1
+            if direction in ('write', 'both'):
+                self.bytes_written += nbytes
+            if direction in ('read', 'both'):
+                self.bytes_read += nbytes
+            self.busy_time += seconds
+            if not ok:
+                self.errors += 1
+            self.devices[device] = self.devices.get(device, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: totals and rates since the last reset(), load is the
+                 fraction of the time the bus was busy
+        :rtype: dict
+        """
+        with self._lock:
+            elapsed = max(1e-9, perf_counter() - self.start)
+            return {
+                'transactions': self.transactions,
+                'transactions_per_s': self.transactions / elapsed,
+                'bytes_written': self.bytes_written,
+                'bytes_read': self.bytes_read,
+                'bytes_per_s': (self.bytes_written + self.bytes_read) / elapsed,
+                'load': self.busy_time / elapsed,
+                'errors': self.errors,
+                'devices': dict(self.devices),
+            }
+
+
+def _counted(method, name, counter, device):
+    direction, size = TRANSACTIONS[name]
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            counter.add(device, direction, 0, perf_counter() - start, ok=False)
+            raise
+        try:
+            nbytes = size(args, result)
+        except Exception:
+            nbytes = 0
+        counter.add(device, direction, nbytes, perf_counter() - start)
+        return result
+    return wrapper
+
+
+def count_transactions(obj, counter, device=None):
+    """
+    Count the bus transactions of a python driver object, by wrapping its
+    transaction methods on the instance
+
+    :param obj: eg: robot_hat I2C, PWM or Servo, Sh3001
+    :param counter: BusCounter
+    :param device: name in the per device counts, class name by default
+    :return: number of methods wrapped
+    :rtype: int
+    """
+    device = device or type(obj).__name__
+    wrapped = 0
+    for name in TRANSACTIONS:
+        method = getattr(obj, name, None)
+        if method is None or not callable(method) or getattr(method, '_counted', False):
+            continue
+        wrapper = _counted(method, name, counter, device)
+        wrapper._counted = True
+        try:
+            setattr(obj, name, wrapper)
+            wrapped += 1
+        except (AttributeError, TypeError):
+            pass
+    return wrapped
+
+
+class BusProxy():
+    """
+    Counting stand-in for a C extension bus object whose methods cannot be
+    replaced, eg: rgb_strip.bus = BusProxy(rgb_strip.bus, counter, 'rgb_strip')
+    """
+
+    def __init__(self, bus, counter, device=None):
+        self._bus = bus
+        self._counter = counter
+        self._device = device or type(bus).__name__
+
+    def __getattr__(self, name):
+        attr = getattr(self._bus, name)
+        if name in TRANSACTIONS and callable(attr):
+            attr = _counted(attr, name, self._counter, self._device)
+            # cache on the proxy, the next lookup does not reach __getattr__
+            self.__dict__[name] = attr
+        return attr
+
+
+def timed(func, stats, section):
+    """
+    Wrap func to add its run time to a section of stats, eg:
+    rgb_strip.display = timed(rgb_strip.display, stats, 'display')
+    """
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.add_time(section, perf_counter() - start)
+    return wrapper
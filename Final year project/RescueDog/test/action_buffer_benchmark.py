@@ -0,0 +1,129 @@
+'''
+Compare the old polling action buffer (list + pop(0) + sleep(0.001))
+with pidog.action_buffer.ActionBuffer (ring buffer + condition variable).
+
+A consumer thread plays FRAMES frames, sleeping FRAME_TIME per frame like
+servo_move does. The main thread waits for the buffer to drain, we report
+its CPU time while waiting and the wake-up latency after the last frame.
+
+Then a push much larger than ActionBuffer.DEFAULT_CAPACITY with no
+consumer, eg: do_action('forward', step_count=500): like the old list,
+it must return at once, the buffer grows.
+'''
+import threading
+from time import sleep, perf_counter, thread_time
+from pidog.action_buffer import ActionBuffer
+
+FRAMES = 100
+FRAME_TIME = 0.01
+ROUNDS = 10
+
+
+class PollingBuffer():
+    # the previous implementation of Pidog's action buffers
+
+    def __init__(self):
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    def push(self, frames):
+        with self.lock:
+            self.buffer += frames
+
+    def consume(self, stamp):
+        while True:
+            try:
+                with self.lock:
+                    frame = self.buffer[0]
+                if frame is None:
+                    break
+                sleep(FRAME_TIME)
+                with self.lock:
+                    if len(self.buffer) == 1:
+                        stamp.append(perf_counter())
+                    self.buffer.pop(0)
+            except IndexError:
+                sleep(0.001)
+        with self.lock:
+            self.buffer.pop(0)
+
+    def wait_done(self):
+        while len(self.buffer) > 0:
+            sleep(0.001)
+
+    def stop(self):
+        self.push([None])
+
+
+class EventBuffer():
+
+    def __init__(self):
+        self.buffer = ActionBuffer()
+
+    def push(self, frames):
+        self.buffer.push(frames)
+
+    def consume(self, stamp):
+        while True:
+            frame = self.buffer.peek()
+            if frame is None:
+                break
+            sleep(FRAME_TIME)
+            if len(self.buffer) == 1:
+                stamp.append(perf_counter())
+            self.buffer.pop()
+        self.buffer.pop()
+
+    def wait_done(self):
+        self.buffer.wait_empty()
+
+    def stop(self):
+        self.buffer.push([None])
+
+
+def run(buffer_class):
+    cpu_list = []
+    latency_list = []
+    for _ in range(ROUNDS):
+        buffer = buffer_class()
+        stamp = []
+        consumer = threading.Thread(target=buffer.consume, args=(stamp,))
+        consumer.start()
+        buffer.push([[0]*8]*FRAMES)
+
+        cpu_start = thread_time()
+        buffer.wait_done()
+        woke_at = perf_counter()
+        cpu_list.append(thread_time() - cpu_start)
+        latency_list.append(woke_at - stamp[-1])
+
+        buffer.stop()
+        consumer.join()
+
+    wall = FRAMES * FRAME_TIME
+    cpu = sum(cpu_list) / ROUNDS
+    latency = sum(latency_list) / ROUNDS
+    return cpu, cpu / wall * 100, latency
+
+
+def large_push(frames):
+    buffer = ActionBuffer()
+    start = perf_counter()
+    pusher = threading.Thread(target=buffer.push, args=([[i] * 8 for i in range(frames)],))
+    pusher.start()
+    pusher.join(timeout=1)
+    assert not pusher.is_alive(), 'push blocked on a full buffer'
+    assert len(buffer) == frames
+    # frames come out in order, across the growth
+    assert [buffer.get()[0] for _ in range(frames)] == list(range(frames))
+    return perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(f"{FRAMES} frames x {FRAME_TIME*1000:.0f} ms, {ROUNDS} rounds")
+    print(f"{'buffer':<10}{'waiter cpu (ms)':>18}{'cpu %':>10}{'wake latency (ms)':>20}")
+    for name, buffer_class in (('polling', PollingBuffer), ('event', EventBuffer)):
+        cpu, percent, latency = run(buffer_class)
+        print(f"{name:<10}{cpu*1000:>18.2f}{percent:>10.2f}{latency*1000:>20.3f}")
+    frames = ActionBuffer.DEFAULT_CAPACITY * 10
+    print(f"push {frames} frames, no consumer: {large_push(frames)*1000:.1f} ms, did not block")
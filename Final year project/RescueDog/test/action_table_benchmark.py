@@ -0,0 +1,35 @@
+'''
+Cold and warm ActionDict lookup times, and the first lookup after loading
+a precompiled .npz actions table.
+'''
+import os
+import tempfile
+from time import perf_counter
+from pidog.actions_dictionary import ActionDict
+
+ACTIONS = ['forward', 'backward', 'turn_left', 'turn_right', 'trot', 'stand', 'doze_off', 'shake_head']
+
+
+def lookup_us(actions_dict, name):
+    start = perf_counter()
+    actions_dict[name]
+    return (perf_counter() - start) * 1e6
+
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), 'actions_table.npz')
+    ActionDict().save(path)
+
+    start = perf_counter()
+    loaded = ActionDict()
+    loaded.load(path)
+    load_time = (perf_counter() - start) * 1e3
+    print(f"table load: {load_time:.2f} ms ({os.path.getsize(path)/1024:.1f} KB)")
+
+    print(f"{'action':<12}{'cold (us)':>12}{'warm (us)':>12}{'from table (us)':>18}")
+    for name in ACTIONS:
+        actions_dict = ActionDict()
+        cold = lookup_us(actions_dict, name)
+        warm = lookup_us(actions_dict, name)
+        table = lookup_us(loaded, name)
+        print(f"{name:<12}{cold:>12.1f}{warm:>12.1f}{table:>18.1f}")
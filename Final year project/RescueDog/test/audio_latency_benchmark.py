@@ -0,0 +1,94 @@
+'''
+Call-to-sound latency of Pidog.speak, before and after the audio engine.
+
+legacy: what speak() did on every call, `sudo killall pulseaudio` in a
+shell, probe the .mp3/.wav files, then robot_hat Music decoding the file
+in a new thread (pygame mixer at its default 512 frames buffer).
+engine: pidog.audio_engine.AudioEngine, sounds decoded at start, one
+open stream with a 256 frames buffer.
+
+Measured: call until the mixer is playing the sound. The output buffer
+(buffer / frequency) comes on top, it is printed as configured, not
+measured, and so is the driver / DAC latency behind it: the call to
+sound latency needs a microphone loopback on the dog. Under
+SDL_AUDIODRIVER=dummy (no sound card) the mixer runs without a device,
+only the first column means anything there.
+'''
+import os
+import sys
+import subprocess
+import threading
+from time import perf_counter, sleep
+from pidog.audio_engine import AudioEngine
+
+SOUND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sounds') + '/'
+SOUNDS = ['single_bark_1', 'angry', 'pant', 'woohoo']
+ROUNDS = 10
+LEGACY_BUFFER = 512  # pygame default
+
+
+def wait_playing(pygame, start, timeout=2.0):
+    while not pygame.mixer.get_busy():
+        if perf_counter() - start > timeout:
+            return None
+        sleep(0.0001)
+    return perf_counter() - start
+
+
+def legacy_speak(pygame, name, volume=100):
+    subprocess.Popen('sudo killall pulseaudio', shell=True,
+                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT).communicate()
+    for path in [name, SOUND_DIR + name + '.mp3', SOUND_DIR + name + '.wav']:
+        if os.path.isfile(path):
+            break
+
+    def sound_play():
+        sound = pygame.mixer.Sound(path)
+        sound.set_volume(volume / 100)
+        sound.play()
+    threading.Thread(target=sound_play).start()
+
+
+def measure(pygame, play):
+    # call until the mixer plays, median and max
+    results = []
+    for _ in range(ROUNDS):
+        for name in SOUNDS:
+            pygame.mixer.stop()
+            start = perf_counter()
+            play(name)
+            latency = wait_playing(pygame, start)
+            if latency is not None:
+                results.append(latency)
+    results.sort()
+    return results[len(results) // 2], results[-1]
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+
+    try:
+        pygame.mixer.pre_init(frequency=AudioEngine.FREQUENCY, buffer=LEGACY_BUFFER)
+        pygame.mixer.init()
+    except pygame.error as e:
+        print(f"no audio output ({e}), run with SDL_AUDIODRIVER=dummy")
+        sys.exit(1)
+    dummy = os.environ.get('SDL_AUDIODRIVER') == 'dummy'
+    legacy = measure(pygame, lambda name: legacy_speak(pygame, name))
+    pygame.mixer.quit()
+
+    start = perf_counter()
+    engine = AudioEngine(SOUND_DIR)
+    engine.wait_loaded()
+    load_time = perf_counter() - start
+    after = measure(pygame, lambda name: engine.play(name))
+    engine.close()
+
+    print(f"engine start + decode {len(engine.sounds)} sounds: {load_time * 1000:.0f} ms")
+    print(f"{'speak':<10}{'to mixer median (ms)':>22}{'max (ms)':>10}{'+ output buffer (ms)':>22}")
+    for name, (median, worst), buffer in [('legacy', legacy, LEGACY_BUFFER), ('engine', after, engine.buffer)]:
+        print(f"{name:<10}{median * 1000:>22.1f}{worst * 1000:>10.1f}"
+              f"{buffer / AudioEngine.FREQUENCY * 1000:>22.1f}")
+    print("output buffer configured, not measured; driver and DAC latency not included"
+          + (", dummy driver: no device" if dummy else ""))
@@ -0,0 +1,109 @@
+'''
+Step response of the body balance, on a simulated IMU.
+
+The plant: the measured tilt is the ground slope plus the body rpy
+command, which the servos follow with a first order lag after one servo
+frame of delay; the IMU adds noise. At t = 0.5 s the ground tilts by
+STEP degrees (roll and pitch).
+
+legacy: Pidog.set_rpy(pid=True) once per gait frame (servo_move at
+speed 98, about 30 ms), rpy += KP * error.
+balance: pidog.balance.BalanceController at 200 Hz.
+'''
+import random
+from pidog.balance import BalanceController
+
+SIM_RATE = 1000  # Hz
+DURATION = 4.0  # second
+STEP_TIME = 0.5
+STEP = 10  # degrees
+SERVO_TAU = 0.08  # second
+SERVO_DELAY = 0.02  # second
+IMU_NOISE = 0.3  # degrees
+LEGACY_KP = 0.033
+LEGACY_PERIOD = 0.0298  # servo_move time at speed 98
+
+
+class SimulatedBody():
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.t = 0.0
+        self.slope = 0.0
+        self.body = 0.0  # tilt produced by the legs
+        self.commands = []  # (time, command) waiting for the servo delay
+        self.command = 0.0
+
+    def imu(self):
+        return self.slope + self.body + self.rng.gauss(0, IMU_NOISE)
+
+    def set_command(self, value):
+        self.commands.append((self.t + SERVO_DELAY, value))
+
+    def advance(self, dt):
+        self.t += dt
+        self.slope = -STEP if self.t >= STEP_TIME else 0.0
+        while self.commands and self.commands[0][0] <= self.t:
+            self.command = self.commands.pop(0)[1]
+        self.body += (self.command - self.body) * dt / (SERVO_TAU + dt)
+
+
+def simulate(controller_rate, update):
+    body = SimulatedBody()
+    dt = 1.0 / SIM_RATE
+    ticks = int(round(SIM_RATE / controller_rate))
+    trace = []
+    for i in range(int(DURATION * SIM_RATE)):
+        if i % ticks == 0:
+            body.set_command(update(body.imu(), ticks * dt))
+        body.advance(dt)
+        trace.append((body.t, body.slope + body.body))
+    return trace
+
+
+def legacy():
+    state = {'rpy': 0.0}
+
+    def update(measured, dt):
+        state['rpy'] += LEGACY_KP * (0 - measured)
+        return state['rpy']
+    return simulate(1 / LEGACY_PERIOD, update)
+
+
+def balance():
+    measured = {'value': 0.0}
+    controller = BalanceController(lambda: (measured['value'], measured['value']))
+
+    def update(value, dt):
+        measured['value'] = value
+        return controller.step(dt)[0]
+    return simulate(controller.rate, update)
+
+
+def metrics(trace):
+    after = [(t - STEP_TIME, tilt) for t, tilt in trace if t >= STEP_TIME]
+    peak = max(abs(tilt) for _, tilt in after)
+    # the ground step is negative, overshoot is the positive side
+    overshoot = max(0.0, max(tilt for _, tilt in after))
+    # settled: stays within 1 degree
+    settle = None
+    for t, tilt in reversed(after):
+        if abs(tilt) > 1.0:
+            settle = t
+            break
+    tail = [abs(tilt) for t, tilt in after if t > DURATION - STEP_TIME - 0.5]
+    # error back under half the step
+    recover = next((t for t, tilt in after if t > 0.05 and abs(tilt) < STEP / 2), None)
+    return peak, overshoot, recover, settle, sum(tail) / len(tail)
+
+
+if __name__ == '__main__':
+    print(f"ground step {STEP} deg at {STEP_TIME} s, servo lag {SERVO_TAU*1000:.0f} ms"
+          f" + {SERVO_DELAY*1000:.0f} ms, imu noise {IMU_NOISE} deg")
+    print(f"{'controller':<12}{'peak (deg)':>12}{'overshoot':>11}{'50% (s)':>10}"
+          f"{'settle 1deg (s)':>17}{'final err (deg)':>17}")
+    for name, trace in [('legacy', legacy()), ('balance', balance())]:
+        peak, overshoot, recover, settle, final = metrics(trace)
+        recover = f"{recover:.2f}" if recover is not None else '-'
+        settle = f"{settle:.2f}" if settle is not None else '-'
+        print(f"{name:<12}{peak:>12.2f}{overshoot:>11.2f}{recover:>10}{settle:>17}{final:>17.2f}")
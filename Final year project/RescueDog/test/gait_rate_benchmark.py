@@ -0,0 +1,59 @@
+'''
+Streaming gait on the servo scheduler at several servo rates: the
+distance the simulated dog covers at a set velocity must not depend on
+the rate, overruns included.
+
+    python3 test/gait_rate_benchmark.py
+
+Every rate runs in its own process (Pidog.close() exits). Distances in
+cm, from the simulated world.
+Run with SDL_AUDIODRIVER=dummy where there is no sound card.
+'''
+import os
+import sys
+import subprocess
+from math import hypot
+from time import sleep
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+
+RATES = [100, 150, 200]  # Hz
+VELOCITY = 40  # mm/s
+SECONDS = 6
+TOLERANCE = 0.15  # largest relative spread of the distances
+
+
+def run(rate):
+    from pidog import Pidog, sim
+    sim.world.set_room(1000, 1000)
+    dog = Pidog(imu_calibration=None, servo_scheduler=True, servo_rate=rate)
+    sleep(3)  # imu calibration, keep still
+    x0, y0 = sim.world.pose()[:2]
+    dog.reset_stats()
+    dog.set_velocity(VELOCITY)
+    sleep(SECONDS)
+    dog.gait_stop()
+    while dog.gait_streaming:
+        sleep(0.05)
+    x, y = sim.world.pose()[:2]
+    stats = dog.servo_loop_stats()
+    print(f"RESULT {rate} {hypot(x - x0, y - y0):.2f} {stats['ticks']} {stats['overruns']}", flush=True)
+    dog.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+        sys.exit(0)
+
+    print(f"{'rate (Hz)':<10}{'distance':>10}{'ticks':>8}{'overruns':>10}")
+    distances = []
+    for rate in RATES:
+        output = subprocess.run([sys.executable, __file__, str(rate)], capture_output=True, text=True).stdout
+        line = [l for l in output.splitlines() if l.startswith('RESULT')][0]
+        _, _, distance, ticks, overruns = line.split()
+        distances.append(float(distance))
+        print(f"{rate:<10}{float(distance):>10.1f}{ticks:>8}{overruns:>10}")
+    print(f"commanded: {VELOCITY * SECONDS / 10:.1f} cm in {SECONDS} s")
+    spread = (max(distances) - min(distances)) / max(distances)
+    assert spread < TOLERANCE, f"distance depends on the servo rate, spread {spread:.0%}"
@@ -0,0 +1,113 @@
+'''
+Ultrasonic scans, the previous stepped scan of Modules/navgation.py
+(13 head stops 15 degrees apart, 0.2 s each, then read_distance()) vs
+Pidog.head_sweep() (the head turns without stopping, every raw reading
+at the head yaw interpolated at its timestamp).
+
+Per scan: readings, seconds, the largest gap between bearings, the
+bearing error against the simulated head servo, and the range error
+against the simulated room at the reported bearing. The stepped scan
+reads the median filtered distance, partly taken at the previous stops,
+and a 15 degrees head frame at speed 50 lasts 0.5 s, not 0.2 s.
+Run with SDL_AUDIODRIVER=dummy where there is no sound card.
+'''
+import os
+import threading
+import numpy as np
+from math import sin, cos, radians
+from time import sleep, time, perf_counter
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+
+from pidog import Pidog, sim
+
+SCANS = 4  # per method
+BOXES = [(70, -50, 30, 30), (30, 60, 40, 20)]  # sim.world.add_box arguments
+
+
+def stepped_scan(dog):
+    # the previous scan_with_ultrasonic
+    angles = list(range(-90, 91, 15))
+    distances = []
+    times = []
+    for angle in angles:
+        dog.head_move([[angle, 0, 0]], immediately=True, speed=50)
+        sleep(0.2)
+        times.append(time())
+        distances.append(round(dog.read_distance(), 2))
+    return angles, distances, times
+
+
+def sweep_scan(dog):
+    angles, distances = dog.head_sweep()
+    return angles, distances, None
+
+
+def expected_range(bearing):
+    # same beam as SimWorld.distance, at the reported bearing
+    world = sim.world
+    x, y, heading = world.pose()[:3]
+    bearing += heading
+    sx = x + world.ULTRASONIC_OFFSET * cos(radians(bearing))
+    sy = y + world.ULTRASONIC_OFFSET * sin(radians(bearing))
+    half = world.ULTRASONIC_BEAM / 2
+    return min(world.ray(sx, sy, bearing + offset) for offset in np.linspace(-half, half, 5))
+
+
+class HeadProbe():
+    # true head yaw of the simulated servo, timestamped like the readings
+
+    def __init__(self):
+        channel = sim.world.channels['head'][0]
+        self.samples = []
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(channel,))
+        self.thread.start()
+
+    def _run(self, channel):
+        while self.running:
+            self.samples.append((time(), sim.world.servo_angle(channel)))
+            sleep(0.005)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return np.array(self.samples)
+
+
+def run(dog, scan):
+    results = []
+    for _ in range(SCANS):
+        dog.head_move([[0, 0, 0]], immediately=True, speed=100)
+        sleep(0.5)
+        probe = HeadProbe()
+        start = perf_counter()
+        angles, distances, times = scan(dog)
+        elapsed = perf_counter() - start
+        truth = probe.stop()
+        if times is None:
+            # sweep bearings come from the trajectory, compare it over the whole scan
+            bearing_error = np.abs(dog.head_yaw_at(truth[:, 0]) - truth[:, 1]).mean()
+        else:
+            bearing_error = np.abs(np.interp(times, truth[:, 0], truth[:, 1]) - angles).mean()
+        valid = [(a, d) for a, d in zip(angles, distances) if d > 0]
+        range_error = np.median([abs(d - expected_range(a)) for a, d in valid])
+        gap = np.diff(np.unique(np.clip(angles + [-90, 90], -90, 90))).max()
+        results.append((len(angles), elapsed, gap, bearing_error, range_error))
+    return np.mean(results, axis=0)
+
+
+if __name__ == '__main__':
+    for box in BOXES:
+        sim.world.add_box(*box)
+    dog = Pidog(imu_calibration=None)
+    sleep(3)  # imu calibration, keep still
+    dog.do_action('stand', speed=98)
+    dog.wait_all_done()
+
+    print(f"{'scan':<10}{'readings':>10}{'seconds':>9}{'max gap':>9}{'bearing err':>13}{'range err':>11}")
+    for name, scan in [('stepped', stepped_scan), ('sweep', sweep_scan)]:
+        count, elapsed, gap, bearing_error, range_error = run(dog, scan)
+        print(f"{name:<10}{count:>10.1f}{elapsed:>9.2f}{gap:>9.1f}{bearing_error:>13.2f}{range_error:>11.1f}")
+    print("degrees and cm, averages of", SCANS, "scans")
+    dog.close()
@@ -0,0 +1,37 @@
+'''
+Compare the per-frame legs_angle_calculation loop used by ActionDict
+with the vectorized Pidog.legs_angle_calculation_batch, on every gait.
+'''
+from timeit import timeit
+import numpy as np
+from pidog import Pidog
+from pidog.walk import Walk
+from pidog.trot import Trot
+
+ROUNDS = 200
+
+gaits = {
+    'forward': Walk(fb=Walk.FORWARD, lr=Walk.STRAIGHT),
+    'backward': Walk(fb=Walk.BACKWARD, lr=Walk.STRAIGHT),
+    'turn_left': Walk(fb=Walk.FORWARD, lr=Walk.LEFT),
+    'turn_right': Walk(fb=Walk.FORWARD, lr=Walk.RIGHT),
+    'trot': Trot(Trot.FORWARD, Trot.STRAIGHT),
+}
+
+
+def loop_ik(coords):
+    return [Pidog.legs_angle_calculation(coord) for coord in coords]
+
+
+def batch_ik(coords):
+    return Pidog.legs_angle_calculation_batch(coords)
+
+
+if __name__ == '__main__':
+    print(f"{'gait':<12}{'frames':>8}{'loop (us)':>12}{'batch (us)':>12}{'speedup':>10}{'max diff':>12}")
+    for name, gait in gaits.items():
+        coords = gait.get_coords()
+        diff = np.max(np.abs(np.array(loop_ik(coords)) - batch_ik(coords)))
+        t_loop = timeit(lambda: loop_ik(coords), number=ROUNDS) / ROUNDS * 1e6
+        t_batch = timeit(lambda: batch_ik(coords), number=ROUNDS) / ROUNDS * 1e6
+        print(f"{name:<12}{len(coords):>8}{t_loop:>12.1f}{t_batch:>12.1f}{t_loop/t_batch:>9.1f}x{diff:>12.2e}")
@@ -0,0 +1,78 @@
+'''
+Head sweep mapping cost, the legacy string map (one '#' per reading, free
+space never cleared) vs OccupancyGrid (log-odds, every beam ray cast),
+one reading at a time and a whole sweep in one batch, float32 and int8.
+
+A sweep is Modules/navgation.py's: 13 readings, -90 to 90 degrees, from
+the grid centre, on a 41 cell map (8 m) and a 401 cell map (80 m) with
+readings up to 40 m. Checks that the occupied cells of one sweep are
+the legacy '#' cells.
+'''
+import math
+import os
+import random
+from time import perf_counter
+
+import numpy as np
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+
+from pidog.occupancy_grid import OccupancyGrid
+
+ANGLES = list(range(-90, 91, 15))
+ROUNDS = 200
+
+
+def legacy_update(grid_map, robot_pos, angle_deg, distance_cm):
+    # Modules/slam.py update_obstacle
+    angle_rad = math.radians(angle_deg)
+    distance_m = distance_cm / 100.0
+    gx = int(robot_pos[0] + distance_m * math.cos(angle_rad) * 5)
+    gy = int(robot_pos[1] - distance_m * math.sin(angle_rad) * 5)
+    if 0 <= gx < len(grid_map) and 0 <= gy < len(grid_map):
+        grid_map[gy][gx] = '#'
+
+
+def sweeps(max_cm):
+    random.seed(1)
+    return [[random.uniform(10, max_cm) for _ in ANGLES] for _ in range(ROUNDS)]
+
+
+def timed(func, data):
+    start = perf_counter()
+    for distances in data:
+        func(distances)
+    return (perf_counter() - start) / len(data) * 1e6
+
+
+def run(size, max_cm):
+    centre = [size // 2, size // 2]
+    data = sweeps(max_cm)
+    grid_map = [['.'] * size for _ in range(size)]
+    results = [('legacy', timed(lambda d: [legacy_update(grid_map, centre, a, x) for a, x in zip(ANGLES, d)], data))]
+    for dtype in (np.float32, np.int8):
+        grid = OccupancyGrid(size, resolution=5, dtype=dtype)
+        name = np.dtype(dtype).name
+        results.append((f'{name} per beam', timed(
+            lambda d: [grid.update(centre, [a], [x], max_range=max_cm + 1) for a, x in zip(ANGLES, d)], data)))
+        grid.clear()
+        results.append((f'{name} batch', timed(
+            lambda d: grid.update(centre, ANGLES, d, max_range=max_cm + 1), data)))
+
+    # one sweep, same occupied cells
+    grid = OccupancyGrid(size, resolution=5)
+    grid_map = [['.'] * size for _ in range(size)]
+    for angle, distance in zip(ANGLES, data[0]):
+        legacy_update(grid_map, centre, angle, distance)
+    grid.update(centre, ANGLES, data[0], max_range=max_cm + 1)
+    same = [''.join(row) for row in grid_map] == grid.render()
+    return results, same, int((grid.log_odds < 0).sum())
+
+
+if __name__ == '__main__':
+    print(f"{'map':<10}{'update':<20}{'us/sweep':>10}")
+    for size, max_cm in [(41, 250), (401, 4000)]:
+        results, same, free = run(size, max_cm)
+        for name, us in results:
+            print(f"{size:<10}{name:<20}{us:>10.1f}")
+        print(f"{size:<10}{'same hits: ' + str(same) + ', free cells: ' + str(free):<30}")
@@ -0,0 +1,114 @@
+'''
+Odometry against the simulated dog's true pose: after every move, where
+the simulated world put the dog, where Pidog.odometry thinks it is (with
+its 1 sigma), and where Modules/navgation.py's dead reckoning put it
+(one 20 cm cell per forward / backward step, turns never counted).
+
+    python3 test/odometry_benchmark.py [time_scale]
+
+Poses in cm and degrees, x forward of the start pose, y to the left.
+'move error' is the error of each move alone, its displacement seen from
+where each estimate thought the move started, so that a gait is not
+judged on the error carried over from the previous moves.
+
+This is a consistency check of the plumbing (every executed frame
+reaches the odometry, imu yaw and drift, covariance), not an accuracy
+figure: the simulated world moves its body with the same no-slip model
+of the feet on the ground that the odometry inverts. The moves on three
+or four feet may not do worse than the legacy dead reckoning. On two
+feet (trot, fast streaming gait) the simulated body also rests on a
+swing foot and covers a part of the commanded stride, which depends on
+the sim as much as a real floor does; those moves run at the default
+two_feet_stride (1.0, uncalibrated), their error and the part of the
+stride the sim covered are reported, not asserted.
+Run with SDL_AUDIODRIVER=dummy where there is no sound card.
+'''
+import os
+import sys
+from math import sqrt, hypot, sin, cos, radians
+from time import sleep
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+if len(sys.argv) > 1:
+    os.environ['PIDOG_SIM_TIME_SCALE'] = sys.argv[1]
+
+from pidog import Pidog, sim
+
+CELL = 20  # cm, one navgation.py cell
+MOVES = [('forward', 4), ('turn_left', 4), ('forward', 3), ('turn_right', 2),
+         ('backward', 2), ('trot', 6), ('velocity', 3)]
+VELOCITY = (60, 15)  # mm/s, deg/s, streaming gait for 'velocity', seconds as count
+TWO_FEET = ['trot', 'velocity']  # moves on a diagonal pair of feet
+
+
+def legacy(pose, action, count):
+    # navgation.py move_to: a forward / backward call is one cell along x, turns are lost
+    x, y, theta = pose
+    if action == 'forward':
+        x += CELL * count
+    elif action == 'backward':
+        x -= CELL * count
+    return x, y, theta
+
+
+def displacement(start, end):
+    # end seen from start, forward and left of its heading
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    c, s = cos(radians(start[2])), sin(radians(start[2]))
+    return dx * c + dy * s, dy * c - dx * s
+
+
+def move_error(start, end, true_start, true_end):
+    forward, left = displacement(start, end)
+    true_forward, true_left = displacement(true_start, true_end)
+    return hypot(forward - true_forward, left - true_left)
+
+
+if __name__ == '__main__':
+    sim.world.set_room(1000, 1000)
+    dog = Pidog(imu_calibration=None)
+    sleep(3)  # imu calibration, keep still, a gyro bias becomes a heading drift
+    dog.do_action('stand', speed=98)
+    dog.wait_all_done()
+    dog.odometry.reset()
+    x0, y0, heading0 = sim.world.pose()[:3]
+    reckoned = (0, 0, 0)
+    truth = (0, 0, 0)
+    worse = []
+    covered = []
+
+    print(f"{'move':<14}{'true x, y, th':>22}{'odometry x, y, th':>22}{'1 sigma':>18}"
+          f"{'error cm':>10}{'legacy error':>14}{'move error':>12}{'legacy move':>13}")
+    for action, count in MOVES:
+        start, legacy_start, true_start = dog.odometry.pose(), reckoned, truth
+        if action == 'velocity':
+            dog.set_velocity(*VELOCITY)
+            sleep(count)
+            dog.gait_stop()
+            while dog.gait_streaming:
+                sleep(0.05)
+        else:
+            dog.do_action(action, step_count=count, speed=98)
+            dog.wait_all_done()
+        reckoned = legacy(reckoned, action, count)
+        x, y, heading = sim.world.pose()[:3]
+        truth = x, y, heading = x - x0, y - y0, heading - heading0
+        ox, oy, otheta = dog.odometry.pose()
+        P = dog.odometry.covariance()
+        sigma = f"{sqrt(P[0, 0]):.1f}, {sqrt(P[1, 1]):.1f}, {sqrt(P[2, 2]):.1f}"
+        error = move_error(start, (ox, oy, otheta), true_start, truth)
+        legacy_error = move_error(legacy_start, reckoned, true_start, truth)
+        if action in TWO_FEET:
+            moved = hypot(*displacement(start, (ox, oy, otheta)))
+            covered.append((action, hypot(*displacement(true_start, truth)) / max(moved, 1e-6)))
+        elif error > legacy_error:
+            worse.append(action)
+        label = f"{action} x{count}"
+        print(f"{label:<14}{f'{x:.1f}, {y:.1f}, {heading:.1f}':>22}{f'{ox:.1f}, {oy:.1f}, {otheta:.1f}':>22}"
+              f"{sigma:>18}{hypot(ox - x, oy - y):>10.1f}{hypot(reckoned[0] - x, reckoned[1] - y):>14.1f}"
+              f"{error:>12.1f}{legacy_error:>13.1f}")
+    for action, ratio in covered:
+        print(f"{action}: the sim covered {ratio:.2f} of the odometry distance at two_feet_stride "
+              f"{dog.odometry.two_feet_stride}, a sim value, not a hardware calibration")
+    dog.close()
+    assert not worse, f"odometry worse than legacy on {worse}"
@@ -0,0 +1,116 @@
+'''
+Check pidog.kinematics.PoseEngine against the previous np.matrix
+implementation of set_legs + pose2legs_angle: the exact=True engine, the
+one Pidog runs, bit-for-bit, the default NumPy engine within TOLERANCE.
+Then compare single frame and 49 frames batch timings.
+'''
+from timeit import timeit
+from math import pi, sin, cos, sqrt, acos, atan2
+import numpy as np
+from pidog import Pidog
+from pidog.walk import Walk
+from pidog.kinematics import PoseEngine
+
+FRAMES = 1000
+ROUNDS = 500
+TOLERANCE = 1e-9  # degrees, NumPy ufuncs vs libm
+
+
+class LegacyPose():
+    # the previous np.matrix implementation from Pidog
+
+    def __init__(self):
+        self.BODY_STRUCT = np.asmatrix(Pidog.BODY_STRUCT)
+        self.body_height = 80
+        self.rpy = np.zeros(3)
+        self.pose = np.asmatrix([0.0, 0.0, 80.0]).T
+
+    def set_legs(self, legs_list):
+        w = Pidog.BODY_WIDTH
+        l = Pidog.BODY_LENGTH
+        self.legpoint_struc = np.asmatrix([
+            [-w / 2, -l / 2 + legs_list[0][0], self.body_height - legs_list[0][1]],
+            [w / 2, -l / 2 + legs_list[1][0], self.body_height - legs_list[1][1]],
+            [-w / 2,  l / 2 + legs_list[2][0], self.body_height - legs_list[2][1]],
+            [w / 2,  l / 2 + legs_list[3][0], self.body_height - legs_list[3][1]]]).T
+
+    def pose2legs_angle(self):
+        roll, pitch, yaw = self.rpy
+        rotx = np.asmatrix([[cos(roll), 0, -sin(roll)], [0, 1, 0], [sin(roll), 0, cos(roll)]])
+        roty = np.asmatrix([[1, 0, 0], [0, cos(-pitch), -sin(-pitch)], [0, sin(-pitch), cos(-pitch)]])
+        rotz = np.asmatrix([[cos(yaw), -sin(yaw), 0], [sin(yaw), cos(yaw), 0], [0, 0, 1]])
+        rot_mat = rotx * roty * rotz
+        AB = np.asmatrix(np.zeros((3, 4)))
+        for i in range(4):
+            AB[:, i] = - self.pose - rot_mat * self.BODY_STRUCT[:, i] + self.legpoint_struc[:, i]
+        body = [[(self.legpoint_struc - AB).T[i, j] for j in range(3)] for i in range(4)]
+        leg = [[self.legpoint_struc.T[i, j] for j in range(3)] for i in range(4)]
+
+        angles = []
+        for i in range(4):
+            y = leg[i][1] - body[i][1]
+            z = body[i][2] - leg[i][2]
+            u = sqrt(pow(y, 2) + pow(z, 2))
+            cos_angle1 = min(max((Pidog.FOOT**2 + Pidog.LEG**2 - u**2) / (2 * Pidog.FOOT * Pidog.LEG), -1), 1)
+            beta = acos(cos_angle1)
+            cos_angle2 = min(max((Pidog.LEG**2 + u**2 - Pidog.FOOT**2) / (2 * Pidog.LEG * u), -1), 1)
+            alpha = acos(cos_angle2) + atan2(y, z) + self.rpy[1]
+            leg_angle = alpha / pi * 180
+            foot_angle = beta / pi * 180 - 90
+            if i % 2 != 0:
+                leg_angle = -leg_angle
+                foot_angle = -foot_angle
+            angles += [leg_angle, foot_angle]
+        return angles
+
+
+def random_inputs(rng, n):
+    rpys = rng.uniform(-0.4, 0.4, (n, 3))
+    poses = np.column_stack([rng.uniform(-20, 20, (n, 2)), rng.uniform(30, 95, n)])
+    legs = np.stack([rng.uniform(-40, 40, (n, 4)), rng.uniform(50, 100, (n, 4))], axis=-1)
+    return rpys, poses, legs
+
+
+if __name__ == '__main__':
+    legacy = LegacyPose()
+    engine = PoseEngine(Pidog.LEG, Pidog.FOOT, Pidog.BODY_WIDTH, Pidog.BODY_LENGTH, 80)
+    exact_engine = PoseEngine(Pidog.LEG, Pidog.FOOT, Pidog.BODY_WIDTH, Pidog.BODY_LENGTH, 80, exact=True)
+
+    # bit-for-bit check
+    rpys, poses, legs = random_inputs(np.random.default_rng(0), FRAMES)
+    expected = []
+    for rpy, pose, leg in zip(rpys, poses, legs):
+        legacy.rpy = rpy
+        legacy.pose = np.asmatrix(pose).T
+        legacy.set_legs(leg.tolist())
+        expected.append(legacy.pose2legs_angle())
+    expected = np.array(expected)
+    diff = np.abs(engine.pose2legs_angle(rpys, poses, legs) - expected).max()
+    equal = np.mean(exact_engine.pose2legs_angle(rpys, poses, legs) == expected) * 100
+    print(f"{FRAMES} random poses, max difference: {diff:.1e} degrees, exact mode bit-for-bit equal: {equal:.2f} %")
+    assert diff < TOLERANCE
+    assert equal == 100
+    assert Pidog.POSE_ENGINE_EXACT, "Pidog's pose engine must be bit-for-bit compatible"
+
+    # timings
+    coords = np.array(Walk(fb=Walk.FORWARD, lr=Walk.STRAIGHT).get_coords())
+    rpy = np.array([0.05, -0.03, 0.0])
+    pose = [0.0, 0.0, 80.0]
+    legacy.rpy = rpy
+    legacy.pose = np.asmatrix(pose).T
+
+    def legacy_frames():
+        for coord in coords:
+            legacy.set_legs(coord)
+            legacy.pose2legs_angle()
+
+    def engine_frames(engine):
+        for coord in coords:
+            engine.pose2legs_angle(rpy, pose, coord)
+
+    t_legacy = timeit(legacy_frames, number=ROUNDS // 10) / (ROUNDS // 10) * 1e6
+    print(f"{len(coords)} walk frames, legacy loop: {t_legacy:.0f} us")
+    for name, e in [('engine', engine), ('exact engine', exact_engine)]:
+        t_single = timeit(lambda: engine_frames(e), number=ROUNDS // 10) / (ROUNDS // 10) * 1e6
+        t_batch = timeit(lambda: e.pose2legs_angle(rpy, pose, coords), number=ROUNDS) / ROUNDS * 1e6
+        print(f"{name:<14}loop: {t_single:.0f} us, batch: {t_batch:.0f} us")
@@ -0,0 +1,57 @@
+'''
+Frame computation time of an RGBStrip mode change, per pixel style calls
+(what show() did before) vs RGBStrip.synthesize, vectorized and cached.
+Checks that both give the same frames. Runs on the simulated backend.
+'''
+import os
+from time import perf_counter
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+os.environ.setdefault('PIDOG_SIM_TIME_SCALE', '1000')
+
+from pidog.rgb_strip import RGBStrip
+
+# the modes of gpt_dog.py and Pidog
+MODES = [('monochromatic', 'white', 1), ('breath', 'pink', 1), ('boom', 'yellow', 2.5),
+         ('bark', 'red', 2.5), ('speak', 'cyan', 1), ('listen', 'cyan', 0.5),
+         ('breath', 'black', 1)]
+ROUNDS = 20
+
+
+def legacy_frames(strip):
+    # the previous show() frame loop
+    frames = []
+    strip.max_frames = int(1/strip.bps/strip.MIN_DELAY)
+    for frame_index in range(strip.max_frames):
+        frame = []
+        for light_index in range(strip.light_num):
+            frame.append(strip.calulate_data(frame_index, light_index))
+        frames.append(frame)
+    return frames
+
+
+def best(func):
+    times = []
+    for _ in range(ROUNDS):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    strip = RGBStrip(0X74, 11)
+    print(f"{'mode':<22}{'frames':>7}{'per pixel (ms)':>16}{'numpy (ms)':>12}{'cached (ms)':>13}{'same':>6}")
+    for style, color, bps in MODES:
+        strip.set_mode(style, color, bps)
+        legacy = best(lambda: legacy_frames(strip))
+        frames = legacy_frames(strip)
+
+        def cold():
+            strip.cache.clear()
+            return strip.synthesize(strip.style, strip.color, strip.bps, strip.brightness)
+        numpy_time = best(cold)
+        cached = best(lambda: strip.synthesize(strip.style, strip.color, strip.bps, strip.brightness))
+        same = strip.synthesize(strip.style, strip.color, strip.bps, strip.brightness)[1] == frames
+        label = f"{style} {color}"
+        print(f"{label:<22}{len(frames):>7}{legacy * 1000:>16.3f}{numpy_time * 1000:>12.3f}{cached * 1000:>13.4f}{str(same):>6}")
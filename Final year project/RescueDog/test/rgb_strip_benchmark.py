@@ -0,0 +1,90 @@
+'''
+I2C traffic of RGBStrip.display, legacy vs diff-based burst writes, on
+the simulated backend.
+
+legacy: what display() did on every frame, a page select then one block
+write per colour row, identical frames included.
+diff: display() with the registers packed once per frame, only the
+changed register ranges written, nothing for an identical frame.
+
+Both are checked to leave the same registers on the chip after every
+frame. Bytes/s are at the strip's frame rate (1 / MIN_DELAY), address
+bytes excluded, a register address counts as one byte.
+'''
+import os
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+os.environ.setdefault('PIDOG_SIM_TIME_SCALE', '1000')
+
+from pidog import sim
+from pidog.rgb_strip import RGBStrip
+from pidog.telemetry import BusCounter, BusProxy
+
+MODES = [('monochromatic', 'white', 1), ('breath', 'pink', 1.5), ('boom', 'yellow', 2.5),
+         ('bark', 'red', 2.5), ('speak', 'magenta', 1), ('listen', 'cyan', 0.5),
+         ('breath', 'black', 1)]  # Pidog's idle mode
+CYCLES = 4  # style periods per mode
+
+
+def legacy_display(strip, image):
+    # the previous RGBStrip.display
+    reds = list(map(lambda x: x[0], image))
+    greens = list(map(lambda x: x[1], image))
+    blues = list(map(lambda x: x[2], image))
+    revert_image = [reds, greens, blues]
+    reg = 0x20
+    empty = 0
+    pos = 0
+    for i in range(3):
+        if i == 0:
+            strip.write_cmd(strip.CONFIGURE_CMD_PAGE, strip.FRAME1_PAGE)
+        elif reg == 0x20:
+            strip.write_cmd(strip.CONFIGURE_CMD_PAGE, strip.FRAME2_PAGE)
+        color = i % 3
+        data = revert_image[color][pos*14:(pos+1)*14]
+        data.insert(empty, 0)
+        data.insert(empty + 1, 0)
+        strip.bus.write_i2c_block_data(strip.addr, reg, data)
+        if color == 2:
+            empty += 3
+            pos += 1
+        reg += 0x10
+        if reg == 0xA0:
+            reg = 0x20
+
+
+def chip_frame(strip):
+    page = sim.world.i2c_devices[strip.addr].pages[strip.FRAME1_PAGE]
+    return bytes(page[strip.FRAME_REG:strip.FRAME_REG + strip.REGISTERS])
+
+
+def run(style, color, bps, legacy):
+    strip = RGBStrip(0X74, 11)
+    strip.set_mode(style, color, bps)
+    strip.show()
+    counter = BusCounter('i2c')
+    strip.bus = BusProxy(strip.bus, counter, 'rgb_strip')
+    chip = []
+    frames = strip.max_frames * CYCLES
+    for n in range(frames):
+        i = n % strip.max_frames
+        if legacy:
+            legacy_display(strip, strip.frames[i])
+        else:
+            strip.display(strip.payloads[i])
+        chip.append(chip_frame(strip))
+    snapshot = counter.snapshot()
+    fps = 1 / RGBStrip.MIN_DELAY
+    nbytes = snapshot['bytes_written'] / frames * fps
+    transactions = snapshot['transactions'] / frames * fps
+    return nbytes, transactions, chip
+
+
+if __name__ == '__main__':
+    print(f"{'mode':<22}{'legacy B/s':>12}{'diff B/s':>10}{'legacy tx/s':>13}{'diff tx/s':>11}{'same':>6}")
+    for style, color, bps in MODES:
+        before = run(style, color, bps, legacy=True)
+        after = run(style, color, bps, legacy=False)
+        same = before[2] == after[2]
+        label = f"{style} {color}"
+        print(f"{label:<22}{before[0]:>12.0f}{after[0]:>10.0f}{before[1]:>13.0f}{after[1]:>11.0f}{str(same):>6}")
@@ -0,0 +1,75 @@
+'''
+RGB thread cost, the previous show() loop (display the next frame, then
+sleep MIN_DELAY, also on static content) vs the event driven show()
+(absolute schedule, blocks on static content until set_mode()).
+
+Per mode: the thread's cpu time and loops per second, i2c bytes per
+second, and frames per second against the 20 fps target. Runs on the
+simulated backend with real time i2c timings.
+'''
+import os
+import threading
+from time import sleep, thread_time, perf_counter
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+
+from pidog.rgb_strip import RGBStrip
+from pidog.telemetry import BusCounter, BusProxy
+
+MODES = [('breath', 'black', 1), ('monochromatic', 'white', 1), ('breath', 'pink', 1.5)]
+DURATION = 5  # seconds per mode
+
+
+def legacy_show(strip):
+    # the previous show(), display then sleep, whatever the content
+    if strip.is_changed:
+        strip.is_changed = False
+        strip.max_frames, strip.frames, strip.payloads = strip.synthesize(
+            strip.style, strip.color, strip.bps, strip.brightness)
+    if strip.current_frame >= strip.max_frames:
+        strip.current_frame = 0
+    strip.display(strip.payloads[strip.current_frame])
+    strip.current_frame += 1
+    strip.frames_shown += 1
+    sleep(strip.MIN_DELAY)
+
+
+def run(mode, show):
+    strip = RGBStrip(0X74, 11)
+    counter = BusCounter('i2c')
+    strip.bus = BusProxy(strip.bus, counter, 'rgb_strip')
+    strip.set_mode(*mode)
+    result = {}
+    running = [True]
+
+    def loop():
+        start = thread_time()
+        loops = 0
+        while running[0]:
+            show(strip)
+            loops += 1
+        result['cpu'] = thread_time() - start
+        result['loops'] = loops
+
+    thread = threading.Thread(target=loop)
+    counter.reset()
+    strip.reset_frame_stats()
+    start = perf_counter()
+    thread.start()
+    sleep(DURATION)
+    running[0] = False
+    strip.wake()
+    thread.join()
+    elapsed = perf_counter() - start
+    bus = counter.snapshot()
+    return (result['cpu'] / elapsed * 100, result['loops'] / elapsed,
+            bus['bytes_written'] / elapsed, strip.frames_shown / elapsed)
+
+
+if __name__ == '__main__':
+    print(f"{'mode':<22}{'show':<8}{'cpu %':>7}{'loops/s':>9}{'i2c B/s':>9}{'fps':>7}")
+    for mode in MODES:
+        for name, show in [('legacy', legacy_show), ('event', RGBStrip.show)]:
+            cpu, loops, nbytes, fps = run(mode, show)
+            label = f"{mode[0]} {mode[1]}"
+            print(f"{label:<22}{name:<8}{cpu:>7.2f}{loops:>9.1f}{nbytes:>9.0f}{fps:>7.2f}")
@@ -0,0 +1,49 @@
+'''
+Pidog on the simulated backend, no HAT needed: start up, stand, walk
+forward, turn left, read the ultrasonic in a 4 m x 3 m room, then print
+where the simulated dog went and the loop / bus stats of every thread.
+
+    python3 test/sim_benchmark.py [time_scale]
+
+time_scale > 1 runs the hardware timings (servo slew, I2C, ultrasonic
+echo) faster than real time. Run with SDL_AUDIODRIVER=dummy where there
+is no sound card.
+'''
+import os
+import sys
+from time import perf_counter
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+if len(sys.argv) > 1:
+    os.environ['PIDOG_SIM_TIME_SCALE'] = sys.argv[1]
+
+from pidog import Pidog, sim
+
+STEPS = 4
+
+
+def pose_line(label, seconds):
+    x, y, heading, roll, pitch, height = sim.world.pose()
+    print(f"{label:<12}{seconds:>8.2f}{x:>9.1f}{y:>9.1f}{heading:>10.1f}{roll:>8.1f}{pitch:>8.1f}{height:>9.1f}")
+
+
+if __name__ == '__main__':
+    sim.world.set_room(400, 300)  # centered on the dog, facing +x
+
+    start = perf_counter()
+    dog = Pidog(imu_calibration=None)
+    startup = perf_counter() - start
+    print(f"{'':<12}{'time (s)':>8}{'x (cm)':>9}{'y (cm)':>9}{'heading':>10}{'roll':>8}{'pitch':>8}{'height':>9}")
+    pose_line('startup', startup)
+
+    dog.reset_stats()
+    for action, kwargs in [('stand', {}), ('forward', {'step_count': STEPS}),
+                           ('turn_left', {'step_count': STEPS})]:
+        start = perf_counter()
+        dog.do_action(action, speed=98, **kwargs)
+        dog.wait_all_done()
+        pose_line(action, perf_counter() - start)
+
+    print(f"distance: {dog.read_distance()} cm, yaw (imu): {dog.yaw:.1f}")
+    print(dog.stats_report())
+    dog.close()
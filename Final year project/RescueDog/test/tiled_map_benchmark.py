@@ -0,0 +1,102 @@
+'''
+Map store of a 200 m x 200 m mission at 5 cells per metre (1000 x 1000
+cells): the legacy list of lists of characters and a dense OccupancyGrid
+sized for the whole area up front, vs TiledOccupancyGrid, growing from
+nothing, with at most MAX_TILES (256) or 64 tiles in memory and the far
+tiles compressed to disk, or all in memory.
+
+The mission is a lawnmower path over the area, lines 5 m apart, a
+13 beam head sweep every metre. Printed: sweep update time, memory
+(bytes in memory, and on disk for the tiles), and single cell lookups,
+near the robot and anywhere in the area (reading spilled tiles back).
+'''
+import os
+import random
+import sys
+from time import perf_counter
+
+import numpy as np
+
+os.environ['PIDOG_BACKEND'] = 'sim'
+
+from pidog.occupancy_grid import OccupancyGrid, TiledOccupancyGrid
+
+SIDE = 1000  # cells, 200 m
+LINE_SPACING = 25  # cells, 5 m
+SWEEP_SPACING = 5  # cells, 1 m
+ANGLES = list(range(-90, 91, 15))
+LOOKUPS = 100000
+
+
+def mission():
+    # (gx, gy, heading) of every sweep, heading along +x or -x
+    random.seed(1)
+    for i, gy in enumerate(range(LINE_SPACING // 2, SIDE, LINE_SPACING)):
+        xs = range(SWEEP_SPACING, SIDE, SWEEP_SPACING)
+        heading = 0
+        if i % 2:
+            xs = reversed(xs)
+            heading = 180
+        for gx in xs:
+            yield gx, gy, heading
+
+
+def readings():
+    # 1 in 4 beams without echo
+    return [random.uniform(10, 300) if random.random() > 0.25 else -1 for _ in ANGLES]
+
+
+def run(grid):
+    start = perf_counter()
+    sweeps = 0
+    for gx, gy, heading in mission():
+        grid.update((gx, gy), [a + heading for a in ANGLES], readings())
+        sweeps += 1
+    return (perf_counter() - start) / sweeps * 1e6, sweeps
+
+
+def legacy_bytes(grid_map):
+    # the row lists and their references, the one character strings are shared
+    return sys.getsizeof(grid_map) + sum(sys.getsizeof(row) for row in grid_map)
+
+
+def lookup_time(func, cells):
+    start = perf_counter()
+    for gx, gy in cells:
+        func(gx, gy)
+    return (perf_counter() - start) / len(cells) * 1e9
+
+
+if __name__ == '__main__':
+    random.seed(2)
+    anywhere = [(random.randrange(SIDE), random.randrange(SIDE)) for _ in range(LOOKUPS)]
+    near = [(random.randrange(SIDE - 64, SIDE), random.randrange(SIDE - 64, SIDE)) for _ in range(LOOKUPS)]
+
+    legacy = [['.'] * SIDE for _ in range(SIDE)]
+    dense = OccupancyGrid(SIDE, dtype=np.float32)
+    dense_int8 = OccupancyGrid(SIDE, dtype=np.int8)
+    tiled = TiledOccupancyGrid()
+    tiled_64 = TiledOccupancyGrid(max_tiles=64)
+    tiled_all = TiledOccupancyGrid(max_tiles=None)
+
+    print(f"{'store':<24}{'us/sweep':>10}{'memory kB':>11}{'disk kB':>9}{'near ns':>9}{'anywhere ns':>13}")
+    legacy_lookup = lambda gx, gy: legacy[gy][gx] == '#'
+    print(f"{'legacy list of lists':<24}{'':>10}{legacy_bytes(legacy) / 1024:>11.0f}{0:>9}"
+          f"{lookup_time(legacy_lookup, near):>9.0f}{lookup_time(legacy_lookup, anywhere):>13.0f}")
+    for name, grid in [('dense float32', dense), ('dense int8', dense_int8)]:
+        us, sweeps = run(grid)
+        print(f"{name:<24}{us:>10.1f}{grid.log_odds.nbytes / 1024:>11.0f}{0:>9}"
+              f"{lookup_time(grid.is_occupied, near):>9.0f}{lookup_time(grid.is_occupied, anywhere):>13.0f}")
+    for name, grid in [(f'tiled int8, {TiledOccupancyGrid.MAX_TILES} tiles', tiled),
+                       ('tiled int8, 64 tiles', tiled_64), ('tiled int8, all tiles', tiled_all)]:
+        us, sweeps = run(grid)
+        memory = grid.memory()
+        near_ns = lookup_time(grid.is_occupied, near)
+        anywhere_ns = lookup_time(grid.is_occupied, anywhere)
+        print(f"{name:<24}{us:>10.1f}{memory['bytes'] / 1024:>11.0f}{memory['spilled_bytes'] / 1024:>9.0f}"
+              f"{near_ns:>9.0f}{anywhere_ns:>13.0f}")
+        print(f"{'':<24}{grid.evictions} tiles spilled, {grid.loads} read back")
+    same = (tiled_64.window(0, 0, SIDE, SIDE) == tiled_all.window(0, 0, SIDE, SIDE)).all()
+    print(f"{sweeps} sweeps, tiled maps the same with and without spilling: {same}")
+    tiled.clear()
+    tiled_64.clear()